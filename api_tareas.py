@@ -0,0 +1,681 @@
+import csv
+import io
+import json
+import os
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+from functools import wraps
+from flask import Blueprint, Response, make_response, request, jsonify, session
+from werkzeug.http import http_date, parse_date, parse_etags
+from base_datos import conexion, transaccion, nuevos_ids
+from busqueda import buscar as buscar_tareas
+from resumen import leer_resumen, leer_version
+from cola_escritura import escribir
+from eventos import (avisar, guardar as guardar_evento, sentencia_evento, sentencia_evento_tarea, suscribir,
+                     desuscribir, formatear, ultimo_id_cliente, DemasiadosSuscriptores,
+                     EVENTOS_LATIDO, INICIO, LATIDO, REINICIAR)
+
+api_tareas = Blueprint('api_tareas', __name__, url_prefix='/api/tareas')
+
+# Columnas que se pueden pedir con ?fields=
+CAMPOS = ('id', 'titulo', 'descripcion', 'completada', 'fecha_creacion')
+LIMITE_DEFECTO = 50
+LIMITE_MAX = 500
+LIMITE_BUSQUEDA = 20
+# Filas por consulta al exportar: cada trozo toma y devuelve su propia conexión del pool
+EXPORTAR_TROZO = int(os.environ.get('EXPORTAR_TROZO', '1000'))
+# Filas por transacción al importar: el lock de escritura se suelta entre lote y lote
+IMPORTAR_LOTE = int(os.environ.get('IMPORTAR_LOTE', '1000'))
+RECHAZOS_MAX = 1000  # rechazos detallados en la respuesta de una importación
+# Filas por transacción en las operaciones por lote: el lock de escritura se suelta entre trozo y trozo
+LOTE_TROZO = int(os.environ.get('LOTE_TROZO', '1000'))
+LOTE_IDS_MAX = 10000  # ids por petición en las operaciones por lote
+
+
+def login_requerido(vista):
+    """Responde 401 si no hay un usuario en la sesión"""
+    @wraps(vista)
+    def envoltura(*args, **kwargs):
+        if 'usuario_id' not in session:
+            return jsonify({'error': 'Debe iniciar sesión para acceder a las tareas'}), 401
+        return vista(*args, **kwargs)
+    return envoltura
+
+
+class _Condicionales:
+    """Cuántas lecturas con If-None-Match / If-Modified-Since se respondieron con 304"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.peticiones = 0
+        self.aciertos = 0
+
+    def anotar(self, acierto):
+        with self._lock:
+            self.peticiones += 1
+            self.aciertos += acierto
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                'peticiones': self.peticiones,
+                'aciertos': self.aciertos,
+                'ratio_aciertos': round(self.aciertos / self.peticiones, 4) if self.peticiones else 0.0,
+            }
+
+
+condicionales = _Condicionales()
+
+
+def _no_modificado(valor, modificado):
+    """True si el cliente ya tiene esta versión (If-None-Match tiene prioridad sobre If-Modified-Since)
+
+    `valor` es el ETag sin comillas ni W/: If-None-Match usa la comparación débil, así que
+    "1-42" y W/"1-42" coinciden, pero W/"1-4" no coincide con W/"1-42".
+    """
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match:
+        return parse_etags(if_none_match).contains_weak(valor)
+    desde = parse_date(request.headers.get('If-Modified-Since'))
+    return bool(desde and modificado and modificado <= desde.timestamp())
+
+
+def _versiones_aceptadas(usuario_id):
+    """Versiones que admite el If-Match de la petición; None si no hay condición
+
+    Los ETag son débiles (W/"<usuario>-<versión>"), así que se comparan sin el prefijo W/.
+    """
+    if_match = request.headers.get('If-Match')
+    if if_match is None:
+        return None
+    etags = parse_etags(if_match)
+    if etags.star_tag:
+        return None
+    versiones = []
+    for valor in etags.as_set(include_weak=True):
+        usuario, _, version = valor.partition('-')
+        if usuario == str(usuario_id) and version.isdigit():
+            versiones.append(int(version))
+    return versiones
+
+
+def _precondicion_fallida(usuario_id, version=None):
+    """412 con el ETag vigente para que el cliente relea antes de reintentar"""
+    if version is None:
+        with conexion(usuario_id) as conn:
+            version, _ = leer_version(conn, usuario_id)
+    respuesta = jsonify({'error': 'Las tareas cambiaron desde la versión indicada en If-Match'})
+    respuesta.status_code = 412
+    respuesta.headers['ETag'] = f'W/"{usuario_id}-{version}"'
+    return respuesta
+
+
+def _escribir_tarea(sql, parametros, usuario_id, tarea_id, evento):
+    """escribir() respetando If-Match: la versión se compara en la misma sentencia, sin carrera
+
+    El evento (sql, parámetros) se confirma en la misma transacción si la tarea cambió.
+    Devuelve la respuesta de error o None: 412 si la tarea existe pero la versión ya no
+    es la indicada, 404 si no existe.
+    """
+    versiones = _versiones_aceptadas(usuario_id)
+    if versiones is not None:
+        marcas = ', '.join('?' * len(versiones)) or 'NULL'
+        sql += (' AND (SELECT coalesce(max(version), 0) FROM resumen_tareas WHERE usuario_id = ?)'
+                f' IN ({marcas})')
+        parametros = (*parametros, usuario_id, *versiones)
+    _, filas = escribir(sql, parametros, usuario_id, si_cambia=evento)
+    if filas:
+        avisar(usuario_id)
+        return None
+    if versiones is not None:
+        with conexion(usuario_id) as conn:
+            if _obtener_tarea(conn, tarea_id, ('id',)) is not None:
+                return _precondicion_fallida(usuario_id)
+    return jsonify({'error': 'Tarea no encontrada'}), 404
+
+
+def version_condicional(vista):
+    """GET condicional con la versión de las tareas del usuario (resumen_tareas.version)
+
+    If-None-Match / If-Modified-Since responden 304; un If-Match que no coincide, 412.
+
+    Cualquier alta, cambio o baja de una tarea sube la versión (triggers), así que
+    responder 304 solo requiere leer esa fila, sin tocar `tareas`.
+    """
+    @wraps(vista)
+    def envoltura(*args, **kwargs):
+        usuario_id = session['usuario_id']
+        with conexion(usuario_id) as conn:
+            version, modificado = leer_version(conn, usuario_id)
+        valor = f'{usuario_id}-{version}'
+        cabeceras = {'ETag': f'W/"{valor}"', 'Cache-Control': 'private, no-cache'}
+        # Last-Modified tiene resolución de segundos: si el cambio es de este mismo segundo
+        # podría llegar otro sin cambiar la fecha, así que solo se envía el ETag
+        if modificado and modificado < int(time.time()):
+            cabeceras['Last-Modified'] = http_date(modificado)
+
+        versiones = _versiones_aceptadas(usuario_id)
+        if versiones is not None and version not in versiones:
+            return _precondicion_fallida(usuario_id, version)
+
+        condicional = 'If-None-Match' in request.headers or 'If-Modified-Since' in request.headers
+        if condicional and _no_modificado(valor, modificado):
+            condicionales.anotar(True)
+            return Response(status=304, headers=cabeceras)
+        if condicional:
+            condicionales.anotar(False)
+
+        respuesta = make_response(vista(*args, **kwargs))
+        if respuesta.status_code == 200:
+            respuesta.headers.update(cabeceras)
+        return respuesta
+    return envoltura
+
+
+def _a_dict(fila):
+    tarea = dict(fila)
+    if 'completada' in tarea:
+        tarea['completada'] = bool(tarea['completada'])
+    return tarea
+
+
+def _campos_pedidos():
+    """Columnas a devolver según ?fields=titulo,completada (el id siempre se incluye)"""
+    fields = request.args.get('fields')
+    if not fields:
+        return CAMPOS
+    pedidos = [c.strip() for c in fields.split(',') if c.strip()]
+    invalidos = [c for c in pedidos if c not in CAMPOS]
+    if invalidos:
+        raise ValueError(f'Campos desconocidos: {", ".join(invalidos)}')
+    return ('id',) + tuple(c for c in CAMPOS if c in pedidos and c != 'id')
+
+
+def _obtener_tarea(conn, tarea_id, columnas=CAMPOS):
+    return conn.execute(f'SELECT {", ".join(columnas)} FROM tareas WHERE id = ? AND usuario_id = ?',
+                        (tarea_id, session['usuario_id'])).fetchone()
+
+
+def _validar(data, parcial=False):
+    """Devuelve las columnas a guardar o lanza ValueError con el mensaje para el cliente"""
+    if not isinstance(data, dict):
+        raise ValueError('Se esperaba un objeto JSON')
+    valores = {}
+    if 'titulo' in data or not parcial:
+        titulo = data.get('titulo')
+        if not isinstance(titulo, str) or not titulo.strip():
+            raise ValueError('El título es obligatorio')
+        valores['titulo'] = titulo.strip()
+    if 'descripcion' in data:
+        descripcion = data['descripcion']
+        if descripcion is not None and not isinstance(descripcion, str):
+            raise ValueError('La descripción debe ser texto')
+        valores['descripcion'] = descripcion
+    if 'completada' in data:
+        if not isinstance(data['completada'], bool):
+            raise ValueError('completada debe ser true o false')
+        valores['completada'] = int(data['completada'])
+    return valores
+
+
+@api_tareas.route('', methods=['GET'])
+@login_requerido
+@version_condicional
+def listar():
+    try:
+        columnas = _campos_pedidos()
+        limite = min(max(request.args.get('limite', LIMITE_DEFECTO, type=int), 1), LIMITE_MAX)
+        cursor = request.args.get('cursor')
+        completada = request.args.get('completada')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # Paginación por cursor (keyset): "id < cursor" usa el índice, sin OFFSET
+    condiciones = ['usuario_id = ?']
+    parametros = [session['usuario_id']]
+    if completada is not None:
+        condiciones.append('completada = ?')
+        parametros.append(1 if completada.lower() in ('1', 'true', 'si', 'sí') else 0)
+    if cursor:
+        if not cursor.isdigit():
+            return jsonify({'error': 'Cursor inválido'}), 400
+        condiciones.append('id < ?')
+        parametros.append(int(cursor))
+    parametros.append(limite + 1)
+
+    with conexion(session['usuario_id']) as conn:
+        filas = conn.execute(
+            f'SELECT {", ".join(columnas)} FROM tareas WHERE {" AND ".join(condiciones)} '
+            'ORDER BY id DESC LIMIT ?', parametros).fetchall()
+
+    hay_mas = len(filas) > limite
+    tareas = [_a_dict(f) for f in filas[:limite]]
+    return jsonify({
+        'tareas': tareas,
+        'siguiente_cursor': str(tareas[-1]['id']) if hay_mas else None
+    }), 200
+
+
+@api_tareas.route('/resumen', methods=['GET'])
+@login_requerido
+@version_condicional
+def resumen():
+    """Totales del usuario (mantenidos por triggers, sin recorrer las tareas)"""
+    with conexion(session['usuario_id']) as conn:
+        return jsonify(leer_resumen(conn, session['usuario_id'])), 200
+
+
+@api_tareas.route('/buscar', methods=['GET'])
+@login_requerido
+@version_condicional
+def buscar():
+    """Búsqueda de texto completo: ?q=palabra prefijo* "frase exacta" (&orden=relevancia|reciente)"""
+    limite = min(max(request.args.get('limite', LIMITE_BUSQUEDA, type=int), 1), LIMITE_MAX)
+    try:
+        with conexion(session['usuario_id']) as conn:
+            tareas = buscar_tareas(conn, session['usuario_id'], request.args.get('q', ''), limite,
+                                   request.args.get('orden', 'relevancia'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'tareas': tareas}), 200
+
+
+def _filas_exportacion(usuario_id, columnas):
+    """Recorre todas las tareas del usuario por id (keyset) sin cargarlas en memoria"""
+    ultimo = 0
+    while True:
+        with conexion(usuario_id) as conn:
+            cursor = conn.execute(
+                f'SELECT {", ".join(columnas)} FROM tareas WHERE usuario_id = ? AND id > ? ORDER BY id LIMIT ?',
+                (usuario_id, ultimo, EXPORTAR_TROZO))
+            filas = cursor.fetchall()
+        if not filas:
+            return
+        yield filas
+        ultimo = filas[-1]['id']
+
+
+def _serializar(trozos, formato, columnas):
+    buffer = io.StringIO()
+    if formato == 'csv':
+        escritor = csv.writer(buffer)
+        escritor.writerow(columnas)
+        # La cabecera sale de inmediato, antes de la primera consulta
+        yield buffer.getvalue()
+        for filas in trozos:
+            buffer.seek(0)
+            buffer.truncate()
+            for fila in filas:
+                escritor.writerow(_a_dict(fila).values())
+            yield buffer.getvalue()
+    else:
+        for filas in trozos:
+            yield ''.join(json.dumps(_a_dict(fila), ensure_ascii=False) + '\n' for fila in filas)
+
+
+def _comprimir(partes):
+    compresor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31: formato gzip
+    for parte in partes:
+        # Z_SYNC_FLUSH: cada trozo se envía comprimido sin esperar al final
+        yield compresor.compress(parte.encode('utf-8')) + compresor.flush(zlib.Z_SYNC_FLUSH)
+    yield compresor.flush()
+
+
+@api_tareas.route('/exportar', methods=['GET'])
+@login_requerido
+def exportar():
+    """Descarga todas las tareas del usuario en NDJSON (por defecto) o CSV, en streaming"""
+    formato = request.args.get('formato', 'ndjson')
+    if formato not in ('ndjson', 'csv'):
+        return jsonify({'error': 'Formato desconocido (usar ndjson o csv)'}), 400
+    try:
+        columnas = _campos_pedidos()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # El generador corre después de que termina la vista: el usuario se lee ahora
+    partes = _serializar(_filas_exportacion(session['usuario_id'], columnas), formato, columnas)
+    cabeceras = {
+        'Content-Disposition': f'attachment; filename="tareas.{formato}"',
+        'Cache-Control': 'no-store',
+        'Vary': 'Accept-Encoding',
+    }
+    if request.accept_encodings['gzip'] > 0:
+        cabeceras['Content-Encoding'] = 'gzip'
+        cuerpo = _comprimir(partes)
+    else:
+        cuerpo = (parte.encode('utf-8') for parte in partes)
+    tipo = 'text/csv; charset=utf-8' if formato == 'csv' else 'application/x-ndjson'
+    return Response(cuerpo, headers=cabeceras, content_type=tipo)
+
+
+def _filas_ndjson(stream):
+    """(número de línea, objeto o None si no es JSON válido), leyendo el cuerpo de a una línea"""
+    for numero, linea in enumerate(stream, 1):
+        linea = linea.strip()
+        if not linea:
+            continue
+        try:
+            yield numero, json.loads(linea)
+        except ValueError:
+            yield numero, None
+
+
+def _filas_csv(stream):
+    """(número de línea, dict) de un CSV con cabecera; completada acepta true/false/1/0"""
+    lector = csv.DictReader(linea.decode('utf-8', 'replace') for linea in stream)
+    for fila in lector:
+        completada = (fila.get('completada') or '').strip().lower()
+        if completada in ('1', 'true', 'si', 'sí'):
+            fila['completada'] = True
+        elif completada in ('', '0', 'false', 'no'):
+            fila['completada'] = False
+        if not fila.get('descripcion'):
+            fila['descripcion'] = None
+        yield lector.line_num, {k: v for k, v in fila.items() if k in ('titulo', 'descripcion', 'completada')}
+
+
+@api_tareas.route('/importar', methods=['POST'])
+@login_requerido
+def importar():
+    """Carga tareas desde un cuerpo NDJSON o CSV, procesado a medida que llega"""
+    # El stream de WSGI lee de a un byte al buscar fin de línea: se lee en bloques de 64 KiB
+    cuerpo = io.BufferedReader(request.stream, 64 * 1024)
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        filas = _filas_ndjson(cuerpo)
+    elif request.mimetype == 'text/csv':
+        filas = _filas_csv(cuerpo)
+    else:
+        return jsonify({'error': 'Se esperaba un cuerpo application/x-ndjson o text/csv'}), 415
+
+    inicio = time.perf_counter()
+    usuario_id = session['usuario_id']
+    aceptadas = 0
+    rechazos = []
+    rechazadas = 0
+    lote = []
+
+    def guardar(lote):
+        # Con fragmentos los ids se reservan en el directorio, antes de tomar el lock del fragmento
+        filas = [(tarea_id, *fila) for tarea_id, fila in zip(nuevos_ids(len(lote)), lote)]
+        # Transacción corta por lote: los logins y demás escrituras esperan como mucho un lote.
+        # Un evento por lote, en la misma transacción: los clientes vuelven a pedir la lista
+        with transaccion(usuario_id) as conn:
+            conn.executemany(
+                'INSERT INTO tareas (id, usuario_id, titulo, descripcion, completada) VALUES (?, ?, ?, ?, ?)', filas)
+            guardar_evento(conn, usuario_id, 'importadas', {'cantidad': len(filas)})
+        avisar(usuario_id)
+
+    for numero, data in filas:
+        try:
+            if data is None:
+                raise ValueError('JSON inválido')
+            valores = _validar(data)
+        except ValueError as e:
+            rechazadas += 1
+            if len(rechazos) < RECHAZOS_MAX:
+                rechazos.append({'linea': numero, 'error': str(e)})
+            continue
+        lote.append((usuario_id, valores['titulo'], valores.get('descripcion'), valores.get('completada', 0)))
+        if len(lote) >= IMPORTAR_LOTE:
+            guardar(lote)
+            aceptadas += len(lote)
+            lote = []
+    if lote:
+        guardar(lote)
+        aceptadas += len(lote)
+
+    return jsonify({
+        'aceptadas': aceptadas,
+        'rechazadas': rechazadas,
+        'rechazos': rechazos,
+        'rechazos_truncados': rechazadas > len(rechazos),
+        'segundos': round(time.perf_counter() - inicio, 3),
+    }), 200
+
+
+def _fecha_filtro(valor, nombre):
+    """Fecha ISO del filtro en el formato de fecha_creacion (UTC, como CURRENT_TIMESTAMP)"""
+    try:
+        fecha = datetime.fromisoformat(valor) if isinstance(valor, str) else None
+    except ValueError:
+        fecha = None
+    if fecha is None:
+        raise ValueError(f'{nombre} debe ser una fecha ISO (AAAA-MM-DD o AAAA-MM-DDTHH:MM:SS)')
+    if fecha.tzinfo:
+        fecha = fecha.astimezone(timezone.utc).replace(tzinfo=None)
+    return fecha.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _seleccion(data):
+    """Condiciones y parámetros de las tareas elegidas por `ids` o por `filtro`; lanza ValueError"""
+    if not isinstance(data, dict):
+        raise ValueError('Se esperaba un objeto JSON')
+    ids, filtro = data.get('ids'), data.get('filtro')
+    if (ids is None) == (filtro is None):
+        raise ValueError('Indicar ids o filtro (uno de los dos)')
+    if ids is not None:
+        if not isinstance(ids, list) or not ids \
+                or not all(isinstance(i, int) and not isinstance(i, bool) for i in ids):
+            raise ValueError('ids debe ser una lista de enteros')
+        if len(ids) > LOTE_IDS_MAX:
+            raise ValueError(f'Se aceptan hasta {LOTE_IDS_MAX} ids por petición')
+        # Un solo parámetro para toda la lista, sin importar cuántos ids trae
+        return ['id IN (SELECT value FROM json_each(?))'], [json.dumps(ids)]
+
+    if not isinstance(filtro, dict):
+        raise ValueError('filtro debe ser un objeto')
+    desconocidos = sorted(set(filtro) - {'completada', 'desde', 'hasta'})
+    if desconocidos:
+        raise ValueError(f'Filtros desconocidos: {", ".join(desconocidos)}')
+    condiciones, parametros = [], []
+    if 'completada' in filtro:
+        if not isinstance(filtro['completada'], bool):
+            raise ValueError('completada debe ser true o false')
+        condiciones.append('completada = ?')
+        parametros.append(int(filtro['completada']))
+    if 'desde' in filtro:
+        condiciones.append('fecha_creacion >= ?')
+        parametros.append(_fecha_filtro(filtro['desde'], 'desde'))
+    if 'hasta' in filtro:
+        condiciones.append('fecha_creacion < ?')
+        parametros.append(_fecha_filtro(filtro['hasta'], 'hasta'))
+    return condiciones, parametros
+
+
+def _por_trozos(usuario_id, sentencia, valores, condiciones, parametros, tipo_evento):
+    """Ejecuta `sentencia` (... WHERE id IN ({seleccion}) RETURNING id) de a LOTE_TROZO tareas
+
+    Cada trozo es una sola sentencia en su propia transacción y avanza por id (keyset), así
+    un rango grande no retiene el lock de escritura. Cada trozo que cambia tareas guarda
+    su evento ({"cantidad": ...}) en esa misma transacción. Devuelve (filas afectadas, trozos).
+    """
+    seleccion = (f'SELECT id FROM tareas WHERE {" AND ".join(["usuario_id = ?", "id > ?", *condiciones])} '
+                 'ORDER BY id LIMIT ?')
+    sql = sentencia.format(seleccion=seleccion)
+    afectadas = trozos = ultimo = 0
+    while True:
+        with transaccion(usuario_id) as conn:
+            ids = [fila[0] for fila in conn.execute(
+                sql, (*valores, usuario_id, ultimo, *parametros, LOTE_TROZO)).fetchall()]
+            if ids:
+                guardar_evento(conn, usuario_id, tipo_evento, {'cantidad': len(ids)})
+        if not ids:
+            break
+        avisar(usuario_id)
+        afectadas += len(ids)
+        trozos += 1
+        ultimo = max(ids)
+        if len(ids) < LOTE_TROZO:
+            break
+    return afectadas, trozos
+
+
+@api_tareas.route('/lote/actualizar', methods=['POST'])
+@login_requerido
+def actualizar_lote():
+    """Aplica los mismos cambios (p. ej. completada) a las tareas elegidas por ids o por filtro"""
+    data = request.get_json(silent=True)
+    try:
+        condiciones, parametros = _seleccion(data)
+        if not isinstance(data.get('valores'), dict):
+            raise ValueError('valores debe ser un objeto, p. ej. {"completada": true}')
+        valores = _validar(data['valores'], parcial=True)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if not valores:
+        return jsonify({'error': 'No hay campos para actualizar'}), 400
+
+    # Solo las tareas que cambian: las que ya estaban así no suben la versión ni cuentan como afectadas
+    condiciones.append(f'({" OR ".join(f"{columna} IS NOT ?" for columna in valores)})')
+    parametros.extend(valores.values())
+    inicio = time.perf_counter()
+    usuario_id = session['usuario_id']
+    asignaciones = ', '.join(f'{columna} = ?' for columna in valores)
+    afectadas, trozos = _por_trozos(
+        usuario_id, f'UPDATE tareas SET {asignaciones} WHERE id IN ({{seleccion}}) RETURNING id',
+        tuple(valores.values()), condiciones, parametros, 'actualizadas')
+    return jsonify({'afectadas': afectadas, 'trozos': trozos,
+                    'segundos': round(time.perf_counter() - inicio, 3)}), 200
+
+
+@api_tareas.route('/lote/eliminar', methods=['POST'])
+@login_requerido
+def eliminar_lote():
+    """Elimina las tareas elegidas por ids o por filtro (p. ej. todas las completadas)"""
+    try:
+        condiciones, parametros = _seleccion(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    inicio = time.perf_counter()
+    usuario_id = session['usuario_id']
+    afectadas, trozos = _por_trozos(usuario_id, 'DELETE FROM tareas WHERE id IN ({seleccion}) RETURNING id',
+                                    (), condiciones, parametros, 'eliminadas')
+    return jsonify({'afectadas': afectadas, 'trozos': trozos,
+                    'segundos': round(time.perf_counter() - inicio, 3)}), 200
+
+
+@api_tareas.route('/eventos', methods=['GET'])
+@login_requerido
+def eventos():
+    """Cambios en las tareas del usuario como Server-Sent Events (reanuda con Last-Event-ID)"""
+    aviso = threading.Event()
+    desde = ultimo_id_cliente(request.headers.get('Last-Event-ID') or request.args.get('desde'))
+    try:
+        suscripcion, anteriores = suscribir(session['usuario_id'], aviso.set, desde)
+    except DemasiadosSuscriptores:
+        return jsonify({'error': 'Demasiadas conexiones de eventos'}), 503
+
+    def flujo():
+        # Con WSGI cada conexión ocupa un hilo mientras está abierta; para miles usar asgi.py
+        try:
+            yield INICIO
+            if anteriores is None:
+                yield REINICIAR
+            else:
+                for evento in anteriores:
+                    yield formatear(*evento)
+            while True:
+                if not aviso.wait(EVENTOS_LATIDO):
+                    yield LATIDO
+                    continue
+                aviso.clear()
+                nuevos = suscripcion.tomar()
+                if nuevos is None:
+                    yield REINICIAR
+                    continue
+                for evento in nuevos:
+                    yield formatear(*evento)
+        finally:
+            desuscribir(suscripcion)
+
+    return Response(flujo(), content_type='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',  # que un proxy nginx no acumule los eventos
+    })
+
+
+@api_tareas.route('', methods=['POST'])
+@login_requerido
+def crear():
+    try:
+        valores = _validar(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    usuario_id = session['usuario_id']
+    tarea_id = nuevos_ids()[0]
+    tarea_id, _ = escribir(
+        'INSERT INTO tareas (id, usuario_id, titulo, descripcion, completada) VALUES (?, ?, ?, ?, ?)',
+        (tarea_id, usuario_id, valores['titulo'], valores.get('descripcion'), valores.get('completada', 0)),
+        usuario_id, si_cambia=sentencia_evento_tarea(usuario_id, 'creada', tarea_id))
+    avisar(usuario_id)
+    with conexion(session['usuario_id']) as conn:
+        tarea = _a_dict(_obtener_tarea(conn, tarea_id))
+    return jsonify(tarea), 201
+
+
+@api_tareas.route('/<int:tarea_id>', methods=['GET'])
+@login_requerido
+@version_condicional
+def obtener(tarea_id):
+    try:
+        columnas = _campos_pedidos()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    with conexion(session['usuario_id']) as conn:
+        tarea = _obtener_tarea(conn, tarea_id, columnas)
+    if tarea is None:
+        return jsonify({'error': 'Tarea no encontrada'}), 404
+    return jsonify(_a_dict(tarea)), 200
+
+
+@api_tareas.route('/<int:tarea_id>', methods=['PUT', 'PATCH'])
+@login_requerido
+def actualizar(tarea_id):
+    try:
+        valores = _validar(request.get_json(silent=True), parcial=request.method == 'PATCH')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if not valores:
+        return jsonify({'error': 'No hay campos para actualizar'}), 400
+
+    asignaciones = ', '.join(f'{columna} = ?' for columna in valores)
+    usuario_id = session['usuario_id']
+    error = _escribir_tarea(f'UPDATE tareas SET {asignaciones} WHERE id = ? AND usuario_id = ?',
+                            (*valores.values(), tarea_id, usuario_id), usuario_id, tarea_id,
+                            sentencia_evento_tarea(usuario_id, 'actualizada', tarea_id))
+    if error:
+        return error
+    with conexion(usuario_id) as conn:
+        tarea = _a_dict(_obtener_tarea(conn, tarea_id))
+    return jsonify(tarea), 200
+
+
+@api_tareas.route('/<int:tarea_id>/completar', methods=['POST'])
+@login_requerido
+def completar(tarea_id):
+    usuario_id = session['usuario_id']
+    error = _escribir_tarea('UPDATE tareas SET completada = 1 WHERE id = ? AND usuario_id = ?',
+                            (tarea_id, usuario_id), usuario_id, tarea_id,
+                            sentencia_evento_tarea(usuario_id, 'actualizada', tarea_id))
+    if error:
+        return error
+    with conexion(usuario_id) as conn:
+        tarea = _a_dict(_obtener_tarea(conn, tarea_id))
+    return jsonify(tarea), 200
+
+
+@api_tareas.route('/<int:tarea_id>', methods=['DELETE'])
+@login_requerido
+def eliminar(tarea_id):
+    usuario_id = session['usuario_id']
+    error = _escribir_tarea('DELETE FROM tareas WHERE id = ? AND usuario_id = ?',
+                            (tarea_id, usuario_id), usuario_id, tarea_id,
+                            sentencia_evento(usuario_id, 'eliminada', {'id': tarea_id}))
+    if error:
+        return error
+    return jsonify({'mensaje': 'Tarea eliminada'}), 200
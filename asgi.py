@@ -0,0 +1,508 @@
+"""Modo de servicio asíncrono (ASGI) para las rutas de servidor.py
+
+Uso (con cualquier servidor ASGI, por ejemplo uvicorn):
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+
+/registro, /login, /logout, /tareas, / y /api/tareas/eventos se atienden de forma
+nativa: las conexiones abiertas solo ocupan memoria mientras esperan y el acceso a
+SQLite y el hashing se despachan a un pool de hilos. El resto de las rutas las responde la app Flask dentro
+de ese mismo pool. La cookie de sesión es la misma que firma Flask, así que una
+sesión iniciada en un modo sirve en el otro (con cualquiera de los dos backends de
+sesión de sesiones.py).
+"""
+import asyncio
+import io
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturoTimeout
+from datetime import datetime
+from urllib.parse import parse_qs
+from itsdangerous import BadSignature
+from werkzeug.exceptions import ClientDisconnected
+from werkzeug.http import dump_cookie, parse_cookie
+
+from base_datos import conexion, PoolAgotado
+from cola_escritura import EscrituraSaturada
+from eventos import (suscribir, desuscribir, formatear, ultimo_id_cliente, DemasiadosSuscriptores,
+                     EVENTOS_LATIDO, INICIO, LATIDO, REINICIAR)
+from hashing import ServicioSaturado, preparar_politica
+from limitador import admitir, DemasiadosIntentos
+from metricas import medir, observar_peticion
+from migraciones import migrar
+from paginas import pagina_registro, pagina_login
+from resumen import leer_resumen
+from sesiones import InterfazSesionServidor, regenerar_id
+from servidor import app as app_flask, plantilla_tareas, INFO_API
+from indice_usuarios import indice as indice_usuarios
+from mantenimiento import iniciar as iniciar_mantenimiento
+from usuarios import leer_credenciales, registrar, autenticar, DatosInvalidos, UsuarioExistente
+
+# Hilos para el trabajo bloqueante (SQLite y espera del pool de hashing)
+ASGI_HILOS = int(os.environ.get('ASGI_HILOS', '32'))
+executor = ThreadPoolExecutor(max_workers=ASGI_HILOS, thread_name_prefix='asgi')
+# Trozos en tránsito entre el event loop y la app Flask, en cada sentido (contrapresión)
+ASGI_COLA_MAX = int(os.environ.get('ASGI_COLA_MAX', '16'))
+ESPERA_HILO = 0.5  # segundos entre verificaciones de desconexión de un hilo que espera al event loop
+
+# La misma interfaz de sesión que usa Flask (sin el envoltorio de métricas)
+interfaz_sesion = getattr(app_flask.session_interface, 'interna', app_flask.session_interface)
+SESIONES_SERVIDOR = isinstance(interfaz_sesion, InterfazSesionServidor)
+serializador_sesion = None if SESIONES_SERVIDOR else interfaz_sesion.get_signing_serializer(app_flask)
+COOKIE_SESION = app_flask.config['SESSION_COOKIE_NAME']
+
+
+class Peticion:
+    def __init__(self, scope, cuerpo, cabeceras, sesion):
+        self.metodo = scope['method']
+        self.ruta = scope['path']
+        self.cabeceras = cabeceras
+        self.cuerpo = cuerpo
+        self.ip = (scope.get('client') or ('',))[0]
+        self.sesion = sesion
+        self.sesion_modificada = False
+
+    @classmethod
+    async def crear(cls, scope, cuerpo):
+        cabeceras = {k.decode('latin-1').lower(): v.decode('latin-1') for k, v in scope['headers']}
+        return cls(scope, cuerpo, cabeceras, await _cargar_sesion(cabeceras, scope['method']))
+
+    def json(self):
+        tipo = self.cabeceras.get('content-type', '').split(';')[0].strip()
+        if tipo != 'application/json' and not tipo.endswith('+json'):
+            return None
+        try:
+            return json.loads(self.cuerpo)
+        except ValueError:
+            return None
+
+
+async def _cargar_sesion(cabeceras, metodo):
+    valor = parse_cookie(cabeceras.get('cookie', '')).get(COOKIE_SESION)
+    if SESIONES_SERVIDOR:
+        # Un fallo de la caché lee SQLite (y puede barrer sesiones vencidas): fuera del event loop
+        return await en_hilo(interfaz_sesion.cargar, valor, metodo)
+    if not valor:
+        return {}
+    max_age = int(app_flask.permanent_session_lifetime.total_seconds())
+    try:
+        return serializador_sesion.loads(valor, max_age=max_age)
+    except BadSignature:
+        return {}
+
+
+class Respuesta:
+    def __init__(self, cuerpo=b'', estado=200, cabeceras=None, tipo='text/html; charset=utf-8'):
+        self.cuerpo = cuerpo.encode('utf-8') if isinstance(cuerpo, str) else cuerpo
+        self.estado = estado
+        self.cabeceras = dict(cabeceras or {})
+        if self.estado != 304:
+            self.cabeceras.setdefault('Content-Type', tipo)
+
+
+def respuesta_json(datos, estado=200, cabeceras=None):
+    # Mismo formato que jsonify en Flask (claves ordenadas, compacto, salto de línea final)
+    cuerpo = app_flask.json.dumps(datos, separators=(',', ':')) + '\n'
+    return Respuesta(cuerpo, estado, cabeceras, 'application/json')
+
+
+async def en_hilo(funcion, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, lambda: funcion(*args, **kwargs))
+
+
+def _pagina(peticion, pagina):
+    acepta_gzip = 'gzip' in peticion.cabeceras.get('accept-encoding', '')
+    estado, cabeceras, cuerpo = pagina.seleccionar(peticion.cabeceras.get('if-none-match'), acepta_gzip)
+    return Respuesta(cuerpo, estado, cabeceras)
+
+
+async def registro(peticion):
+    if peticion.metodo == 'GET':
+        return _pagina(peticion, pagina_registro)
+    try:
+        usuario, contraseña = leer_credenciales(peticion.json(), validar_vacios=True)
+        admitir(peticion.ip)
+        await en_hilo(registrar, usuario, contraseña)
+        return respuesta_json({'mensaje': 'Usuario registrado exitosamente'}, 201)
+    except DatosInvalidos as e:
+        return respuesta_json({'error': str(e)}, 400)
+    except UsuarioExistente:
+        return respuesta_json({'error': 'El usuario ya existe'}, 409)
+
+
+async def login(peticion):
+    if peticion.metodo == 'GET':
+        return _pagina(peticion, pagina_login)
+    usuario, contraseña = leer_credenciales(peticion.json())
+    admitir(peticion.ip, usuario)
+    user_data = await en_hilo(autenticar, usuario, contraseña)
+    if not user_data:
+        return respuesta_json({'error': 'Credenciales incorrectas'}, 401)
+    regenerar_id(peticion.sesion)
+    peticion.sesion['usuario_id'] = user_data[0]
+    peticion.sesion['usuario'] = user_data[1]
+    peticion.sesion_modificada = True
+    return respuesta_json({'mensaje': 'Inicio de sesión exitoso', 'usuario': usuario}, 200)
+
+
+async def logout(peticion):
+    peticion.sesion.clear()
+    peticion.sesion_modificada = True
+    return respuesta_json({'mensaje': 'Sesión cerrada exitosamente'}, 200)
+
+
+def _leer_resumen(usuario_id):
+    with conexion(usuario_id) as conn:
+        return leer_resumen(conn, usuario_id)
+
+
+async def tareas(peticion):
+    if 'usuario_id' not in peticion.sesion:
+        return respuesta_json({'error': 'Debe iniciar sesión para acceder a las tareas'}, 401)
+    resumen = await en_hilo(_leer_resumen, peticion.sesion['usuario_id'])
+    with medir('render'):
+        html = plantilla_tareas.render(usuario=peticion.sesion['usuario'],
+                                       usuario_id=peticion.sesion['usuario_id'],
+                                       resumen=resumen,
+                                       fecha_actual=datetime.now().strftime('%d/%m/%Y %H:%M:%S'))
+    return Respuesta(html)
+
+
+async def index(peticion):
+    return respuesta_json(INFO_API)
+
+
+# ruta -> (métodos permitidos, vista)
+RUTAS = {
+    '/registro': (('GET', 'POST'), registro),
+    '/login': (('GET', 'POST'), login),
+    '/logout': (('GET',), logout),
+    '/tareas': (('GET',), tareas),
+    '/': (('GET',), index),
+}
+
+
+async def _despachar(peticion):
+    metodos, vista = RUTAS[peticion.ruta]
+    if peticion.metodo not in metodos and not (peticion.metodo == 'HEAD' and 'GET' in metodos):
+        return respuesta_json({'error': 'Método no permitido'}, 405, {'Allow': ', '.join(metodos)})
+    try:
+        return await vista(peticion)
+    except DatosInvalidos as e:
+        return respuesta_json({'error': str(e)}, 400)
+    except DemasiadosIntentos as e:
+        return respuesta_json({'error': 'Demasiados intentos, espere antes de reintentar'}, 429,
+                              {'Retry-After': str(e.retry_after)})
+    except (ServicioSaturado, EscrituraSaturada) as e:
+        return respuesta_json({'error': 'Servidor ocupado, intente nuevamente'}, 503,
+                              {'Retry-After': str(e.retry_after)})
+    except PoolAgotado:
+        return respuesta_json({'error': 'Servidor ocupado, intente nuevamente'}, 503, {'Retry-After': '1'})
+    except Exception as e:
+        return respuesta_json({'error': f'Error interno del servidor: {str(e)}'}, 500)
+
+
+def _cookie_sesion(peticion):
+    """Cabecera Set-Cookie con las mismas reglas que la interfaz de sesión de Flask"""
+    opciones = {
+        'path': app_flask.config['SESSION_COOKIE_PATH'] or app_flask.config['APPLICATION_ROOT'],
+        'domain': app_flask.config['SESSION_COOKIE_DOMAIN'],
+        'secure': app_flask.config['SESSION_COOKIE_SECURE'],
+        'httponly': app_flask.config['SESSION_COOKIE_HTTPONLY'],
+        'samesite': app_flask.config['SESSION_COOKIE_SAMESITE'],
+    }
+    if SESIONES_SERVIDOR:
+        sid = interfaz_sesion.persistir(peticion.sesion)
+        if sid is None:
+            return None
+        if sid == '':
+            return dump_cookie(COOKIE_SESION, '', expires=0, max_age=0, **opciones)
+        return dump_cookie(COOKIE_SESION, sid, **opciones)
+    if not peticion.sesion_modificada:
+        return None
+    if not peticion.sesion:
+        return dump_cookie(COOKIE_SESION, '', expires=0, max_age=0, **opciones)
+    return dump_cookie(COOKIE_SESION, serializador_sesion.dumps(dict(peticion.sesion)), **opciones)
+
+
+def _entorno_wsgi(scope, entrada):
+    servidor = scope.get('server') or ('localhost', 80)
+    entorno = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        'PATH_INFO': scope['path'],
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': servidor[0],
+        'SERVER_PORT': str(servidor[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': entrada,
+        # El cuerpo termina donde termina el stream (sirve también sin Content-Length, p. ej. chunked)
+        'wsgi.input_terminated': True,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for clave, valor in scope['headers']:
+        nombre = clave.decode('latin-1').upper().replace('-', '_')
+        valor = valor.decode('latin-1')
+        if nombre in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            entorno[nombre] = valor
+        else:
+            nombre = f'HTTP_{nombre}'
+            entorno[nombre] = f'{entorno[nombre]},{valor}' if nombre in entorno else valor
+    return entorno
+
+
+class EntradaAsgi(io.RawIOBase):
+    """wsgi.input que pide el cuerpo al event loop a medida que la app lo lee"""
+
+    def __init__(self, loop, cola, cancelado):
+        self._loop = loop
+        self._cola = cola
+        self._cancelado = cancelado
+        self._pendiente = memoryview(b'')
+        self._fin = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, destino):
+        if not self._pendiente and not self._fin:
+            self._pendiente = memoryview(self._siguiente())
+            self._fin = not self._pendiente
+        cantidad = min(len(destino), len(self._pendiente))
+        destino[:cantidad] = self._pendiente[:cantidad]
+        self._pendiente = self._pendiente[cantidad:]
+        return cantidad
+
+    def _siguiente(self):
+        futuro = asyncio.run_coroutine_threadsafe(self._cola.get(), self._loop)
+        while True:
+            try:
+                trozo = futuro.result(timeout=ESPERA_HILO)
+            except FuturoTimeout:
+                if self._cancelado.is_set():
+                    futuro.cancel()
+                    raise ClientDisconnected()
+                continue
+            if trozo is None:
+                raise ClientDisconnected()
+            return trozo
+
+
+async def _recibir(receive, entrada, salida, cancelado):
+    """Único lector de `receive`: pasa el cuerpo a la app (b'' al final) y después espera la desconexión"""
+    while True:
+        mensaje = await receive()
+        if mensaje['type'] == 'http.disconnect':
+            cancelado.set()
+            if not entrada.full():
+                entrada.put_nowait(None)
+            salida.put_nowait(('desconexion',))
+            return
+        trozo = mensaje.get('body', b'')
+        if trozo:
+            # Con la cola llena se deja de leer el socket hasta que la app consuma
+            await entrada.put(trozo)
+        if not mensaje.get('more_body'):
+            await entrada.put(b'')
+            # El resto de los mensajes solo puede ser la desconexión
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+            cancelado.set()
+            salida.put_nowait(('desconexion',))
+            return
+
+
+async def _wsgi(scope, receive, send):
+    """Ejecuta la app Flask en el pool de hilos; el cuerpo entra y la respuesta sale a medida que se generan"""
+    loop = asyncio.get_running_loop()
+    entrada = asyncio.Queue(maxsize=ASGI_COLA_MAX)
+    salida = asyncio.Queue()
+    # La cola de salida se acota con un semáforo del lado del hilo, que así espera sin bloquear el event loop
+    espacio = threading.Semaphore(ASGI_COLA_MAX)
+    cancelado = threading.Event()
+
+    def poner(mensaje):
+        loop.call_soon_threadsafe(salida.put_nowait, mensaje)
+
+    def start_response(estado, cabeceras, exc_info=None):
+        lista = [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in cabeceras]
+        poner(('inicio', int(estado.split(' ', 1)[0]), lista))
+
+    def ejecutar():
+        try:
+            resultado = app_flask.wsgi_app(_entorno_wsgi(scope, io.BufferedReader(
+                EntradaAsgi(loop, entrada, cancelado))), start_response)
+            try:
+                for trozo in resultado:
+                    if not trozo:
+                        continue
+                    while not espacio.acquire(timeout=ESPERA_HILO):
+                        if cancelado.is_set():
+                            break
+                    # Si el cliente se fue, cerrar el iterable detiene la generación (p. ej. una exportación)
+                    if cancelado.is_set():
+                        break
+                    poner(('cuerpo', trozo))
+            finally:
+                if hasattr(resultado, 'close'):
+                    resultado.close()
+        finally:
+            poner(('fin',))
+
+    receptor = asyncio.ensure_future(_recibir(receive, entrada, salida, cancelado))
+    loop.run_in_executor(executor, ejecutar)
+    iniciada = False
+    try:
+        while True:
+            mensaje = await salida.get()
+            if mensaje[0] == 'inicio':
+                iniciada = True
+                await send({'type': 'http.response.start', 'status': mensaje[1], 'headers': mensaje[2]})
+            elif mensaje[0] == 'cuerpo':
+                espacio.release()
+                await send({'type': 'http.response.body', 'body': mensaje[1], 'more_body': True})
+            elif mensaje[0] == 'desconexion':
+                # El cliente se fue: el hilo deja de generar la respuesta al ver `cancelado`
+                return
+            else:
+                if not iniciada:
+                    await send({'type': 'http.response.start', 'status': 500, 'headers': []})
+                await send({'type': 'http.response.body', 'body': b''})
+                return
+    finally:
+        cancelado.set()
+        receptor.cancel()
+
+
+async def _enviar(send, respuesta):
+    cabeceras = [(k.lower().encode('latin-1'), str(v).encode('latin-1')) for k, v in respuesta.cabeceras.items()]
+    await send({'type': 'http.response.start', 'status': respuesta.estado, 'headers': cabeceras})
+    await send({'type': 'http.response.body', 'body': respuesta.cuerpo})
+
+
+async def _eventos(scope, receive, send):
+    """SSE de /api/tareas/eventos: cada conexión es una corrutina esperando su asyncio.Event"""
+    peticion = await Peticion.crear(scope, b'')
+    usuario_id = peticion.sesion.get('usuario_id')
+    if usuario_id is None:
+        return await _enviar(send, respuesta_json({'error': 'Debe iniciar sesión para acceder a las tareas'}, 401))
+    if peticion.metodo != 'GET':
+        return await _enviar(send, respuesta_json({'error': 'Método no permitido'}, 405, {'Allow': 'GET'}))
+
+    loop = asyncio.get_running_loop()
+    aviso = asyncio.Event()
+    consulta = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    desde = ultimo_id_cliente(peticion.cabeceras.get('last-event-id') or consulta.get('desde', [None])[0])
+    try:
+        # El hilo lector de eventos despierta a la corrutina desde fuera del event loop
+        suscripcion, anteriores = await en_hilo(suscribir, usuario_id,
+                                                lambda: loop.call_soon_threadsafe(aviso.set), desde)
+    except DemasiadosSuscriptores:
+        return await _enviar(send, respuesta_json({'error': 'Demasiadas conexiones de eventos'}, 503))
+
+    desconexion = asyncio.ensure_future(receive())
+    try:
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', b'text/event-stream'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no'),
+        ]})
+        trozo = INICIO + (REINICIAR if anteriores is None else b''.join(formatear(*e) for e in anteriores))
+        while trozo is not None:
+            await send({'type': 'http.response.body', 'body': trozo, 'more_body': True})
+            trozo = await _siguiente_trozo(suscripcion, aviso, desconexion)
+    finally:
+        desuscribir(suscripcion)
+        if not desconexion.done():
+            desconexion.cancel()
+            await send({'type': 'http.response.body', 'body': b''})
+
+
+async def _siguiente_trozo(suscripcion, aviso, desconexion):
+    """Próximos eventos, un latido si no hubo ninguno, o None para cerrar la conexión"""
+    espera = asyncio.ensure_future(aviso.wait())
+    hechas, _ = await asyncio.wait((espera, desconexion), timeout=EVENTOS_LATIDO,
+                                   return_when=asyncio.FIRST_COMPLETED)
+    espera.cancel()
+    if desconexion in hechas:
+        return None
+    if not hechas:
+        return LATIDO
+    aviso.clear()
+    nuevos = suscripcion.tomar()
+    if nuevos is None:
+        # Se acumularon demasiados eventos sin enviar: el cliente vuelve a pedir la lista
+        return REINICIAR
+    return b''.join(formatear(*e) for e in nuevos) or LATIDO
+
+
+async def _leer_cuerpo(receive):
+    partes = []
+    while True:
+        mensaje = await receive()
+        if mensaje['type'] == 'http.disconnect':
+            break
+        partes.append(mensaje.get('body', b''))
+        if not mensaje.get('more_body'):
+            break
+    return b''.join(partes)
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        while True:
+            mensaje = await receive()
+            if mensaje['type'] == 'lifespan.startup':
+                # El esquema, la política de hashing y el índice de usuarios se dejan listos antes de la primera petición
+                await en_hilo(migrar)
+                await en_hilo(preparar_politica)
+                if indice_usuarios:
+                    await en_hilo(indice_usuarios.preparar)
+                iniciar_mantenimiento()
+                await send({'type': 'lifespan.startup.complete'})
+            elif mensaje['type'] == 'lifespan.shutdown':
+                executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+    if scope['type'] != 'http':
+        return
+
+    if scope['path'] not in RUTAS and scope['path'] != '/api/tareas/eventos':
+        # El resto de las rutas (API de tareas, estado, etc.) las atiende Flask en un hilo, leyendo
+        # el cuerpo a medida que lo consume (importaciones y lotes NDJSON en streaming)
+        return await _wsgi(scope, receive, send)
+    cuerpo = await _leer_cuerpo(receive)
+    if scope['path'] == '/api/tareas/eventos':
+        return await _eventos(scope, receive, send)
+
+    inicio = time.perf_counter()
+    with medir('sesion'):
+        peticion = await Peticion.crear(scope, cuerpo)
+    respuesta = await _despachar(peticion)
+
+    cabeceras = [(k.lower().encode('latin-1'), str(v).encode('latin-1')) for k, v in respuesta.cabeceras.items()]
+    cabeceras.append((b'content-length', str(len(respuesta.cuerpo)).encode()))
+    with medir('sesion'):
+        if SESIONES_SERVIDOR and peticion.sesion.modified:
+            # Guardar o revocar la sesión escribe en SQLite: fuera del event loop
+            cookie = await en_hilo(_cookie_sesion, peticion)
+        else:
+            cookie = _cookie_sesion(peticion)
+    if cookie:
+        cabeceras.append((b'set-cookie', cookie.encode('latin-1')))
+    if peticion.ruta in ('/login', '/logout', '/tareas'):
+        cabeceras.append((b'vary', b'Cookie'))
+
+    await send({'type': 'http.response.start', 'status': respuesta.estado, 'headers': cabeceras})
+    cuerpo = b'' if peticion.metodo == 'HEAD' else respuesta.cuerpo
+    await send({'type': 'http.response.body', 'body': cuerpo})
+    observar_peticion(peticion.ruta, peticion.metodo, respuesta.estado, time.perf_counter() - inicio)
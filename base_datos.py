@@ -0,0 +1,284 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from metricas import medir
+
+# Configuración de la base de datos (se puede cambiar con variables de entorno)
+DB_PATH = os.environ.get('DB_PATH', 'usuarios.db')
+POOL_TAMANO = int(os.environ.get('DB_POOL_TAMANO', '8'))
+POOL_ESPERA = float(os.environ.get('DB_POOL_ESPERA', '5'))  # segundos máximos esperando una conexión
+STATEMENT_CACHE = int(os.environ.get('DB_STATEMENT_CACHE', '256'))
+# Almacenamiento fragmentado: con N > 0 las tareas de cada usuario viven en uno de N archivos
+# y DB_PATH queda como directorio (usuarios, sesiones, configuración). Ver fragmentos.py.
+DB_FRAGMENTOS = int(os.environ.get('DB_FRAGMENTOS', '0'))
+DB_FRAGMENTOS_DIR = os.environ.get('DB_FRAGMENTOS_DIR', os.path.splitext(DB_PATH)[0] + '_fragmentos')
+IDS_BLOQUE = int(os.environ.get('DB_IDS_BLOQUE', '1000'))  # ids de tareas reservados de una vez
+
+# PRAGMAs aplicados a cada conexión nueva del pool
+PRAGMAS = (
+    # Antes de WAL: en una base nueva el espacio de lo borrado se puede devolver de a poco
+    # (PRAGMA incremental_vacuum, ver mantenimiento.py); en una existente no cambia nada
+    'PRAGMA auto_vacuum=INCREMENTAL',
+    'PRAGMA journal_mode=WAL',         # lectores y escritor no se bloquean entre sí
+    'PRAGMA synchronous=NORMAL',       # en WAL es seguro y evita un fsync por commit
+    'PRAGMA busy_timeout=5000',        # esperar el lock en lugar de fallar con "database is locked"
+    'PRAGMA cache_size=-16000',        # ~16 MB de caché de páginas por conexión
+    'PRAGMA mmap_size=268435456',      # 256 MB de lectura vía mmap
+    'PRAGMA temp_store=MEMORY',
+)
+
+
+class PoolAgotado(Exception):
+    """No se obtuvo una conexión libre dentro del tiempo de espera"""
+
+
+class PoolConexiones:
+    """Pool acotado de conexiones SQLite reutilizables entre peticiones"""
+
+    def __init__(self, ruta=DB_PATH, tamano=POOL_TAMANO, espera=POOL_ESPERA, migrar=True):
+        self.ruta = ruta
+        self.tamano = tamano
+        self.espera = espera
+        self.migrar = migrar
+        self._esquema_listo = not migrar
+        self._cond = threading.Condition()
+        self._libres = deque()
+        self._pid = os.getpid()
+        self._reiniciar_contadores()
+
+    def _reiniciar_contadores(self):
+        self._abiertas = 0
+        self._en_uso = 0
+        self._checkouts = 0
+        self._esperas = 0
+        self._timeouts = 0
+        self._tiempo_espera = 0.0
+
+    def _abrir(self):
+        directorio = os.path.dirname(self.ruta)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        # cached_statements: las sentencias preparadas se reutilizan mientras viva la conexión
+        conn = sqlite3.connect(self.ruta, timeout=self.espera, isolation_level=None,
+                               check_same_thread=False, cached_statements=STATEMENT_CACHE)
+        conn.row_factory = sqlite3.Row
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        if not self._esquema_listo:
+            # La primera conexión del proceso deja el esquema al día (si ya lo está, es un PRAGMA)
+            from migraciones import aplicar
+            aplicar(conn)
+            self._esquema_listo = True
+        return conn
+
+    def _verificar_fork(self):
+        # Las conexiones no sobreviven a un fork: el proceso hijo cierra las heredadas sin usarlas
+        # (sus locks POSIX son del padre y no pasan al hijo) y empieza con un pool vacío
+        if self._pid != os.getpid():
+            for conn in self._libres:
+                try:
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+            self._cond = threading.Condition()
+            self._libres = deque()
+            self._pid = os.getpid()
+            self._reiniciar_contadores()
+
+    def _obtener(self):
+        self._verificar_fork()
+        inicio = None
+        with self._cond:
+            while not self._libres and self._abiertas >= self.tamano:
+                if inicio is None:
+                    inicio = time.perf_counter()
+                    self._esperas += 1
+                restante = self.espera - (time.perf_counter() - inicio)
+                if restante <= 0:
+                    self._timeouts += 1
+                    raise PoolAgotado('No hay conexiones libres en el pool')
+                self._cond.wait(restante)
+            if self._libres:
+                conn = self._libres.pop()
+            else:
+                self._abiertas += 1
+                conn = None
+            self._checkouts += 1
+            self._en_uso += 1
+            if inicio is not None:
+                self._tiempo_espera += time.perf_counter() - inicio
+
+        if conn is None:
+            try:
+                conn = self._abrir()
+            except Exception:
+                with self._cond:
+                    self._abiertas -= 1
+                    self._en_uso -= 1
+                    self._cond.notify()
+                raise
+        return conn
+
+    def _devolver(self, conn, descartar=False):
+        with self._cond:
+            self._en_uso -= 1
+            if descartar:
+                self._abiertas -= 1
+            else:
+                self._libres.append(conn)
+            self._cond.notify()
+        if descartar:
+            conn.close()
+
+    @contextmanager
+    def conexion(self):
+        conn = self._obtener()
+        descartar = False
+        try:
+            with medir('db'):
+                yield conn
+        finally:
+            # Una transacción abierta no puede volver al pool; si ni el rollback
+            # funciona, la conexión se descarta
+            if conn.in_transaction:
+                try:
+                    conn.rollback()
+                except sqlite3.Error:
+                    descartar = True
+            self._devolver(conn, descartar)
+
+    def estadisticas(self):
+        with self._cond:
+            return {
+                'tamano': self.tamano,
+                'abiertas': self._abiertas,
+                'en_uso': self._en_uso,
+                'libres': len(self._libres),
+                'checkouts': self._checkouts,
+                'esperas': self._esperas,
+                'timeouts': self._timeouts,
+                'tiempo_espera_ms': round(self._tiempo_espera * 1000, 3),
+            }
+
+    def cerrar(self):
+        with self._cond:
+            while self._libres:
+                self._libres.pop().close()
+                self._abiertas -= 1
+
+
+def ruta_fragmento(directorio, indice):
+    return os.path.join(directorio, f'fragmento_{indice}.db')
+
+
+def fragmento_de(usuario_id, cantidad):
+    """Índice del fragmento del usuario (jump consistent hash de Lamping y Veach)
+
+    Reparte de forma pareja y, al pasar de N a N+1 fragmentos, solo mueve 1/(N+1) de los usuarios.
+    """
+    clave, indice, siguiente = int(usuario_id) & 0xFFFFFFFFFFFFFFFF, -1, 0
+    while siguiente < cantidad:
+        indice = siguiente
+        clave = (clave * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        siguiente = int((indice + 1) * ((1 << 31) / ((clave >> 33) + 1)))
+    return indice
+
+
+# El pool global es el de DB_PATH; cada fragmento tiene el suyo
+pool = PoolConexiones()
+fragmentos = [PoolConexiones(ruta_fragmento(DB_FRAGMENTOS_DIR, i)) for i in range(DB_FRAGMENTOS)]
+
+
+def pool_de(usuario_id):
+    """Pool de la base donde están las tareas del usuario"""
+    if not fragmentos:
+        return pool
+    return fragmentos[fragmento_de(usuario_id, len(fragmentos))]
+
+
+def todos_los_pools():
+    return [pool] + fragmentos
+
+
+def pools_tareas():
+    """Pools de las bases que guardan tareas: los fragmentos o, sin fragmentos, el global"""
+    return fragmentos or [pool]
+
+
+def conexion(usuario_id=None):
+    """Context manager que presta una conexión del pool global (o del fragmento de usuario_id)"""
+    return (pool if usuario_id is None else pool_de(usuario_id)).conexion()
+
+
+@contextmanager
+def transaccion(usuario_id=None):
+    """Conexión del pool dentro de una transacción de escritura (BEGIN IMMEDIATE)"""
+    with conexion(usuario_id) as conn:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+
+
+class _ReservaIds:
+    """Ids de tareas únicos entre todos los fragmentos, reservados de a bloques (hi/lo) en el directorio
+
+    Así una tarea conserva su id cuando el rebalanceo mueve a su usuario a otro fragmento.
+    """
+
+    def __init__(self, bloque=IDS_BLOQUE):
+        self.bloque = bloque
+        self._lock = threading.Lock()
+        self._pid = None
+        self._siguiente = self._limite = 0
+
+    def tomar(self, cantidad):
+        with self._lock:
+            if self._pid != os.getpid():
+                # Después de un fork el hijo no puede usar el bloque del padre
+                self._pid = os.getpid()
+                self._siguiente = self._limite = 0
+            ids = []
+            while len(ids) < cantidad:
+                if self._siguiente >= self._limite:
+                    bloque = max(self.bloque, cantidad - len(ids))
+                    with pool.conexion() as conn:
+                        self._limite = conn.execute(
+                            "INSERT INTO secuencias (nombre, valor) VALUES ('tareas', ?) "
+                            'ON CONFLICT (nombre) DO UPDATE SET valor = valor + excluded.valor RETURNING valor',
+                            (bloque,)).fetchone()[0]
+                    self._siguiente = self._limite - bloque
+                tomados = min(cantidad - len(ids), self._limite - self._siguiente)
+                ids.extend(range(self._siguiente + 1, self._siguiente + tomados + 1))
+                self._siguiente += tomados
+            return ids
+
+
+reserva_ids = _ReservaIds()
+
+
+def nuevos_ids(cantidad=1):
+    """Ids para insertar tareas: None (AUTOINCREMENT) con una sola base, únicos entre fragmentos si no"""
+    if not fragmentos:
+        return [None] * cantidad
+    return reserva_ids.tomar(cantidad)
+
+
+def cerrar():
+    """Cierra las conexiones libres de todos los pools (p. ej. en el maestro antes de crear workers con fork)"""
+    for p in todos_los_pools():
+        p.cerrar()
+
+
+def estadisticas():
+    """Estadísticas del pool de DB_PATH y, si hay, de cada fragmento"""
+    datos = pool.estadisticas()
+    if fragmentos:
+        datos['fragmentos'] = {str(i): p.estadisticas() for i, p in enumerate(fragmentos)}
+    return datos
@@ -0,0 +1,313 @@
+"""Benchmark reproducible de los endpoints de autenticación y tareas
+
+Levanta la app contra una base de datos temporal, carga N usuarios y M tareas y
+ejecuta cada escenario con concurrencia fija. El resultado (peticiones por segundo
+y latencias p50/p95/p99) se guarda como JSON para usarlo como línea base.
+
+    python benchmark.py --salida base.json
+    python benchmark.py --comparar base.json --umbral 0.10
+"""
+import argparse
+import http.client
+import json
+import logging
+import os
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from importlib.metadata import version
+
+from metricas import percentil
+
+ESCENARIOS = ('registro', 'login', 'tareas', 'logout', 'mixto')
+# Proporción de operaciones del escenario mixto
+MEZCLA = (('login', 10), ('tareas', 70), ('crear_tarea', 10), ('registro', 5), ('logout', 5))
+CONTRASEÑA = 'clave-benchmark'
+LOGIN_INTENTOS = 8
+
+
+class Cliente:
+    """Conexión keep-alive con su propia cookie de sesión"""
+
+    def __init__(self, puerto):
+        self.conexion = http.client.HTTPConnection('127.0.0.1', puerto, timeout=60)
+        self.cookie = None
+
+    def pedir(self, metodo, ruta, datos=None):
+        cabeceras = {}
+        cuerpo = None
+        if datos is not None:
+            cuerpo = json.dumps(datos)
+            cabeceras['Content-Type'] = 'application/json'
+        if self.cookie:
+            cabeceras['Cookie'] = self.cookie
+        self.conexion.request(metodo, ruta, body=cuerpo, headers=cabeceras)
+        respuesta = self.conexion.getresponse()
+        respuesta.read()
+        cookie = respuesta.getheader('Set-Cookie')
+        if cookie:
+            self.cookie = cookie.split(';', 1)[0]
+        return respuesta.status
+
+
+class Operaciones:
+    def __init__(self, usuarios):
+        self.usuarios = usuarios
+        self._contador = iter(range(10 ** 9))
+        self._lock = threading.Lock()
+
+    def _nuevo_nombre(self):
+        with self._lock:
+            return f'bench_nuevo_{os.getpid()}_{next(self._contador)}'
+
+    def login(self, cliente):
+        usuario = random.choice(self.usuarios)
+        return cliente.pedir('POST', '/login', {'usuario': usuario, 'contraseña': CONTRASEÑA}) == 200
+
+    def registro(self, cliente):
+        return cliente.pedir('POST', '/registro', {'usuario': self._nuevo_nombre(), 'contraseña': CONTRASEÑA}) == 201
+
+    def tareas(self, cliente):
+        return cliente.pedir('GET', '/api/tareas?limite=20') == 200
+
+    def crear_tarea(self, cliente):
+        return cliente.pedir('POST', '/api/tareas', {'titulo': 'Tarea de benchmark'}) == 201
+
+    def logout(self, cliente):
+        return cliente.pedir('GET', '/logout') == 200
+
+
+def sembrar(ruta_db, usuarios, tareas):
+    """Carga usuarios y tareas directamente en SQLite (un solo hash reutilizado)"""
+    from werkzeug.security import generate_password_hash
+    from base_datos import nuevos_ids, pool_de
+    contraseña_hash = generate_password_hash(CONTRASEÑA)
+    nombres = [f'bench_{i}' for i in range(usuarios)]
+    conn = sqlite3.connect(ruta_db)
+    with conn:
+        conn.executemany('INSERT INTO usuarios (usuario, contraseña) VALUES (?, ?)',
+                         ((n, contraseña_hash) for n in nombres))
+        ids = [fila[0] for fila in conn.execute('SELECT id FROM usuarios ORDER BY id')]
+    conn.close()
+    # Con DB_FRAGMENTOS cada tarea va al archivo del fragmento de su usuario
+    por_base = {}
+    for i, tarea_id in enumerate(nuevos_ids(tareas)):
+        usuario_id = ids[i % len(ids)]
+        por_base.setdefault(pool_de(usuario_id).ruta, []).append(
+            (tarea_id, usuario_id, f'Tarea {i}', 'Sembrada por el benchmark', i % 3 == 0))
+    for ruta, filas in por_base.items():
+        conn = sqlite3.connect(ruta)
+        with conn:
+            conn.executemany('INSERT INTO tareas (id, usuario_id, titulo, descripcion, completada) '
+                             'VALUES (?, ?, ?, ?, ?)', filas)
+        conn.close()
+    return nombres
+
+
+def ejecutar_escenario(nombre, puerto, operaciones, concurrencia, duracion):
+    latencias = []
+    errores = [0]
+    fallidos = []
+    lock = threading.Lock()
+    reloj = {}
+
+    def arrancar():
+        # El reloj arranca cuando todos los clientes están listos (después del login previo)
+        reloj['inicio'] = time.perf_counter()
+        reloj['fin'] = reloj['inicio'] + duracion
+
+    barrera = threading.Barrier(concurrencia, action=arrancar)
+
+    if nombre == 'mixto':
+        pasos = [op for op, peso in MEZCLA for _ in range(peso)]
+    else:
+        pasos = [nombre]
+
+    def trabajador():
+        cliente = Cliente(puerto)
+        propias = []
+        fallas = 0
+        # Los escenarios que necesitan sesión inician sesión antes de medir
+        if nombre in ('tareas', 'logout', 'mixto') and not iniciar_sesion(operaciones, cliente):
+            with lock:
+                fallidos.append(1)
+            barrera.abort()
+            return
+        try:
+            barrera.wait()
+        except threading.BrokenBarrierError:
+            return
+        while time.perf_counter() < reloj['fin']:
+            paso = random.choice(pasos)
+            inicio = time.perf_counter()
+            try:
+                ok = getattr(operaciones, paso)(cliente)
+            except (OSError, http.client.HTTPException):
+                cliente = Cliente(puerto)
+                ok = False
+            propias.append(time.perf_counter() - inicio)
+            if not ok:
+                fallas += 1
+            if paso == 'logout' and nombre != 'logout':
+                iniciar_sesion(operaciones, cliente)
+        with lock:
+            latencias.extend(propias)
+            errores[0] += fallas
+
+    hilos = [threading.Thread(target=trabajador) for _ in range(concurrencia)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    if fallidos:
+        raise RuntimeError(f'{nombre}: {len(fallidos)} clientes no pudieron iniciar sesión antes de medir')
+    transcurrido = time.perf_counter() - reloj['inicio']
+
+    latencias.sort()
+    return {
+        'peticiones': len(latencias),
+        'errores': errores[0],
+        'tasa_errores': round(errores[0] / len(latencias), 4) if latencias else 0.0,
+        'rps': round(len(latencias) / transcurrido, 2),
+        'p50_ms': round(percentil(latencias, 50) * 1000, 3),
+        'p95_ms': round(percentil(latencias, 95) * 1000, 3),
+        'p99_ms': round(percentil(latencias, 99) * 1000, 3),
+    }
+
+
+def iniciar_sesion(operaciones, cliente, intentos=LOGIN_INTENTOS):
+    """Login con reintentos (un 503 de la cola de hashing no debe dejar al cliente sin sesión)"""
+    for intento in range(intentos):
+        try:
+            if operaciones.login(cliente):
+                return True
+        except (OSError, http.client.HTTPException):
+            cliente.conexion.close()
+        time.sleep(min(1.0, 0.05 * 2 ** intento))
+    return False
+
+
+def comparar(base, actual, umbral):
+    """Devuelve la lista de regresiones (menos rps, más p95 o más errores que la base, más allá del umbral)"""
+    regresiones = []
+    for nombre, medido in actual['escenarios'].items():
+        referencia = base.get('escenarios', {}).get(nombre)
+        if not referencia:
+            continue
+        if not medido['peticiones']:
+            regresiones.append(f'{nombre}: ninguna petición completada')
+            continue
+        if referencia['rps'] and medido['rps'] < referencia['rps'] * (1 - umbral):
+            regresiones.append(f"{nombre}: rps {medido['rps']} < {referencia['rps']} (-{umbral:.0%})")
+        if referencia['p95_ms'] and medido['p95_ms'] > referencia['p95_ms'] * (1 + umbral):
+            regresiones.append(f"{nombre}: p95 {medido['p95_ms']} ms > {referencia['p95_ms']} ms (+{umbral:.0%})")
+        # Sin errores en la base, cualquier error es una regresión
+        tasa = medido['errores'] / medido['peticiones']
+        tasa_base = referencia['errores'] / referencia['peticiones'] if referencia.get('peticiones') else 0.0
+        if tasa > tasa_base * (1 + umbral):
+            regresiones.append(f'{nombre}: errores {tasa:.2%} > {tasa_base:.2%}')
+    return regresiones
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--usuarios', type=int, default=200, help='usuarios a sembrar (N)')
+    parser.add_argument('--tareas', type=int, default=20000, help='tareas a sembrar en total (M)')
+    parser.add_argument('--concurrencia', type=int, default=8, help='clientes simultáneos')
+    parser.add_argument('--duracion', type=float, default=10.0, help='segundos por escenario')
+    parser.add_argument('--escenarios', default=','.join(ESCENARIOS),
+                        help=f'lista separada por comas ({", ".join(ESCENARIOS)})')
+    parser.add_argument('--semilla', type=int, default=1234)
+    parser.add_argument('--salida', help='archivo JSON donde guardar los resultados')
+    parser.add_argument('--comparar', help='JSON de línea base contra el que comparar')
+    parser.add_argument('--umbral', type=float, default=0.10, help='regresión tolerada (0.10 = 10%%)')
+    args = parser.parse_args(argv)
+
+    escenarios = [e.strip() for e in args.escenarios.split(',') if e.strip()]
+    desconocidos = set(escenarios) - set(ESCENARIOS)
+    if desconocidos:
+        parser.error(f'escenarios desconocidos: {", ".join(sorted(desconocidos))}')
+    random.seed(args.semilla)
+
+    with tempfile.TemporaryDirectory(prefix='benchmark_') as directorio:
+        return ejecutar(args, escenarios, directorio)
+
+
+def ejecutar(args, escenarios, directorio):
+    # La base temporal se configura antes de importar la app
+    os.environ['DB_PATH'] = os.path.join(directorio, 'benchmark.db')
+    # Todos los clientes salen de 127.0.0.1: sin desactivarlo, el límite de intentos mediría los 429
+    os.environ.setdefault('LIMITE_ACTIVO', '0')
+    # Cola de hashing para todos los clientes: si no, el login previo recibe 503 y se miden 401
+    os.environ.setdefault('HASH_COLA_MAX', str(max(args.concurrencia, 4 * (os.cpu_count() or 1))))
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from werkzeug.serving import make_server
+    from servidor import app
+    from migraciones import migrar
+
+    # Sin el log de cada petición de werkzeug
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    migrar()
+    usuarios = sembrar(os.environ['DB_PATH'], args.usuarios, args.tareas)
+    servidor_http = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=servidor_http.serve_forever, daemon=True).start()
+    puerto = servidor_http.server_port
+
+    operaciones = Operaciones(usuarios)
+    resultado = {
+        'entorno': {
+            'python': platform.python_version(),
+            'flask': version('flask'),
+            'werkzeug': version('werkzeug'),
+            'sqlite': sqlite3.sqlite_version,
+            'cpus': os.cpu_count(),
+            'fragmentos': int(os.environ.get('DB_FRAGMENTOS', '0')),
+            'plataforma': platform.platform(),
+        },
+        'parametros': {
+            'usuarios': args.usuarios,
+            'tareas': args.tareas,
+            'concurrencia': args.concurrencia,
+            'duracion': args.duracion,
+            'semilla': args.semilla,
+        },
+        'escenarios': {},
+    }
+    try:
+        for nombre in escenarios:
+            medido = ejecutar_escenario(nombre, puerto, operaciones, args.concurrencia, args.duracion)
+            resultado['escenarios'][nombre] = medido
+            print(f"{nombre:10} {medido['rps']:>10.2f} rps  p50 {medido['p50_ms']:>9.3f} ms  "
+                  f"p95 {medido['p95_ms']:>9.3f} ms  p99 {medido['p99_ms']:>9.3f} ms  "
+                  f"errores {medido['errores']}", file=sys.stderr)
+    except RuntimeError as e:
+        print(f'ERROR {e}', file=sys.stderr)
+        return 1
+    finally:
+        servidor_http.shutdown()
+
+    texto = json.dumps(resultado, indent=2, ensure_ascii=False)
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as archivo:
+            archivo.write(texto + '\n')
+    else:
+        print(texto)
+
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as archivo:
+            base = json.load(archivo)
+        regresiones = comparar(base, resultado, args.umbral)
+        for regresion in regresiones:
+            print(f'REGRESIÓN {regresion}', file=sys.stderr)
+        if regresiones:
+            return 1
+        print('Sin regresiones respecto de la línea base', file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
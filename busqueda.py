@@ -0,0 +1,114 @@
+"""Búsqueda de texto completo sobre las tareas (SQLite FTS5)
+
+El índice `tareas_fts` (migración 4) es una tabla FTS5 de contenido externo: no
+duplica el texto de `tareas` y los triggers lo mantienen sincronizado. El
+usuario_id se indexa como una columna más para que el filtro por usuario sea
+parte de la consulta FTS y no un recorrido posterior.
+
+    python busqueda.py --reconstruir   # reindexa todas las filas de tareas
+    python busqueda.py --optimizar     # fusiona los segmentos del índice
+"""
+import argparse
+import html
+import re
+import sys
+
+from base_datos import pools_tareas
+
+# "frase exacta", "frase"*, palabra o prefijo*
+_TERMINO = re.compile(r'"([^"]*)"(\*?)|(\S+)')
+# Marcadores que no pueden venir del texto; se convierten en <mark> después de escapar el HTML
+_INICIO, _FIN = '\x02', '\x03'
+TERMINOS_MAX = 16
+
+
+def _citar(texto):
+    return '"' + texto.replace('"', '""') + '"'
+
+
+def consulta_fts(texto):
+    """Traduce lo que escribió el usuario a una expresión FTS5 segura (sin operadores propios)"""
+    partes = []
+    for frase, prefijo_frase, palabra in _TERMINO.findall(texto or ''):
+        if palabra:
+            prefijo = palabra.endswith('*')
+            frase = palabra.rstrip('*').replace('"', '')
+        else:
+            prefijo = bool(prefijo_frase)
+        if not frase.strip():
+            continue
+        partes.append(_citar(frase) + (' *' if prefijo else ''))
+    if not partes:
+        raise ValueError('La búsqueda está vacía')
+    if len(partes) > TERMINOS_MAX:
+        raise ValueError(f'La búsqueda admite como máximo {TERMINOS_MAX} términos')
+    return ' '.join(partes)
+
+
+def _marcar(texto):
+    if texto is None:
+        return None
+    return html.escape(texto).replace(_INICIO, '<mark>').replace(_FIN, '</mark>')
+
+
+ORDENES = {
+    'relevancia': 'rank',
+    # Sin BM25: evita leer las estadísticas globales de cada término (útil con palabras muy comunes)
+    'reciente': 'tareas_fts.rowid DESC',
+}
+
+
+def buscar(conn, usuario_id, texto, limite, orden='relevancia'):
+    """Tareas del usuario que coinciden con la búsqueda, por relevancia (BM25) o de la más nueva a la más vieja"""
+    if orden not in ORDENES:
+        raise ValueError(f'Orden desconocido: {orden} (usar {" o ".join(ORDENES)})')
+    expresion = f'usuario_id : {_citar(str(int(usuario_id)))} AND {{titulo descripcion}} : ({consulta_fts(texto)})'
+    filas = conn.execute(
+        'SELECT t.id, t.titulo, t.descripcion, t.completada, t.fecha_creacion, '
+        f"highlight(tareas_fts, 0, '{_INICIO}', '{_FIN}') AS titulo_resaltado, "
+        f"snippet(tareas_fts, 1, '{_INICIO}', '{_FIN}', '…', 12) AS fragmento "
+        'FROM tareas_fts JOIN tareas t ON t.id = tareas_fts.rowid '
+        f'WHERE tareas_fts MATCH ? ORDER BY {ORDENES[orden]} LIMIT ?', (expresion, limite)).fetchall()
+    resultados = []
+    for fila in filas:
+        tarea = dict(fila)
+        tarea['completada'] = bool(tarea['completada'])
+        tarea['titulo_resaltado'] = _marcar(tarea['titulo_resaltado'])
+        tarea['fragmento'] = _marcar(tarea['fragmento']) if tarea['descripcion'] else None
+        resultados.append(tarea)
+    return resultados
+
+
+def reconstruir():
+    """Vuelve a indexar todas las filas de `tareas` (p. ej. después de cargarlas por fuera de la app)"""
+    total = 0
+    for pool in pools_tareas():
+        with pool.conexion() as conn:
+            conn.execute("INSERT INTO tareas_fts (tareas_fts) VALUES ('rebuild')")
+            total += conn.execute('SELECT count(*) FROM tareas').fetchone()[0]
+    return total
+
+
+def optimizar():
+    for pool in pools_tareas():
+        with pool.conexion() as conn:
+            conn.execute("INSERT INTO tareas_fts (tareas_fts) VALUES ('optimize')")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Mantenimiento del índice de búsqueda de tareas')
+    parser.add_argument('--reconstruir', action='store_true', help='reindexar todas las tareas')
+    parser.add_argument('--optimizar', action='store_true', help='fusionar los segmentos del índice')
+    args = parser.parse_args(argv)
+    if not (args.reconstruir or args.optimizar):
+        parser.error('indicar --reconstruir y/o --optimizar')
+    if args.reconstruir:
+        print(f'✅ Índice reconstruido: {reconstruir()} tareas')
+    if args.optimizar:
+        optimizar()
+        print('✅ Índice optimizado')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,245 @@
+"""Cola de escritura con commit agrupado (group commit)
+
+Con ESCRITURA_AGRUPADA=1 los INSERT/UPDATE/DELETE de las peticiones no hacen su
+propio commit: se encolan y un único hilo escritor los ejecuta juntos en una
+transacción cada ESCRITURA_ESPERA_MS milisegundos o cada ESCRITURA_LOTE_MAX
+operaciones. Cada llamador recibe su propio resultado (o su propia excepción,
+p. ej. IntegrityError) recién después del COMMIT, así que la durabilidad es la misma.
+Si una sentencia aborta la transacción entera, el lote se repite de a una
+sentencia por transacción y solo esa sentencia recibe el error. Una operación
+cuyo llamador agotó ESCRITURA_TIMEOUT antes de que el escritor la tome se
+descarta (503 sin escribir nada); si ya la tomó, el llamador espera su commit.
+"""
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FuturoTimeout
+
+from base_datos import pool, pool_de, todos_los_pools
+from metricas import percentil
+
+# Configuración de la cola (se puede cambiar con variables de entorno)
+ESCRITURA_AGRUPADA = os.environ.get('ESCRITURA_AGRUPADA', '0') == '1'
+ESCRITURA_LOTE_MAX = int(os.environ.get('ESCRITURA_LOTE_MAX', '256'))  # operaciones por transacción
+ESCRITURA_ESPERA_MS = float(os.environ.get('ESCRITURA_ESPERA_MS', '2'))  # espera máxima para juntar un lote
+ESCRITURA_COLA_MAX = int(os.environ.get('ESCRITURA_COLA_MAX', '10000'))  # operaciones en espera antes de 503
+ESCRITURA_TIMEOUT = float(os.environ.get('ESCRITURA_TIMEOUT', '10'))  # segundos máximos esperando el commit
+ESCRITURA_RETRY_AFTER = int(os.environ.get('ESCRITURA_RETRY_AFTER', '1'))
+MUESTRAS_LATENCIA = 2048
+
+
+class EscrituraSaturada(Exception):
+    """La cola de escritura está llena o el commit no llegó a tiempo"""
+
+    def __init__(self, retry_after=ESCRITURA_RETRY_AFTER):
+        super().__init__('Cola de escritura saturada')
+        self.retry_after = retry_after
+
+
+def _ejecutar(conn, sql, parametros, si_cambia):
+    """Una operación dentro de la transacción en curso; devuelve (lastrowid, rowcount)
+
+    si_cambia es (sql, parámetros) de una sentencia más (p. ej. el evento de la tarea) que
+    se ejecuta solo si la primera cambió filas; un savepoint hace que sean una sola cosa.
+    """
+    if si_cambia is None:
+        cursor = conn.execute(sql, parametros)
+        return cursor.lastrowid, cursor.rowcount
+    conn.execute('SAVEPOINT operacion')
+    try:
+        cursor = conn.execute(sql, parametros)
+        resultado = (cursor.lastrowid, cursor.rowcount)
+        if cursor.rowcount > 0:
+            conn.execute(*si_cambia)
+    except sqlite3.Error:
+        if conn.in_transaction:
+            conn.execute('ROLLBACK TO operacion')
+            conn.execute('RELEASE operacion')
+        raise
+    conn.execute('RELEASE operacion')
+    return resultado
+
+
+class ColaEscritura:
+    def __init__(self, pool_destino=pool, lote_max=ESCRITURA_LOTE_MAX, espera_ms=ESCRITURA_ESPERA_MS,
+                 cola_max=ESCRITURA_COLA_MAX, timeout=ESCRITURA_TIMEOUT):
+        self.pool = pool_destino
+        self.lote_max = lote_max
+        self.espera = espera_ms / 1000
+        self.cola_max = cola_max
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._cola = None
+        self._hilo = None
+        self._pid = None
+        self._operaciones = 0
+        self._errores = 0
+        self._rechazadas = 0
+        self._timeouts = 0
+        self._canceladas = 0
+        self._lotes = 0
+        self._lote_mayor = 0
+        self._lotes_repetidos = 0
+        self._latencias = deque(maxlen=MUESTRAS_LATENCIA)
+
+    def _obtener_cola(self):
+        # El hilo escritor se crea al primer uso y se recrea después de un fork
+        with self._lock:
+            if self._hilo is None or self._pid != os.getpid():
+                self._cola = queue.Queue(maxsize=self.cola_max)
+                self._pid = os.getpid()
+                self._hilo = threading.Thread(target=self._escritor, args=(self._cola,),
+                                              name='cola-escritura', daemon=True)
+                self._hilo.start()
+            return self._cola
+
+    def ejecutar(self, sql, parametros=(), si_cambia=None):
+        """Encola una sentencia y espera su commit; devuelve (lastrowid, rowcount)"""
+        futuro = Future()
+        try:
+            self._obtener_cola().put_nowait((sql, parametros, si_cambia, futuro, time.perf_counter()))
+        except queue.Full:
+            with self._lock:
+                self._rechazadas += 1
+            raise EscrituraSaturada()
+        try:
+            return futuro.result(timeout=self.timeout)
+        except FuturoTimeout:
+            with self._lock:
+                self._timeouts += 1
+            # Si el escritor ya la tomó, se espera su resultado: responder 503 a algo que
+            # se guarda después haría que el reintento del cliente la duplique
+            if not futuro.cancel():
+                return futuro.result()
+            raise EscrituraSaturada()
+
+    def _juntar_lote(self, cola):
+        lote = [cola.get()]
+        limite = time.perf_counter() + self.espera
+        while len(lote) < self.lote_max:
+            restante = limite - time.perf_counter()
+            try:
+                lote.append(cola.get(timeout=restante) if restante > 0 else cola.get_nowait())
+            except queue.Empty:
+                break
+        return lote
+
+    def _escritor(self, cola):
+        while True:
+            lote = self._juntar_lote(cola)
+            # Las operaciones cuyo llamador ya se rindió (timeout) no se escriben
+            vivas = [operacion for operacion in lote if operacion[3].set_running_or_notify_cancel()]
+            if len(vivas) < len(lote):
+                with self._lock:
+                    self._canceladas += len(lote) - len(vivas)
+                lote = vivas
+                if not lote:
+                    continue
+            try:
+                resultados = self._escribir_lote(lote)
+            except Exception as e:
+                # Falló el BEGIN o el COMMIT: ninguna operación del lote quedó guardada
+                resultados = [e] * len(lote)
+            fin = time.perf_counter()
+            errores = 0
+            for (_, _, _, futuro, encolada), resultado in zip(lote, resultados):
+                if isinstance(resultado, Exception):
+                    errores += 1
+                    futuro.set_exception(resultado)
+                else:
+                    futuro.set_result(resultado)
+                self._latencias.append(fin - encolada)
+            with self._lock:
+                self._lotes += 1
+                self._operaciones += len(lote)
+                self._errores += errores
+                self._lote_mayor = max(self._lote_mayor, len(lote))
+
+    def _escribir_lote(self, lote):
+        resultados = []
+        with self.pool.conexion() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            for sql, parametros, si_cambia, _, _ in lote:
+                try:
+                    resultados.append(_ejecutar(conn, sql, parametros, si_cambia))
+                except sqlite3.Error as e:
+                    # Un error de restricción solo deshace su sentencia; si SQLite abortó la
+                    # transacción entera, lo ya ejecutado se perdió y se repite de a una
+                    if not conn.in_transaction:
+                        with self._lock:
+                            self._lotes_repetidos += 1
+                        return self._escribir_de_a_una(conn, lote)
+                    resultados.append(e)
+            conn.commit()
+        return resultados
+
+    def _escribir_de_a_una(self, conn, lote):
+        """Cada sentencia en su propia transacción: el error de una no llega a las demás"""
+        resultados = []
+        for sql, parametros, si_cambia, _, _ in lote:
+            try:
+                conn.execute('BEGIN IMMEDIATE')
+                resultado = _ejecutar(conn, sql, parametros, si_cambia)
+                conn.commit()
+            except sqlite3.Error as e:
+                if conn.in_transaction:
+                    conn.rollback()
+                resultado = e
+            resultados.append(resultado)
+        return resultados
+
+    def estadisticas(self):
+        with self._lock:
+            latencias = sorted(self._latencias)
+            datos = {
+                'activa': True,
+                'lote_max': self.lote_max,
+                'espera_ms': self.espera * 1000,
+                'cola_max': self.cola_max,
+                'en_cola': self._cola.qsize() if self._cola is not None and self._pid == os.getpid() else 0,
+                'operaciones': self._operaciones,
+                'errores': self._errores,
+                'rechazadas': self._rechazadas,
+                'timeouts': self._timeouts,
+                'canceladas': self._canceladas,
+                'lotes': self._lotes,
+                'lote_promedio': round(self._operaciones / self._lotes, 2) if self._lotes else 0,
+                'lote_mayor': self._lote_mayor,
+                'lotes_repetidos': self._lotes_repetidos,
+            }
+        datos['latencia_ms'] = {
+            'p50': round(percentil(latencias, 50) * 1000, 3),
+            'p95': round(percentil(latencias, 95) * 1000, 3),
+            'p99': round(percentil(latencias, 99) * 1000, 3),
+        }
+        return datos
+
+
+# Un escritor por base: la de DB_PATH y, con almacenamiento fragmentado, uno por fragmento
+colas = {p: ColaEscritura(p) for p in todos_los_pools()} if ESCRITURA_AGRUPADA else {}
+cola_escritura = colas.get(pool)
+
+
+def escribir(sql, parametros=(), usuario_id=None, si_cambia=None):
+    """Ejecuta una sentencia de escritura (agrupada si ESCRITURA_AGRUPADA=1); devuelve (lastrowid, rowcount)
+
+    Con usuario_id se escribe en la base de las tareas de ese usuario (su fragmento).
+    si_cambia: (sql, parámetros) que se confirma en la misma transacción si la sentencia cambió filas.
+    """
+    destino = pool if usuario_id is None else pool_de(usuario_id)
+    if colas:
+        return colas[destino].ejecutar(sql, parametros, si_cambia)
+    with destino.conexion() as conn:
+        return _ejecutar(conn, sql, parametros, si_cambia)
+
+
+def estadisticas():
+    if cola_escritura is None:
+        return {'activa': False}
+    datos = cola_escritura.estadisticas()
+    if len(colas) > 1:
+        datos['fragmentos'] = {str(i): c.estadisticas() for i, c in enumerate(list(colas.values())[1:])}
+    return datos
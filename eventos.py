@@ -0,0 +1,252 @@
+"""Eventos de cambios en las tareas (Server-Sent Events)
+
+Cada escritura de tareas inserta su evento en la tabla `eventos` (migración 7) en
+la misma transacción que cambia las tareas: se confirman juntos o ninguno. Su id
+AUTOINCREMENT es global y creciente, así que sirve de `id:` del SSE y un cliente
+puede reanudar con Last-Event-ID aunque se reconecte a otro worker. En cada proceso
+un único hilo lee los eventos nuevos y los reparte a los suscriptores de ese
+usuario; el hilo se despierta en cuanto el mismo proceso confirma una escritura
+(avisar) y, para las de otros workers, consulta la tabla cada EVENTOS_SONDEO
+segundos. Las filas viejas las borra el mantenimiento (trabajo `eventos`).
+
+Un suscriptor es solo una cola y una función para despertarlo: en el modo ASGI
+miles de conexiones abiertas son corrutinas, no hilos.
+
+Con almacenamiento fragmentado cada fragmento tiene su tabla, su hub y su hilo
+lector (hub_de); todos los eventos de un usuario están en el mismo fragmento.
+"""
+import json
+import os
+import threading
+from collections import deque
+
+from base_datos import pool, pool_de, todos_los_pools
+
+# Configuración de los eventos (se puede cambiar con variables de entorno)
+EVENTOS_BUFFER = int(os.environ.get('EVENTOS_BUFFER', '2048'))  # eventos recientes en memoria para reanudar
+EVENTOS_RETENCION = int(os.environ.get('EVENTOS_RETENCION', '100000'))  # filas que se conservan en la tabla
+EVENTOS_SONDEO = float(os.environ.get('EVENTOS_SONDEO', '0.25'))  # segundos entre lecturas de la tabla
+EVENTOS_LATIDO = float(os.environ.get('EVENTOS_LATIDO', '15'))  # segundos entre latidos al cliente
+EVENTOS_SUSCRIPTORES_MAX = int(os.environ.get('EVENTOS_SUSCRIPTORES_MAX', '10000'))  # por proceso
+PENDIENTES_MAX = 1000  # eventos sin enviar por suscriptor antes de pedirle que recargue
+
+SQL_EVENTO = 'INSERT INTO eventos (usuario_id, tipo, datos) VALUES (?, ?, ?)'
+# La tarea como la devuelve la API (completada booleana), armada por SQLite en la misma transacción.
+# Sin id (None) es la que se acaba de insertar con AUTOINCREMENT
+SQL_EVENTO_TAREA = (
+    'INSERT INTO eventos (usuario_id, tipo, datos) '
+    "SELECT usuario_id, ?, json_object('id', id, 'titulo', titulo, 'descripcion', descripcion, "
+    "'completada', json(CASE WHEN completada THEN 'true' ELSE 'false' END), 'fecha_creacion', fecha_creacion) "
+    'FROM tareas WHERE id = coalesce(?, last_insert_rowid()) AND usuario_id = ?')
+
+
+class DemasiadosSuscriptores(Exception):
+    """Se alcanzó EVENTOS_SUSCRIPTORES_MAX en este proceso"""
+
+
+class Suscripcion:
+    def __init__(self, usuario_id, despertar):
+        self.usuario_id = usuario_id
+        self.despertar = despertar  # se llama desde el hilo lector: debe ser thread-safe
+        self.pendientes = deque()
+        self.desbordada = False
+
+    def tomar(self):
+        """Eventos acumulados (id, tipo, datos); None si se perdieron eventos y hay que recargar"""
+        if self.desbordada:
+            # El cliente recibe `reiniciar` una vez y sigue conectado desde este punto
+            self.desbordada = False
+            return None
+        eventos = []
+        while self.pendientes:
+            eventos.append(self.pendientes.popleft())
+        return eventos
+
+
+class HubEventos:
+    def __init__(self, pool_eventos=pool, buffer=EVENTOS_BUFFER, sondeo=EVENTOS_SONDEO,
+                 suscriptores_max=EVENTOS_SUSCRIPTORES_MAX):
+        self.pool = pool_eventos
+        self.sondeo = sondeo
+        self.suscriptores_max = suscriptores_max
+        self._lock = threading.Lock()
+        self._aviso = threading.Event()
+        self._buffer = deque(maxlen=buffer)
+        self._por_usuario = {}
+        self._suscriptores = 0
+        self._hilo = None
+        self._pid = None
+        self._ultimo_id = 0
+        self._publicados = 0
+        self._entregados = 0
+        self._reinicios = 0
+
+    def avisar(self, cantidad=1):
+        """Despierta al hilo lector después del commit de una escritura con eventos"""
+        with self._lock:
+            self._publicados += cantidad
+        self._aviso.set()
+
+    def _iniciar_lector(self):
+        # Un hilo lector por proceso, creado con el primer suscriptor y recreado después de un fork
+        if self._hilo is None or self._pid != os.getpid():
+            self._buffer.clear()
+            self._por_usuario = {}
+            self._suscriptores = 0
+            self._aviso = threading.Event()
+            with self.pool.conexion() as conn:
+                self._ultimo_id = conn.execute('SELECT coalesce(max(id), 0) FROM eventos').fetchone()[0]
+            self._pid = os.getpid()
+            self._hilo = threading.Thread(target=self._leer, name='eventos', daemon=True)
+            self._hilo.start()
+
+    def suscribir(self, usuario_id, despertar, desde=None):
+        """Devuelve (suscripción, eventos a reenviar desde Last-Event-ID; None si ya no están)"""
+        with self._lock:
+            self._iniciar_lector()
+            if self._suscriptores >= self.suscriptores_max:
+                raise DemasiadosSuscriptores()
+            suscripcion = Suscripcion(usuario_id, despertar)
+            self._por_usuario.setdefault(usuario_id, set()).add(suscripcion)
+            self._suscriptores += 1
+            ultimo = self._ultimo_id
+            if desde is None or desde >= ultimo:
+                return suscripcion, []
+            if self._buffer and desde >= self._buffer[0][0] - 1:
+                return suscripcion, [e[:1] + e[2:] for e in self._buffer if e[0] > desde and e[1] == usuario_id]
+        # Más viejo que el buffer: se busca en la tabla (hasta el último evento ya repartido)
+        with self.pool.conexion() as conn:
+            primero = conn.execute('SELECT min(id) FROM eventos').fetchone()[0]
+            if primero is None or desde < primero - 1:
+                with self._lock:
+                    self._reinicios += 1
+                return suscripcion, None
+            filas = conn.execute('SELECT id, tipo, datos FROM eventos WHERE usuario_id = ? AND id > ? AND id <= ? '
+                                 'ORDER BY id', (usuario_id, desde, ultimo)).fetchall()
+        return suscripcion, [(f[0], f[1], json.loads(f[2])) for f in filas]
+
+    def desuscribir(self, suscripcion):
+        with self._lock:
+            suscripciones = self._por_usuario.get(suscripcion.usuario_id)
+            if suscripciones and suscripcion in suscripciones:
+                suscripciones.discard(suscripcion)
+                self._suscriptores -= 1
+                if not suscripciones:
+                    del self._por_usuario[suscripcion.usuario_id]
+
+    def _leer(self):
+        while True:
+            self._aviso.wait(self.sondeo)
+            self._aviso.clear()
+            try:
+                with self.pool.conexion() as conn:
+                    filas = conn.execute('SELECT id, usuario_id, tipo, datos FROM eventos WHERE id > ? '
+                                         'ORDER BY id LIMIT 1000', (self._ultimo_id,)).fetchall()
+            except Exception:
+                # Base ocupada o pool agotado: se reintenta en el próximo sondeo
+                continue
+            if filas:
+                self._repartir(filas)
+
+    def _repartir(self, filas):
+        despertar = []
+        with self._lock:
+            for id_evento, usuario_id, tipo, datos in filas:
+                evento = (id_evento, tipo, json.loads(datos))
+                self._buffer.append((id_evento, usuario_id, tipo, evento[2]))
+                self._ultimo_id = id_evento
+                for suscripcion in self._por_usuario.get(usuario_id, ()):
+                    if len(suscripcion.pendientes) >= PENDIENTES_MAX:
+                        suscripcion.desbordada = True
+                        suscripcion.pendientes.clear()
+                    elif not suscripcion.desbordada:
+                        suscripcion.pendientes.append(evento)
+                        self._entregados += 1
+                    despertar.append(suscripcion)
+        for suscripcion in despertar:
+            try:
+                suscripcion.despertar()
+            except RuntimeError:
+                # El event loop del suscriptor ya se cerró; se quita al terminar su respuesta
+                pass
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                'suscriptores': self._suscriptores if self._pid == os.getpid() else 0,
+                'suscriptores_max': self.suscriptores_max,
+                'publicados': self._publicados,
+                'entregados': self._entregados,
+                'reinicios': self._reinicios,
+                'en_buffer': len(self._buffer),
+                'ultimo_id': self._ultimo_id,
+            }
+
+
+# Un hub por base con tareas: DB_PATH o cada fragmento
+hubs = {p: HubEventos(p) for p in todos_los_pools()}
+
+
+def hub_de(usuario_id):
+    """Hub de la base donde están las tareas (y los eventos) del usuario"""
+    return hubs[pool_de(usuario_id)]
+
+
+def sentencia_evento(usuario_id, tipo, datos):
+    """(sql, parámetros) que inserta un evento, para ejecutar en la transacción de la escritura"""
+    return SQL_EVENTO, (usuario_id, tipo, json.dumps(datos, ensure_ascii=False))
+
+
+def sentencia_evento_tarea(usuario_id, tipo, tarea_id=None):
+    """(sql, parámetros) de un evento con la tarea tal como queda en la misma transacción"""
+    return SQL_EVENTO_TAREA, (tipo, tarea_id, usuario_id)
+
+
+def guardar(conn, usuario_id, tipo, datos):
+    """Inserta un evento en una transacción ya abierta (transaccion()); avisar() después del commit"""
+    conn.execute(*sentencia_evento(usuario_id, tipo, datos))
+
+
+def avisar(usuario_id, cantidad=1):
+    hub_de(usuario_id).avisar(cantidad)
+
+
+def podar(conn, retencion=EVENTOS_RETENCION):
+    """Borra los eventos más viejos que los últimos `retencion`; devuelve cuántos"""
+    return conn.execute('DELETE FROM eventos WHERE id <= (SELECT max(id) FROM eventos) - ?',
+                        (retencion,)).rowcount
+
+
+def suscribir(usuario_id, despertar, desde=None):
+    return hub_de(usuario_id).suscribir(usuario_id, despertar, desde)
+
+
+def desuscribir(suscripcion):
+    hub_de(suscripcion.usuario_id).desuscribir(suscripcion)
+
+
+def estadisticas():
+    """Estadísticas del hub de DB_PATH o, con fragmentos, la suma de los hubs de cada uno"""
+    if len(hubs) == 1:
+        return hubs[pool].estadisticas()
+    por_fragmento = [h.estadisticas() for p, h in hubs.items() if p is not pool]
+    datos = {clave: sum(e[clave] for e in por_fragmento)
+             for clave in ('suscriptores', 'publicados', 'entregados', 'reinicios', 'en_buffer')}
+    datos['suscriptores_max'] = por_fragmento[0]['suscriptores_max']
+    return datos
+
+
+def formatear(id_evento, tipo, datos):
+    """Un evento en formato text/event-stream"""
+    return f'id: {id_evento}\nevent: {tipo}\ndata: {json.dumps(datos, ensure_ascii=False)}\n\n'.encode('utf-8')
+
+
+# Se envía cuando no se pueden reenviar los eventos perdidos: el cliente debe volver a pedir la lista
+REINICIAR = b'event: reiniciar\ndata: {}\n\n'
+LATIDO = b': latido\n\n'
+INICIO = b'retry: 3000\n\n'
+
+
+def ultimo_id_cliente(valor):
+    """Last-Event-ID (cabecera o ?desde=) como entero, o None"""
+    return int(valor) if valor and valor.strip().isdigit() else None
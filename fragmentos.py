@@ -0,0 +1,242 @@
+"""Almacenamiento fragmentado: tareas repartidas en N archivos SQLite
+
+Con DB_FRAGMENTOS=N las tareas, sus contadores (resumen_tareas), el índice de
+búsqueda y los eventos de cada usuario viven en `fragmento_<i>.db` dentro de
+DB_FRAGMENTOS_DIR, con i = fragmento_de(usuario_id, N). DB_PATH queda como
+directorio: usuarios (búsqueda por nombre en el login), sesiones y configuración.
+Cada fragmento tiene su propio pool, su propio escritor y su propio lock de
+escritura de SQLite, así las escrituras de usuarios distintos no se esperan.
+
+El número de fragmentos se guarda en el directorio y el servidor no arranca si
+DB_FRAGMENTOS no coincide. Para cambiarlo, con los servidores detenidos:
+
+    python fragmentos.py --estado
+    python fragmentos.py --rebalancear 8 --destino datos_8   # luego DB_FRAGMENTOS=8 DB_FRAGMENTOS_DIR=datos_8
+    python fragmentos.py --rebalancear 0                     # volver a una sola base
+"""
+import argparse
+import os
+import sqlite3
+import sys
+from collections import defaultdict
+
+from base_datos import (DB_FRAGMENTOS, DB_FRAGMENTOS_DIR, DB_PATH, conexion, fragmento_de, fragmentos,
+                        ruta_fragmento)
+
+COLUMNAS = ('id', 'usuario_id', 'titulo', 'descripcion', 'completada', 'fecha_creacion')
+TROZO = 10000  # tareas copiadas por transacción al rebalancear
+
+
+class DistribucionInvalida(RuntimeError):
+    """DB_FRAGMENTOS no coincide con la distribución guardada en DB_PATH"""
+
+
+def _leer_cantidad(conn):
+    fila = conn.execute("SELECT valor FROM configuracion WHERE clave = 'fragmentos'").fetchone()
+    return int(fila[0]) if fila else 0
+
+
+def _guardar_cantidad(conn, cantidad):
+    conn.execute("INSERT INTO configuracion (clave, valor) VALUES ('fragmentos', ?) "
+                 'ON CONFLICT (clave) DO UPDATE SET valor = excluded.valor', (str(cantidad),))
+
+
+def _ultimo_id(conn, tabla):
+    """Mayor id entregado por AUTOINCREMENT (aunque la fila ya se haya borrado)"""
+    fila = conn.execute('SELECT seq FROM sqlite_sequence WHERE name = ?', (tabla,)).fetchone()
+    return max(fila[0] if fila else 0, conn.execute(f'SELECT coalesce(max(id), 0) FROM {tabla}').fetchone()[0])
+
+
+def _ajustar_secuencia(conn, ultimo):
+    """La reserva de ids de tareas (base_datos.nuevos_ids) sigue después de `ultimo`"""
+    conn.execute("INSERT INTO secuencias (nombre, valor) VALUES ('tareas', ?) "
+                 'ON CONFLICT (nombre) DO UPDATE SET valor = max(valor, excluded.valor)', (ultimo,))
+
+
+def verificar():
+    """Al arrancar: DB_FRAGMENTOS debe coincidir con lo guardado (un directorio nuevo se inicializa)"""
+    with conexion() as conn:
+        guardado = conn.execute("SELECT valor FROM configuracion WHERE clave = 'fragmentos'").fetchone()
+        if guardado is None and DB_FRAGMENTOS:
+            if conn.execute('SELECT 1 FROM tareas LIMIT 1').fetchone():
+                raise DistribucionInvalida(f'{DB_PATH} tiene tareas en una sola base: repartirlas con '
+                                           f'python fragmentos.py --rebalancear {DB_FRAGMENTOS}')
+            conn.execute('BEGIN IMMEDIATE')
+            _guardar_cantidad(conn, DB_FRAGMENTOS)
+            _ajustar_secuencia(conn, _ultimo_id(conn, 'tareas'))
+            conn.commit()
+            return
+        cantidad = int(guardado[0]) if guardado else 0
+    if cantidad != DB_FRAGMENTOS:
+        raise DistribucionInvalida(f'{DB_PATH} está repartida en {cantidad} fragmentos y DB_FRAGMENTOS={DB_FRAGMENTOS}')
+
+
+def _abrir(ruta):
+    from migraciones import aplicar
+    directorio = os.path.dirname(ruta)
+    if directorio:
+        os.makedirs(directorio, exist_ok=True)
+    conn = sqlite3.connect(ruta, isolation_level=None)
+    conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+    conn.execute('PRAGMA journal_mode=WAL')
+    aplicar(conn)
+    return conn
+
+
+def rebalancear(cantidad, destino=None, origen=DB_FRAGMENTOS_DIR, trozo=TROZO):
+    """Copia las tareas de cada usuario a su fragmento en una distribución de `cantidad` archivos
+
+    Los servidores deben estar detenidos. Los ids de las tareas no cambian; la versión de cada
+    usuario (ETag) sube para que ningún cliente reutilice una respuesta de antes del cambio.
+    """
+    directorio = _abrir(DB_PATH)
+    try:
+        actual = _leer_cantidad(directorio)
+        if cantidad and not destino:
+            raise ValueError('Indicar el directorio destino de los fragmentos')
+        if cantidad and actual and os.path.abspath(destino) == os.path.abspath(origen):
+            raise ValueError('El destino debe ser un directorio distinto del de los fragmentos actuales')
+        rutas_origen = [DB_PATH] if not actual else [ruta_fragmento(origen, i) for i in range(actual)]
+        for ruta in rutas_origen:
+            if not os.path.exists(ruta):
+                raise ValueError(f'No existe {ruta}')
+        rutas_destino = [DB_PATH] if not cantidad else [ruta_fragmento(destino, i) for i in range(cantidad)]
+        if actual == cantidad == 0:
+            return {'usuarios': 0, 'tareas': 0, 'por_fragmento': []}
+        if cantidad:
+            for ruta in rutas_destino:
+                if os.path.exists(ruta) and os.path.getsize(ruta):
+                    raise ValueError(f'{ruta} ya existe: usar un destino vacío')
+
+        origenes = [directorio] if not actual else [_abrir(r) for r in rutas_origen]
+        destinos = [directorio] if not cantidad else [_abrir(r) for r in rutas_destino]
+        try:
+            if not cantidad:
+                # Las tareas que quedaron en el directorio de antes de fragmentar no valen
+                directorio.execute('BEGIN IMMEDIATE')
+                for tabla in ('tareas', 'resumen_tareas', 'eventos'):
+                    directorio.execute(f'DELETE FROM {tabla}')
+                directorio.commit()
+            return _copiar(directorio, actual, cantidad, origenes, destinos, trozo)
+        finally:
+            for conn in set(origenes + destinos) - {directorio}:
+                conn.close()
+    finally:
+        directorio.close()
+
+
+def _copiar(directorio, actual, cantidad, origenes, destinos, trozo):
+    insertar = f'INSERT INTO tareas ({", ".join(COLUMNAS)}) VALUES ({", ".join("?" * len(COLUMNAS))})'
+    versiones = {}
+    ultimo_tarea = ultimo_evento = 0
+    sin_usuario = 0
+    por_fragmento = [0] * len(destinos)
+    for origen in origenes:
+        versiones.update(origen.execute('SELECT usuario_id, version FROM resumen_tareas'))
+        ultimo_tarea = max(ultimo_tarea, _ultimo_id(origen, 'tareas'))
+        ultimo_evento = max(ultimo_evento, _ultimo_id(origen, 'eventos'))
+        ultimo = 0
+        while True:
+            filas = origen.execute(f'SELECT {", ".join(COLUMNAS)} FROM tareas WHERE id > ? ORDER BY id LIMIT ?',
+                                   (ultimo, trozo)).fetchall()
+            if not filas:
+                break
+            ultimo = filas[-1][0]
+            lotes = defaultdict(list)
+            for fila in filas:
+                if fila[1] is None:
+                    sin_usuario += 1
+                    continue
+                lotes[fragmento_de(fila[1], cantidad) if cantidad else 0].append(fila)
+            for indice, lote in lotes.items():
+                # Los triggers completan el índice de búsqueda y los contadores de cada usuario
+                destinos[indice].execute('BEGIN IMMEDIATE')
+                destinos[indice].executemany(insertar, lote)
+                destinos[indice].commit()
+                por_fragmento[indice] += len(lote)
+
+    for destino in destinos:
+        destino.execute('BEGIN IMMEDIATE')
+        destino.executemany('UPDATE resumen_tareas SET version = max(version, ?) + 1 WHERE usuario_id = ?',
+                            [(version, usuario_id) for usuario_id, version in versiones.items()])
+        # Los ids de los eventos siguen creciendo: un Last-Event-ID de antes sigue siendo válido
+        destino.execute("DELETE FROM sqlite_sequence WHERE name = 'eventos'")
+        destino.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('eventos', ?)", (ultimo_evento,))
+        destino.commit()
+
+    directorio.execute('BEGIN IMMEDIATE')
+    _ajustar_secuencia(directorio, ultimo_tarea)
+    _guardar_cantidad(directorio, cantidad)
+    if not actual:
+        # Las tareas ya están en los fragmentos: el directorio se queda solo con usuarios y sesiones
+        for tabla in ('tareas', 'resumen_tareas', 'eventos'):
+            directorio.execute(f'DELETE FROM {tabla}')
+    directorio.commit()
+    return {
+        'usuarios': directorio.execute('SELECT count(*) FROM usuarios').fetchone()[0],
+        'tareas': sum(por_fragmento),
+        'sin_usuario': sin_usuario,
+        'por_fragmento': por_fragmento,
+    }
+
+
+def estado():
+    """Distribución actual: fragmentos, usuarios y tareas de cada uno y tamaño de los archivos"""
+    with conexion() as conn:
+        guardado = _leer_cantidad(conn)
+        usuarios = [0] * max(len(fragmentos), 1)
+        for usuario_id, in conn.execute('SELECT id FROM usuarios'):
+            usuarios[fragmento_de(usuario_id, len(fragmentos)) if fragmentos else 0] += 1
+    pools = fragmentos or [None]
+    filas = []
+    for indice, pool in enumerate(pools):
+        with (pool.conexion() if pool else conexion()) as conn:
+            tareas = conn.execute('SELECT count(*) FROM tareas').fetchone()[0]
+        ruta = pool.ruta if pool else DB_PATH
+        filas.append({'fragmento': indice, 'ruta': ruta, 'usuarios': usuarios[indice], 'tareas': tareas,
+                      'mb': round(os.path.getsize(ruta) / 1e6, 1)})
+    return guardado, filas
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Almacenamiento fragmentado de tareas')
+    parser.add_argument('--estado', action='store_true', help='mostrar la distribución actual')
+    parser.add_argument('--rebalancear', type=int, metavar='N', help='repartir las tareas en N fragmentos (0 = una base)')
+    parser.add_argument('--destino', help='directorio de los nuevos fragmentos')
+    parser.add_argument('--origen', default=DB_FRAGMENTOS_DIR, help='directorio de los fragmentos actuales')
+    args = parser.parse_args(argv)
+    if args.rebalancear is None and not args.estado:
+        parser.error('indicar --estado o --rebalancear N')
+
+    if args.rebalancear is not None:
+        if args.rebalancear < 0:
+            parser.error('N debe ser 0 o mayor')
+        print('⚠️  Los servidores deben estar detenidos durante el rebalanceo', file=sys.stderr)
+        try:
+            resultado = rebalancear(args.rebalancear, args.destino, args.origen)
+        except ValueError as e:
+            parser.error(str(e))
+        print(f"✅ {resultado['tareas']} tareas repartidas en {args.rebalancear or 1} archivo(s): "
+              f"{resultado['por_fragmento']}")
+        if resultado.get('sin_usuario'):
+            print(f"   {resultado['sin_usuario']} tareas sin usuario no se copiaron")
+        if args.rebalancear:
+            print(f'   Arrancar con DB_FRAGMENTOS={args.rebalancear} DB_FRAGMENTOS_DIR={args.destino}')
+        else:
+            print('   Arrancar sin DB_FRAGMENTOS')
+        return 0
+
+    try:
+        guardado, filas = estado()
+    except sqlite3.Error as e:
+        print(f'❌ {e}', file=sys.stderr)
+        return 1
+    print(f'{DB_PATH}: {guardado or "sin"} fragmentos (DB_FRAGMENTOS={DB_FRAGMENTOS})')
+    for fila in filas:
+        print(f"  {fila['fragmento']}: {fila['usuarios']} usuarios, {fila['tareas']} tareas, "
+              f"{fila['mb']} MB ({fila['ruta']})")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,306 @@
+"""Hashing de contraseñas: pool de procesos, política de costo y calibración
+
+La política (método y costo de Werkzeug, p. ej. pbkdf2:sha256:600000) se guarda en
+la tabla `configuracion`, así todos los servidores usan la misma. El primer
+arranque que no la encuentra mide esta máquina y elige el costo más alto cuyo hash
+tarda como mucho HASH_OBJETIVO_MS. Los hashes guardados con otra política se
+rehacen en el próximo login correcto (ver usuarios.autenticar).
+
+    python hashing.py --estado                  # política vigente y hashes por método
+    python hashing.py --calibrar                # medir sin guardar
+    python hashing.py --calibrar --guardar      # nueva política (reiniciar con SIGHUP)
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FuturoTimeout
+from functools import partial
+from werkzeug.security import generate_password_hash, check_password_hash
+from metricas import medir, percentil
+
+# Configuración del servicio de hashing (se puede cambiar con variables de entorno)
+HASH_PROCESOS = int(os.environ.get('HASH_PROCESOS', os.cpu_count() or 1))  # 0 = hashear en el mismo hilo
+HASH_COLA_MAX = int(os.environ.get('HASH_COLA_MAX', str(4 * (os.cpu_count() or 1))))
+HASH_TIMEOUT = float(os.environ.get('HASH_TIMEOUT', '10'))  # segundos máximos esperando un resultado
+HASH_RETRY_AFTER = int(os.environ.get('HASH_RETRY_AFTER', '1'))
+HASH_ALGORITMO = os.environ.get('HASH_ALGORITMO', 'pbkdf2')  # pbkdf2 o scrypt, al calibrar
+HASH_OBJETIVO_MS = float(os.environ.get('HASH_OBJETIVO_MS', '250'))  # latencia buscada por hash
+HASH_METODO = os.environ.get('HASH_METODO')  # fija la política sin calibrar, p. ej. scrypt:32768:8:1
+MUESTRAS_LATENCIA = 2048
+
+# Política mientras no haya una guardada: la de Werkzeug por defecto
+METODO_DEFECTO = 'pbkdf2:sha256:600000'
+# Costo mínimo aunque la máquina sea lenta (iteraciones de PBKDF2, N de scrypt)
+COSTO_MINIMO = {'pbkdf2': 100_000, 'scrypt': 2 ** 14}
+SCRYPT_N_MAX = 2 ** 16  # 64 MiB por hash; más allá del objetivo se sube p (tiempo sin más memoria)
+
+
+class ServicioSaturado(Exception):
+    """La cola de hashing está llena; el cliente debe reintentar más tarde"""
+
+    def __init__(self, retry_after=HASH_RETRY_AFTER):
+        super().__init__('Servicio de hashing saturado')
+        self.retry_after = retry_after
+
+
+class ServicioHash:
+    """Ejecuta generate/check_password_hash en un pool de procesos con control de admisión"""
+
+    def __init__(self, procesos=HASH_PROCESOS, cola_max=HASH_COLA_MAX, timeout=HASH_TIMEOUT):
+        self.procesos = procesos
+        self.cola_max = cola_max
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._disponible = threading.Condition(self._lock)
+        self._executor = None
+        self._pid = None
+        self._pendientes = 0
+        self._completadas = 0
+        self._rechazadas = 0
+        self._timeouts = 0
+        self._rehashes = 0
+        self._rehashes_pospuestos = 0
+        self._latencias = deque(maxlen=MUESTRAS_LATENCIA)
+
+    def _obtener_executor(self):
+        # El pool de procesos se crea al primer uso y se recrea después de un fork
+        if self._executor is None or self._pid != os.getpid():
+            self._executor = ProcessPoolExecutor(max_workers=self.procesos)
+            self._pid = os.getpid()
+        return self._executor
+
+    @contextmanager
+    def _admision(self, cantidad=1, lote=False):
+        limite = max(self.procesos, 1) + self.cola_max
+        with self._disponible:
+            if lote:
+                # Un trozo de lote espera su lugar (como mucho HASH_TIMEOUT) en vez de ser rechazado
+                if not self._disponible.wait_for(lambda: self._pendientes + cantidad <= limite, self.timeout):
+                    self._rechazadas += 1
+                    raise ServicioSaturado()
+            elif self._pendientes + cantidad > limite:
+                self._rechazadas += 1
+                raise ServicioSaturado()
+            self._pendientes += cantidad
+            executor = self._obtener_executor() if self.procesos > 0 else None
+
+        inicio = time.perf_counter()
+        try:
+            with medir('hash'):
+                yield executor
+        finally:
+            duracion = time.perf_counter() - inicio
+            with self._disponible:
+                self._pendientes -= cantidad
+                self._completadas += cantidad
+                # Los lotes no entran en los percentiles para no distorsionarlos
+                if not lote:
+                    self._latencias.append(duracion)
+                self._disponible.notify_all()
+
+    def _ejecutar(self, funcion, *args):
+        with self._admision() as executor:
+            if executor is None:
+                return funcion(*args)
+            try:
+                return executor.submit(funcion, *args).result(timeout=self.timeout)
+            except FuturoTimeout:
+                with self._lock:
+                    self._timeouts += 1
+                raise ServicioSaturado()
+
+    def generar(self, contraseña):
+        return self._ejecutar(generate_password_hash, contraseña, metodo_actual())
+
+    def generar_lote(self, contraseñas):
+        # Cada trozo (un hash por proceso) se admite contra el mismo límite que los logins:
+        # un login que llega durante un lote espera a lo sumo un trozo, no el lote entero
+        contraseñas = list(contraseñas)
+        generar = partial(generate_password_hash, method=metodo_actual())
+        trozo = max(self.procesos, 1)
+        hashes = []
+        for i in range(0, len(contraseñas), trozo):
+            parte = contraseñas[i:i + trozo]
+            with self._admision(len(parte), lote=True) as executor:
+                if executor is None:
+                    hashes.extend(generar(c) for c in parte)
+                    continue
+                try:
+                    hashes.extend(executor.map(generar, parte, timeout=self.timeout))
+                except FuturoTimeout:
+                    with self._lock:
+                        self._timeouts += 1
+                    raise ServicioSaturado()
+        return hashes
+
+    def verificar(self, contraseña_hash, contraseña):
+        return self._ejecutar(check_password_hash, contraseña_hash, contraseña)
+
+    def cerrar(self):
+        """Termina los procesos del pool (un worker que sale con os._exit no los cierra solo)"""
+        with self._lock:
+            executor, self._executor = (self._executor, None) if self._pid == os.getpid() else (None, None)
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def anotar_rehash(self, hecho):
+        with self._lock:
+            if hecho:
+                self._rehashes += 1
+            else:
+                self._rehashes_pospuestos += 1
+
+    def estadisticas(self):
+        with self._lock:
+            latencias = sorted(self._latencias)
+            pendientes = self._pendientes
+            datos = {
+                'procesos': self.procesos,
+                'cola_max': self.cola_max,
+                'pendientes': pendientes,
+                'en_cola': max(0, pendientes - max(self.procesos, 1)),
+                'completadas': self._completadas,
+                'rechazadas': self._rechazadas,
+                'timeouts': self._timeouts,
+                'metodo': _metodo or METODO_DEFECTO,
+                'rehashes': self._rehashes,
+                'rehashes_pospuestos': self._rehashes_pospuestos,
+            }
+        datos['latencia_ms'] = {
+            'p50': round(percentil(latencias, 50) * 1000, 3),
+            'p95': round(percentil(latencias, 95) * 1000, 3),
+            'p99': round(percentil(latencias, 99) * 1000, 3),
+        }
+        return datos
+
+
+servicio_hash = ServicioHash()
+
+
+def repartir_procesos(workers):
+    """Con varios workers cada uno usa su parte de los núcleos (salvo HASH_PROCESOS explícito); antes del fork"""
+    if 'HASH_PROCESOS' not in os.environ and servicio_hash.procesos:
+        servicio_hash.procesos = max(1, (os.cpu_count() or 1) // max(workers, 1))
+    return servicio_hash.procesos
+
+_metodo = None
+
+
+def metodo_actual():
+    """Política vigente; la primera vez se lee de `configuracion` (sin calibrar)"""
+    global _metodo
+    if _metodo is None:
+        from base_datos import conexion
+        with conexion() as conn:
+            _metodo = _leer_guardado(conn) or METODO_DEFECTO
+    return _metodo
+
+
+def necesita_rehash(contraseña_hash):
+    """True si el hash se guardó con un método o costo distinto del vigente"""
+    return contraseña_hash.split('$', 1)[0] != metodo_actual()
+
+
+def canonico(metodo):
+    """'scrypt' -> 'scrypt:32768:8:1': el prefijo exacto que Werkzeug guarda en el hash"""
+    return generate_password_hash('', metodo).split('$', 1)[0]
+
+
+def _medir(metodo, repeticiones=3):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        generate_password_hash('calibracion', metodo)
+        tiempos.append(time.perf_counter() - inicio)
+    return sorted(tiempos)[len(tiempos) // 2]
+
+
+def calibrar(algoritmo=HASH_ALGORITMO, objetivo_ms=HASH_OBJETIVO_MS):
+    """Método con el mayor costo que tarda como mucho objetivo_ms en esta máquina; devuelve (método, ms)"""
+    objetivo = objetivo_ms / 1000
+    minimo = COSTO_MINIMO.get(algoritmo)
+    if algoritmo == 'pbkdf2':
+        # El tiempo es proporcional a las iteraciones
+        iteraciones = int(minimo * objetivo / _medir(f'pbkdf2:sha256:{minimo}')) // 10_000 * 10_000
+        metodo = f'pbkdf2:sha256:{max(minimo, iteraciones)}'
+    elif algoritmo == 'scrypt':
+        # N se duplica (tiempo y memoria) hasta el máximo; después se multiplica p
+        n, duracion = minimo, _medir(f'scrypt:{minimo}:8:1')
+        while n < SCRYPT_N_MAX and duracion * 2 <= objetivo:
+            n, duracion = n * 2, duracion * 2
+        metodo = f'scrypt:{n}:8:{max(1, int(objetivo / duracion))}'
+    else:
+        raise ValueError(f'Algoritmo desconocido: {algoritmo} (usar pbkdf2 o scrypt)')
+    return metodo, round(_medir(metodo) * 1000, 1)
+
+
+def _leer_guardado(conn):
+    fila = conn.execute("SELECT valor FROM configuracion WHERE clave = 'hash_metodo'").fetchone()
+    return fila[0] if fila else None
+
+
+def guardar_politica(metodo, reemplazar=True):
+    """Guarda la política para todos los servidores; devuelve la que quedó guardada"""
+    from base_datos import conexion
+    conflicto = 'DO UPDATE SET valor = excluded.valor' if reemplazar else 'DO NOTHING'
+    with conexion() as conn:
+        conn.execute(f"INSERT INTO configuracion (clave, valor) VALUES ('hash_metodo', ?) ON CONFLICT (clave) {conflicto}",
+                     (metodo,))
+        return _leer_guardado(conn)
+
+
+def preparar_politica():
+    """Al arrancar: usa HASH_METODO, la política guardada o, si no hay, calibra y la guarda; devuelve (método, origen)"""
+    global _metodo
+    if HASH_METODO:
+        _metodo, origen = guardar_politica(canonico(HASH_METODO)), 'HASH_METODO'
+    else:
+        from base_datos import conexion
+        with conexion() as conn:
+            guardado = _leer_guardado(conn)
+        if guardado:
+            _metodo, origen = guardado, 'guardada'
+        else:
+            metodo, ms = calibrar()
+            # Si otro servidor calibró al mismo tiempo, todos se quedan con la primera guardada
+            _metodo, origen = guardar_politica(metodo, reemplazar=False), f'calibrada ({ms} ms)'
+    return _metodo, origen
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Política de hashing de contraseñas')
+    parser.add_argument('--estado', action='store_true', help='política vigente y cantidad de hashes por método')
+    parser.add_argument('--calibrar', action='store_true', help='medir el costo que cumple el objetivo')
+    parser.add_argument('--algoritmo', default=HASH_ALGORITMO, choices=sorted(COSTO_MINIMO))
+    parser.add_argument('--objetivo-ms', type=float, default=HASH_OBJETIVO_MS)
+    parser.add_argument('--guardar', action='store_true', help='guardar la política calibrada')
+    args = parser.parse_args(argv)
+    if not (args.estado or args.calibrar):
+        parser.error('indicar --estado y/o --calibrar')
+
+    from base_datos import conexion
+    from migraciones import migrar
+    migrar()
+    if args.calibrar:
+        metodo, ms = calibrar(args.algoritmo, args.objetivo_ms)
+        print(f'{metodo}: {ms} ms por hash (objetivo {args.objetivo_ms:g} ms)')
+        if args.guardar:
+            guardar_politica(metodo)
+            print('✅ Política guardada; los workers la toman al reiniciarse (SIGHUP) y '
+                  'los hashes se actualizan en el próximo login de cada usuario')
+    if args.estado:
+        with conexion() as conn:
+            print(f'Política: {_leer_guardado(conn) or METODO_DEFECTO + " (por defecto)"}')
+            for metodo, cantidad in conn.execute(
+                    "SELECT substr(contraseña, 1, instr(contraseña, '$') - 1) AS metodo, count(*) "
+                    'FROM usuarios GROUP BY metodo ORDER BY count(*) DESC'):
+                print(f'  {metodo}: {cantidad} usuarios')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,217 @@
+"""Índice en memoria de nombres de usuario (filtro de Bloom + caché LRU)
+
+Cada proceso arma al arrancar un filtro de Bloom con los nombres de `usuarios` y
+lo mantiene al día con sus propios registros y, cada INDICE_REFRESCO segundos, con
+los de otros workers (`id > último visto`). Delante de la tabla hay además una
+caché LRU de filas (id, usuario, hash) para los logins repetidos.
+
+Un "no está" del filtro puede estar atrasado respecto de otro worker, así que nunca
+decide solo: sirve para saltear la verificación previa al registro (el INSERT con
+UNIQUE sigue siendo la verificación final). Un "puede estar" hace esa verificación
+antes de hashear, y un nombre ocupado responde 409 sin gastar un hash. Las filas
+en caché se revalidan contra SQLite después de INDICE_CACHE_TTL segundos y se
+actualizan o descartan cuando cambia la contraseña (rehash del login).
+"""
+import hashlib
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from base_datos import conexion
+
+# Configuración del índice (se puede cambiar con variables de entorno)
+INDICE_USUARIOS = os.environ.get('INDICE_USUARIOS', '1') == '1'
+INDICE_MEMORIA_MB = float(os.environ.get('INDICE_MEMORIA_MB', '8'))  # máximo del filtro de Bloom por proceso
+INDICE_ERROR = float(os.environ.get('INDICE_ERROR', '0.01'))  # tasa de falsos positivos buscada
+INDICE_CACHE_MAX = int(os.environ.get('INDICE_CACHE_MAX', '10000'))  # filas (id, usuario, hash) por proceso
+INDICE_CACHE_TTL = float(os.environ.get('INDICE_CACHE_TTL', '30'))  # segundos antes de revalidar una fila
+INDICE_REFRESCO = float(os.environ.get('INDICE_REFRESCO', '5'))  # segundos entre lecturas de registros nuevos
+CAPACIDAD_MINIMA = 100_000
+
+
+class FiltroBloom:
+    def __init__(self, bits, funciones):
+        self.bits = bits
+        self.funciones = funciones
+        self.elementos = 0
+        self._datos = bytearray((bits + 7) // 8)
+
+    @classmethod
+    def para(cls, capacidad, error, bits_max):
+        """Filtro para `capacidad` nombres con tasa de error `error`, sin pasar de `bits_max` bits"""
+        bits = max(64, min(int(-capacidad * math.log(error) / math.log(2) ** 2), bits_max))
+        return cls(bits, max(1, round(bits / capacidad * math.log(2))))
+
+    def _posiciones(self, nombre):
+        # Doble hashing: k posiciones a partir de un solo digest
+        digest = hashlib.blake2b(nombre.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.funciones)]
+
+    def agregar(self, nombre, contar=True):
+        for posicion in self._posiciones(nombre):
+            self._datos[posicion >> 3] |= 1 << (posicion & 7)
+        self.elementos += contar
+
+    def __contains__(self, nombre):
+        datos = self._datos
+        return all(datos[p >> 3] & (1 << (p & 7)) for p in self._posiciones(nombre))
+
+    @property
+    def bytes(self):
+        return len(self._datos)
+
+
+class IndiceUsuarios:
+    def __init__(self, memoria_mb=INDICE_MEMORIA_MB, error=INDICE_ERROR, cache_max=INDICE_CACHE_MAX,
+                 cache_ttl=INDICE_CACHE_TTL, refresco=INDICE_REFRESCO):
+        self.bits_max = int(memoria_mb * 8 * 1024 * 1024)
+        self.error = error
+        self.cache_max = cache_max
+        self.cache_ttl = cache_ttl
+        self.refresco = refresco
+        self._lock = threading.Lock()
+        self._filtro = None
+        self._capacidad = 0
+        self._pid = None
+        self._ultimo_id = 0
+        self._proximo_refresco = 0
+        # usuario -> (id, usuario, hash, revalidar_en)
+        self._cache = OrderedDict()
+        self._negativos = 0
+        self._positivos = 0
+        self._falsos_positivos = 0
+        self._aciertos = 0
+        self._fallos = 0
+        self._invalidadas = 0
+        self._reconstrucciones = 0
+
+    def preparar(self):
+        """Arma el filtro con todos los nombres (al arrancar cada worker; si no, en el primer uso)"""
+        with self._lock:
+            self._mismo_proceso()
+            self._reconstruir()
+
+    def _mismo_proceso(self):
+        # Después de un fork el filtro y la caché del padre se descartan y se arman de nuevo
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._filtro = None
+            self._cache.clear()
+
+    def _reconstruir(self):
+        with conexion() as conn:
+            cantidad, ultimo = conn.execute('SELECT count(*), coalesce(max(id), 0) FROM usuarios').fetchone()
+            # Lugar para el doble de los usuarios actuales: se rearma solo cuando se llena
+            self._capacidad = max(CAPACIDAD_MINIMA, 2 * cantidad)
+            self._filtro = FiltroBloom.para(self._capacidad, self.error, self.bits_max)
+            for usuario, in conn.execute('SELECT usuario FROM usuarios WHERE id <= ?', (ultimo,)):
+                self._filtro.agregar(usuario)
+        self._ultimo_id = ultimo
+        self._proximo_refresco = time.monotonic() + self.refresco
+        self._reconstrucciones += 1
+
+    def _al_dia(self):
+        # Se llama con el lock tomado
+        self._mismo_proceso()
+        if self._filtro is None:
+            self._reconstruir()
+        elif time.monotonic() >= self._proximo_refresco:
+            self._proximo_refresco = time.monotonic() + self.refresco
+            with conexion() as conn:
+                filas = conn.execute('SELECT id, usuario FROM usuarios WHERE id > ? ORDER BY id',
+                                     (self._ultimo_id,)).fetchall()
+            for id_usuario, usuario in filas:
+                self._filtro.agregar(usuario)
+                self._ultimo_id = id_usuario
+            if self._filtro.elementos > self._capacidad:
+                self._reconstruir()
+
+    def puede_existir(self, usuario):
+        """False si el nombre seguro no estaba registrado en la última lectura; True si puede estarlo"""
+        with self._lock:
+            self._al_dia()
+            if usuario in self._cache or usuario in self._filtro:
+                self._positivos += 1
+                return True
+            self._negativos += 1
+            return False
+
+    def anotar_falso_positivo(self):
+        with self._lock:
+            self._falsos_positivos += 1
+
+    def agregar(self, usuarios):
+        """Nombres recién registrados en este proceso"""
+        with self._lock:
+            self._mismo_proceso()
+            if self._filtro is not None:
+                # Se cuentan cuando el refresco los lea de la tabla (por id), así no se cuentan dos veces
+                for usuario in usuarios:
+                    self._filtro.agregar(usuario, contar=False)
+
+    def buscar(self, usuario):
+        """(id, usuario, hash) del nombre o None, desde la caché si la fila es reciente"""
+        with self._lock:
+            self._mismo_proceso()
+            entrada = self._cache.get(usuario)
+            if entrada and entrada[3] > time.monotonic():
+                self._cache.move_to_end(usuario)
+                self._aciertos += 1
+                return entrada[:3]
+            self._fallos += 1
+        with conexion() as conn:
+            fila = conn.execute('SELECT id, usuario, contraseña FROM usuarios WHERE usuario = ?',
+                                (usuario,)).fetchone()
+        with self._lock:
+            if fila is None:
+                self._cache.pop(usuario, None)
+                return None
+            self._en_cache(*fila)
+        return tuple(fila)
+
+    def _en_cache(self, id_usuario, usuario, contraseña_hash):
+        self._cache[usuario] = (id_usuario, usuario, contraseña_hash, time.monotonic() + self.cache_ttl)
+        self._cache.move_to_end(usuario)
+        while len(self._cache) > self.cache_max:
+            self._cache.popitem(last=False)
+
+    def actualizar_hash(self, id_usuario, usuario, contraseña_hash):
+        with self._lock:
+            self._en_cache(id_usuario, usuario, contraseña_hash)
+
+    def invalidar(self, usuario):
+        with self._lock:
+            if self._cache.pop(usuario, None) is not None:
+                self._invalidadas += 1
+
+    def estadisticas(self):
+        with self._lock:
+            filtro = self._filtro if self._pid == os.getpid() else None
+            consultas = self._positivos + self._negativos
+            return {
+                'activo': INDICE_USUARIOS,
+                'nombres': filtro.elementos if filtro else 0,
+                'bloom_kb': round(filtro.bytes / 1024, 1) if filtro else 0,
+                'bloom_funciones': filtro.funciones if filtro else 0,
+                'negativos': self._negativos,
+                'positivos': self._positivos,
+                'falsos_positivos': self._falsos_positivos,
+                'tasa_negativos': round(self._negativos / consultas, 4) if consultas else None,
+                'en_cache': len(self._cache),
+                'cache_max': self.cache_max,
+                'aciertos': self._aciertos,
+                'fallos': self._fallos,
+                'invalidadas': self._invalidadas,
+                'reconstrucciones': self._reconstrucciones,
+            }
+
+
+indice = IndiceUsuarios() if INDICE_USUARIOS else None
+
+
+def estadisticas():
+    return indice.estadisticas() if indice else {'activo': False}
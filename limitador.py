@@ -0,0 +1,135 @@
+"""Límite de intentos (token bucket) para /login y /registro
+
+Se aplica antes de leer la base o calcular un hash, así que rechazar una petición
+cuesta solo un diccionario y un lock. Cada clave (IP o nombre de usuario) tiene
+un balde de RAFAGA fichas que se rellena a TASA fichas por segundo. Los baldes
+se guardan en un LRU acotado, pero solo se desaloja uno que ya se rellenó del
+todo (olvidarlo no cambia nada): rotar nombres inventados no vacía la tabla de un
+balde agotado. Si todos los baldes están en uso, una clave nueva se cobra en un
+balde más grueso (la red /24 o /48 de la IP, o la IP en el límite por usuario).
+El tope global de hashing en curso ya lo pone la admisión de ServicioHash
+(HASH_COLA_MAX, 503).
+"""
+import ipaddress
+import os
+import threading
+import time
+from collections import OrderedDict
+from itertools import islice
+
+# Configuración de los límites (se puede cambiar con variables de entorno)
+LIMITE_ACTIVO = os.environ.get('LIMITE_ACTIVO', '1') == '1'
+LIMITE_IP_TASA = float(os.environ.get('LIMITE_IP_TASA', '2'))  # intentos por segundo por IP
+LIMITE_IP_RAFAGA = float(os.environ.get('LIMITE_IP_RAFAGA', '20'))
+LIMITE_USUARIO_TASA = float(os.environ.get('LIMITE_USUARIO_TASA', '0.2'))  # intentos por segundo por usuario
+LIMITE_USUARIO_RAFAGA = float(os.environ.get('LIMITE_USUARIO_RAFAGA', '5'))
+LIMITE_CLAVES_MAX = int(os.environ.get('LIMITE_CLAVES_MAX', '100000'))  # baldes en memoria por limitador
+REVISAR_DESALOJO = 16  # baldes menos usados que se revisan buscando uno lleno para desalojar
+
+
+class DemasiadosIntentos(Exception):
+    """El cliente superó su límite de intentos; puede reintentar después de retry_after segundos"""
+
+    def __init__(self, retry_after):
+        super().__init__('Demasiados intentos')
+        self.retry_after = retry_after
+
+
+class Limitador:
+    def __init__(self, tasa, rafaga, claves_max=LIMITE_CLAVES_MAX):
+        self.tasa = tasa
+        self.rafaga = rafaga
+        self.claves_max = claves_max
+        self.desborde_max = max(1, claves_max // 10)
+        self._lock = threading.Lock()
+        # clave -> [fichas, último rellenado]
+        self._baldes = OrderedDict()
+        # Baldes gruesos para las claves nuevas cuando no hay lugar en _baldes
+        self._desborde = OrderedDict()
+        self._admitidas = 0
+        self._rechazadas = 0
+        self._desalojadas = 0
+        self._desbordadas = 0
+
+    def _balde(self, baldes, maximo, clave, ahora):
+        """El balde de la clave (rellenado hasta ahora), uno nuevo si hay lugar, o None"""
+        balde = baldes.get(clave)
+        if balde is not None:
+            baldes.move_to_end(clave)
+            balde[0] = min(self.rafaga, balde[0] + (ahora - balde[1]) * self.tasa)
+            balde[1] = ahora
+            return balde
+        if len(baldes) >= maximo:
+            # Solo se desaloja un balde lleno: uno agotado seguiría agotado al volver
+            llenos = [c for c, (fichas, ultimo) in islice(baldes.items(), REVISAR_DESALOJO)
+                      if fichas + (ahora - ultimo) * self.tasa >= self.rafaga]
+            if not llenos:
+                return None
+            del baldes[llenos[0]]
+            self._desalojadas += 1
+        balde = baldes[clave] = [self.rafaga, ahora]
+        return balde
+
+    def consumir(self, clave, desborde='*'):
+        """Toma una ficha; devuelve 0 si hay, o los segundos hasta la próxima"""
+        ahora = time.monotonic()
+        with self._lock:
+            balde = self._balde(self._baldes, self.claves_max, clave, ahora)
+            if balde is None:
+                self._desbordadas += 1
+                balde = self._balde(self._desborde, self.desborde_max, desborde, ahora)
+                if balde is None:
+                    # Ni siquiera hay lugar para el balde grueso: se rechaza hasta que alguno se rellene
+                    self._rechazadas += 1
+                    return 1 / self.tasa
+            if balde[0] >= 1:
+                balde[0] -= 1
+                self._admitidas += 1
+                return 0
+            self._rechazadas += 1
+            return (1 - balde[0]) / self.tasa
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                'claves': len(self._baldes),
+                'claves_max': self.claves_max,
+                'admitidas': self._admitidas,
+                'rechazadas': self._rechazadas,
+                'desalojadas': self._desalojadas,
+                'desbordadas': self._desbordadas,
+                'baldes_desborde': len(self._desborde),
+            }
+
+
+limite_ip = Limitador(LIMITE_IP_TASA, LIMITE_IP_RAFAGA)
+limite_usuario = Limitador(LIMITE_USUARIO_TASA, LIMITE_USUARIO_RAFAGA)
+
+
+def _red(ip):
+    """Red /24 (IPv4) o /48 (IPv6) de la IP: el balde grueso del límite por IP"""
+    try:
+        direccion = ipaddress.ip_address(ip)
+    except ValueError:
+        return '*'
+    return str(ipaddress.ip_network(f'{ip}/{24 if direccion.version == 4 else 48}', strict=False))
+
+
+def _verificar(limitador, clave, desborde):
+    espera = limitador.consumir(clave, desborde)
+    if espera:
+        raise DemasiadosIntentos(max(1, int(espera + 0.999)))
+
+
+def admitir(ip, usuario=None):
+    """Lanza DemasiadosIntentos si la IP (o el usuario, en /login) agotó sus fichas"""
+    if not LIMITE_ACTIVO:
+        return
+    _verificar(limite_ip, ip, _red(ip))
+    if usuario is not None:
+        # Normalizado: "Admin" y "admin " cuentan como el mismo objetivo
+        _verificar(limite_usuario, str(usuario).strip().lower(), ip)
+
+
+def estadisticas():
+    return {'activo': LIMITE_ACTIVO, 'ip': limite_ip.estadisticas(), 'usuario': limite_usuario.estadisticas()}
@@ -0,0 +1,374 @@
+"""Mantenimiento de las bases SQLite en segundo plano
+
+Un solo worker (el que toma el lock de MANTENIMIENTO_LOCK) ejecuta cada cierto tiempo,
+sobre DB_PATH y cada fragmento:
+
+    checkpoint  PRAGMA wal_checkpoint(PASSIVE); TRUNCATE si el WAL pasa MANTENIMIENTO_WAL_MAX_MB
+    truncar     PRAGMA wal_checkpoint(TRUNCATE): el WAL vuelve a 0 bytes
+    analizar    ANALYZE con analysis_limit (estadísticas del planificador de consultas)
+    vacuum      PRAGMA incremental_vacuum: devuelve al disco hasta N páginas libres
+    eventos     borra los eventos más viejos que los últimos EVENTOS_RETENCION
+    sesiones    borra las sesiones vencidas (en lugar de hacerlo las peticiones)
+
+Los demás workers reintentan tomar el lock: si el elegido se recicla, otro sigue. Un
+trabajo se pospone mientras las conexiones de este proceso estén ocupadas (como mucho
+MANTENIMIENTO_ESPERA_MAX segundos) y sus sentencias esperan el lock de escritura a lo
+sumo MANTENIMIENTO_BUSY_MS, así el tráfico no queda detrás del mantenimiento. Qué hizo
+cada trabajo y cuánto tardó queda en la tabla `mantenimiento` (migración 10), que
+/estado muestra desde cualquier worker.
+
+    python mantenimiento.py --estado
+    python mantenimiento.py --ahora checkpoint vacuum   # ejecutar ya, sin esperar
+    python mantenimiento.py --activar-vacuum            # bases creadas antes del vacuum incremental
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    # Sin fcntl (Windows) no hay elección: cada proceso hace su propio mantenimiento
+    fcntl = None
+
+from base_datos import DB_PATH, conexion, fragmentos, pool, todos_los_pools
+from cola_escritura import estadisticas as estadisticas_escritura
+from eventos import podar as podar_eventos
+from sesiones import SESION_BACKEND, SESION_BARRIDO, almacen
+
+# Configuración del mantenimiento (se puede cambiar con variables de entorno)
+MANTENIMIENTO_ACTIVO = os.environ.get('MANTENIMIENTO_ACTIVO', '1') == '1'
+MANTENIMIENTO_LOCK = os.environ.get('MANTENIMIENTO_LOCK', DB_PATH + '.mantenimiento.lock')
+MANTENIMIENTO_SONDEO = float(os.environ.get('MANTENIMIENTO_SONDEO', '5'))  # segundos entre vueltas
+MANTENIMIENTO_CHECKPOINT = float(os.environ.get('MANTENIMIENTO_CHECKPOINT', '60'))
+MANTENIMIENTO_TRUNCAR = float(os.environ.get('MANTENIMIENTO_TRUNCAR', '3600'))
+MANTENIMIENTO_WAL_MAX_MB = float(os.environ.get('MANTENIMIENTO_WAL_MAX_MB', '64'))
+MANTENIMIENTO_ANALIZAR = float(os.environ.get('MANTENIMIENTO_ANALIZAR', '3600'))
+MANTENIMIENTO_ANALISIS_LIMITE = int(os.environ.get('MANTENIMIENTO_ANALISIS_LIMITE', '1000'))  # filas por índice
+MANTENIMIENTO_VACUUM = float(os.environ.get('MANTENIMIENTO_VACUUM', '600'))
+MANTENIMIENTO_EVENTOS = float(os.environ.get('MANTENIMIENTO_EVENTOS', '60'))
+MANTENIMIENTO_VACUUM_PAGINAS = int(os.environ.get('MANTENIMIENTO_VACUUM_PAGINAS', '2000'))  # páginas por vuelta
+MANTENIMIENTO_OCUPADO = float(os.environ.get('MANTENIMIENTO_OCUPADO', '0.5'))  # fracción del pool en uso
+MANTENIMIENTO_ESPERA_MAX = float(os.environ.get('MANTENIMIENTO_ESPERA_MAX', '300'))  # segundos pospuesto
+MANTENIMIENTO_BUSY_MS = int(os.environ.get('MANTENIMIENTO_BUSY_MS', '200'))
+# Segundos que /estado y /metrics reutilizan la última lectura de la tabla `mantenimiento`
+MANTENIMIENTO_INFORME_CACHE = float(os.environ.get('MANTENIMIENTO_INFORME_CACHE', '30'))
+
+
+def _tamano_wal(ruta):
+    try:
+        return os.path.getsize(ruta + '-wal')
+    except OSError:
+        return 0
+
+
+def _checkpoint(conn, ruta, modo):
+    antes = _tamano_wal(ruta)
+    ocupada, paginas_wal, copiadas = conn.execute(f'PRAGMA wal_checkpoint({modo})').fetchone()
+    return {'modo': modo, 'ocupada': bool(ocupada), 'paginas_wal': paginas_wal, 'copiadas': copiadas,
+            'wal_mb_antes': round(antes / 1e6, 2), 'wal_mb': round(_tamano_wal(ruta) / 1e6, 2)}
+
+
+def checkpoint(conn, ruta):
+    """Copia el WAL a la base sin esperar a nadie; si el WAL creció demasiado, además lo trunca"""
+    modo = 'TRUNCATE' if _tamano_wal(ruta) > MANTENIMIENTO_WAL_MAX_MB * 1e6 else 'PASSIVE'
+    return _checkpoint(conn, ruta, modo)
+
+
+def truncar(conn, ruta):
+    return _checkpoint(conn, ruta, 'TRUNCATE')
+
+
+def analizar(conn, ruta):
+    """ANALYZE acotado: con analysis_limit mira unas pocas filas por índice, no la tabla entera"""
+    conn.execute(f'PRAGMA analysis_limit={int(MANTENIMIENTO_ANALISIS_LIMITE)}')
+    conn.execute('ANALYZE')
+    return {'indices': conn.execute('SELECT count(*) FROM sqlite_stat1').fetchone()[0]}
+
+
+def vacuum(conn, ruta):
+    """Devuelve al disco parte de las páginas libres (tareas, sesiones y eventos borrados)"""
+    if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+        return {'omitido': 'auto_vacuum no es incremental: python mantenimiento.py --activar-vacuum'}
+    libres = conn.execute('PRAGMA freelist_count').fetchone()[0]
+    if libres:
+        # executescript recorre la sentencia hasta el final (execute libera una sola página)
+        conn.executescript(f'PRAGMA incremental_vacuum({int(MANTENIMIENTO_VACUUM_PAGINAS)});')
+    quedan = conn.execute('PRAGMA freelist_count').fetchone()[0]
+    pagina = conn.execute('PRAGMA page_size').fetchone()[0]
+    return {'paginas_libres': libres, 'liberadas': libres - quedan,
+            'mb_liberados': round((libres - quedan) * pagina / 1e6, 2)}
+
+
+def eventos(conn, ruta):
+    return {'borrados': podar_eventos(conn)}
+
+
+def barrer_sesiones():
+    return {'borradas': almacen.barrer()}
+
+
+class Trabajo:
+    def __init__(self, nombre, intervalo, funcion, por_base=True):
+        self.nombre = nombre
+        self.intervalo = intervalo
+        self.funcion = funcion
+        self.por_base = por_base  # False: se ejecuta una vez, no sobre cada base
+
+
+TRABAJOS = [
+    Trabajo('checkpoint', MANTENIMIENTO_CHECKPOINT, checkpoint),
+    Trabajo('truncar', MANTENIMIENTO_TRUNCAR, truncar),
+    Trabajo('analizar', MANTENIMIENTO_ANALIZAR, analizar),
+    Trabajo('vacuum', MANTENIMIENTO_VACUUM, vacuum),
+    Trabajo('eventos', MANTENIMIENTO_EVENTOS, eventos),
+]
+if SESION_BACKEND == 'servidor':
+    TRABAJOS.append(Trabajo('sesiones', SESION_BARRIDO, barrer_sesiones, por_base=False))
+
+
+def _nombre_base(p):
+    return 'db' if p is pool else f'fragmento_{fragmentos.index(p)}'
+
+
+class Programador:
+    def __init__(self, trabajos=TRABAJOS, ruta_lock=MANTENIMIENTO_LOCK, sondeo=MANTENIMIENTO_SONDEO,
+                 ocupado=MANTENIMIENTO_OCUPADO, espera_max=MANTENIMIENTO_ESPERA_MAX, busy_ms=MANTENIMIENTO_BUSY_MS):
+        self.trabajos = {t.nombre: t for t in trabajos}
+        self.ruta_lock = ruta_lock
+        self.sondeo = sondeo
+        self.ocupado = ocupado
+        self.espera_max = espera_max
+        self.busy_ms = busy_ms
+        self._lock = threading.Lock()
+        self._hilo = None
+        self._pid = None
+        self._fd = None
+        self._conexiones = {}
+        self._proximos = {}
+        self._pospuestos = {}
+
+    def iniciar(self):
+        """Arranca el hilo del programador en este proceso (cada worker; solo el elegido trabaja)"""
+        with self._lock:
+            if self._hilo is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._fd = None
+            self._conexiones = {}
+            self._proximos = {}
+            self._pospuestos = {}
+            if 'sesiones' in self.trabajos:
+                # Las peticiones ya no barren: lo hace el worker elegido
+                almacen.barrido_externo = True
+            self._hilo = threading.Thread(target=self._bucle, name='mantenimiento', daemon=True)
+            self._hilo.start()
+
+    def elegido(self):
+        return self._fd is not None and self._pid == os.getpid()
+
+    def _elegirse(self):
+        if self._fd is not None:
+            return True
+        if fcntl is None:
+            self._fd = -1
+        else:
+            fd = os.open(self.ruta_lock, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                # lockf y no flock: el lock no lo heredan los procesos hijos (pool de hashing)
+                fcntl.lockf(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                os.close(fd)
+                return False
+            os.ftruncate(fd, 0)
+            os.write(fd, f'{os.getpid()}\n'.encode('ascii'))
+            self._fd = fd
+        # Los plazos siguen desde la última ejecución de cualquier worker, no desde el arranque
+        with conexion() as conn:
+            self._proximos = {trabajo: inicio + self.trabajos[trabajo].intervalo
+                              for trabajo, inicio in conn.execute('SELECT trabajo, inicio FROM mantenimiento')
+                              if trabajo in self.trabajos}
+        return True
+
+    def _bucle(self):
+        while True:
+            time.sleep(self.sondeo)
+            try:
+                if self._elegirse():
+                    self._vuelta()
+            except Exception as e:
+                print(f'⚠️  Mantenimiento: {e}', file=sys.stderr)
+
+    def _hay_trafico(self):
+        for p in todos_los_pools():
+            datos = p.estadisticas()
+            if datos['en_uso'] >= max(1, datos['tamano'] * self.ocupado):
+                return True
+        return estadisticas_escritura().get('en_cola', 0) > 0
+
+    def _vuelta(self):
+        for trabajo in self.trabajos.values():
+            ahora = time.time()
+            vence = self._proximos.get(trabajo.nombre, ahora)
+            if ahora < vence:
+                continue
+            if ahora - vence < self.espera_max and self._hay_trafico():
+                self._pospuestos[trabajo.nombre] = self._pospuestos.get(trabajo.nombre, 0) + 1
+                continue
+            self.ejecutar(trabajo.nombre)
+
+    def _conexion(self, ruta):
+        # Conexiones propias: el mantenimiento no ocupa lugares del pool de las peticiones
+        conn = self._conexiones.get(ruta)
+        if conn is None:
+            conn = sqlite3.connect(ruta, timeout=self.busy_ms / 1000, isolation_level=None,
+                                   check_same_thread=False)
+            self._conexiones[ruta] = conn
+        return conn
+
+    def ejecutar(self, nombre):
+        """Ejecuta un trabajo ahora y guarda el resultado en la tabla `mantenimiento`"""
+        trabajo = self.trabajos[nombre]
+        inicio = time.time()
+        errores = 0
+        if trabajo.por_base:
+            resultado = {}
+            for p in todos_los_pools():
+                try:
+                    resultado[_nombre_base(p)] = trabajo.funcion(self._conexion(p.ruta), p.ruta)
+                except sqlite3.Error as e:
+                    # Base ocupada (busy_timeout corto) u otro error: se reintenta en el próximo plazo
+                    resultado[_nombre_base(p)] = {'error': str(e)}
+                    errores += 1
+        else:
+            try:
+                resultado = trabajo.funcion()
+            except sqlite3.Error as e:
+                resultado = {'error': str(e)}
+                errores += 1
+        ms = round((time.time() - inicio) * 1000, 3)
+        self._proximos[nombre] = time.time() + trabajo.intervalo
+        pospuestos = self._pospuestos.pop(nombre, 0)
+        with conexion() as conn:
+            conn.execute(
+                'INSERT INTO mantenimiento (trabajo, pid, inicio, ms, resultado, ejecuciones, pospuestos, errores) '
+                'VALUES (?, ?, ?, ?, ?, 1, ?, ?) ON CONFLICT (trabajo) DO UPDATE SET pid = excluded.pid, '
+                'inicio = excluded.inicio, ms = excluded.ms, resultado = excluded.resultado, '
+                'ejecuciones = ejecuciones + 1, pospuestos = pospuestos + excluded.pospuestos, '
+                'errores = errores + excluded.errores',
+                (nombre, os.getpid(), inicio, ms, json.dumps(resultado, ensure_ascii=False), pospuestos, errores))
+        informe_reciente.invalidar()
+        return resultado, ms
+
+
+programador = Programador()
+
+
+def iniciar():
+    if MANTENIMIENTO_ACTIVO:
+        programador.iniciar()
+
+
+def _leer_informe():
+    with conexion() as conn:
+        filas = conn.execute('SELECT trabajo, pid, inicio, ms, resultado, ejecuciones, pospuestos, errores '
+                             'FROM mantenimiento ORDER BY trabajo').fetchall()
+    return [(f[0], f[1], f[2], f[3], json.loads(f[4]), f[5], f[6], f[7]) for f in filas]
+
+
+def informe(filas=None):
+    """Última ejecución de cada trabajo (de cualquier worker)"""
+    if filas is None:
+        filas = _leer_informe()
+    return {f[0]: {'pid': f[1], 'hace_s': round(time.time() - f[2], 1), 'ms': f[3], 'ejecuciones': f[5],
+                   'pospuestos': f[6], 'errores': f[7], 'resultado': f[4]} for f in filas}
+
+
+class _InformeReciente:
+    """Filas de `mantenimiento` leídas como mucho cada MANTENIMIENTO_INFORME_CACHE segundos
+
+    Así el monitoreo (/estado, /metrics) no suma lecturas al pool de las peticiones. El
+    worker que ejecuta un trabajo la invalida; los demás ven el cambio al vencer el plazo.
+    """
+
+    def __init__(self, ttl=MANTENIMIENTO_INFORME_CACHE):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._filas = None
+        self._vence = 0
+
+    def filas(self):
+        with self._lock:
+            if self._filas is not None and time.monotonic() < self._vence:
+                return self._filas
+        filas = _leer_informe()
+        with self._lock:
+            self._filas, self._vence = filas, time.monotonic() + self.ttl
+        return filas
+
+    def invalidar(self):
+        with self._lock:
+            self._filas = None
+
+
+informe_reciente = _InformeReciente()
+
+
+def estadisticas():
+    return {'activo': MANTENIMIENTO_ACTIVO, 'elegido': programador.elegido(),
+            'trabajos': informe(informe_reciente.filas())}
+
+
+def activar_vacuum():
+    """Pasa a auto_vacuum=INCREMENTAL las bases que no lo tienen (reescribe cada archivo con VACUUM)"""
+    cambiadas = []
+    for p in todos_los_pools():
+        conn = sqlite3.connect(p.ruta, isolation_level=None)
+        try:
+            if conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2:
+                continue
+            antes = os.path.getsize(p.ruta)
+            conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+            conn.execute('VACUUM')
+            conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+            cambiadas.append((p.ruta, antes, os.path.getsize(p.ruta)))
+        finally:
+            conn.close()
+    return cambiadas
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Mantenimiento de las bases SQLite')
+    parser.add_argument('--estado', action='store_true', help='última ejecución de cada trabajo')
+    parser.add_argument('--ahora', nargs='*', metavar='TRABAJO', choices=list(programador.trabajos),
+                        help='ejecutar ya estos trabajos (todos si no se indica ninguno)')
+    parser.add_argument('--activar-vacuum', action='store_true', help='activar el vacuum incremental (VACUUM)')
+    args = parser.parse_args(argv)
+    if not (args.estado or args.activar_vacuum or args.ahora is not None):
+        parser.error('indicar --estado, --ahora o --activar-vacuum')
+
+    from migraciones import migrar
+    migrar()
+    if args.activar_vacuum:
+        print('⚠️  VACUUM reescribe cada base: mejor con los servidores detenidos', file=sys.stderr)
+        for ruta, antes, despues in activar_vacuum():
+            print(f'✅ {ruta}: vacuum incremental activo ({antes / 1e6:.1f} MB -> {despues / 1e6:.1f} MB)')
+        print('Todas las bases tienen el vacuum incremental activo')
+    elif args.ahora is not None:
+        for nombre in args.ahora or list(programador.trabajos):
+            resultado, ms = programador.ejecutar(nombre)
+            print(f'✅ {nombre} ({ms} ms): {json.dumps(resultado, ensure_ascii=False)}')
+    else:
+        for nombre, datos in informe().items():
+            print(f"{nombre}: hace {datos['hace_s']} s, {datos['ms']} ms, {datos['ejecuciones']} ejecuciones, "
+                  f"{datos['pospuestos']} pospuestos, {datos['errores']} errores (pid {datos['pid']})")
+            print(f"  {json.dumps(datos['resultado'], ensure_ascii=False)}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,240 @@
+import threading
+import time
+import weakref
+from bisect import bisect_left
+from flask import Response, g, request
+from flask.sessions import SessionInterface
+
+# Límites de los buckets de los histogramas (segundos)
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+TIPO_PROMETHEUS = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _indice_bucket(valor):
+    return bisect_left(BUCKETS, valor)
+
+
+def percentil(valores, p):
+    """Percentil p (0-100) de una lista ya ordenada; 0.0 si está vacía"""
+    if not valores:
+        return 0.0
+    indice = min(len(valores) - 1, int(round(p / 100 * (len(valores) - 1))))
+    return valores[indice]
+
+
+class _Valores:
+    def __init__(self):
+        self.contadores = {}
+        self.histogramas = {}
+
+
+class _Acumulador(_Valores):
+    """Contadores de un solo hilo: se escriben sin locks y se suman al exportar"""
+
+    def __init__(self, registro):
+        super().__init__()
+        self.registro = registro
+        self.absorbido = False
+
+    def __del__(self):
+        # Al terminar el hilo sus valores pasan al total global
+        try:
+            self.registro._absorber(self)
+        except Exception:
+            pass
+
+
+class Registro:
+    def __init__(self):
+        # RLock: __del__ de un acumulador puede ejecutarse mientras este hilo exporta
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._vivos = weakref.WeakSet()
+        self._total = _Valores()
+        self._colectores = []
+
+    def _acumulador(self):
+        try:
+            return self._local.acumulador
+        except AttributeError:
+            acumulador = _Acumulador(self)
+            with self._lock:
+                self._vivos.add(acumulador)
+            self._local.acumulador = acumulador
+            return acumulador
+
+    def _absorber(self, acumulador):
+        with self._lock:
+            if acumulador.absorbido:
+                return
+            _sumar(self._total, acumulador)
+            acumulador.absorbido = True
+
+    def contar(self, nombre, etiquetas=(), cantidad=1):
+        contadores = self._acumulador().contadores
+        clave = (nombre, etiquetas)
+        contadores[clave] = contadores.get(clave, 0) + cantidad
+
+    def observar(self, nombre, etiquetas, segundos):
+        histogramas = self._acumulador().histogramas
+        clave = (nombre, etiquetas)
+        datos = histogramas.get(clave)
+        if datos is None:
+            # [conteos por bucket..., +Inf, suma]
+            datos = histogramas[clave] = [0] * (len(BUCKETS) + 1) + [0.0]
+        datos[_indice_bucket(segundos)] += 1
+        datos[-1] += segundos
+
+    def agregar_colector(self, funcion):
+        """funcion() devuelve [(nombre, tipo, ayuda, etiquetas, valor), ...] en cada exportación"""
+        self._colectores.append(funcion)
+
+    def agregar_estadisticas(self, prefijo, funcion):
+        """Publica como gauges los valores numéricos del dict que devuelve funcion() (p. ej. pool.estadisticas)"""
+        def colector():
+            return [(f'{prefijo}_{clave}', 'gauge', f'{prefijo}: {clave}', (), valor)
+                    for clave, valor in _aplanar(funcion())]
+        self.agregar_colector(colector)
+
+    def _instantanea(self):
+        total = _Valores()
+        with self._lock:
+            _sumar(total, self._total)
+            for acumulador in list(self._vivos):
+                if not acumulador.absorbido:
+                    _sumar(total, acumulador)
+        return total
+
+    def exportar(self):
+        """Texto en formato de exposición de Prometheus"""
+        datos = self._instantanea()
+        lineas = []
+        por_nombre = {}
+        for (nombre, etiquetas), valor in sorted(datos.contadores.items()):
+            por_nombre.setdefault(nombre, []).append((etiquetas, valor))
+        for nombre, series in por_nombre.items():
+            lineas.append(f'# TYPE {nombre} counter')
+            lineas.extend(f'{nombre}{_etiquetas(e)} {v}' for e, v in series)
+
+        por_nombre = {}
+        for (nombre, etiquetas), valores in sorted(datos.histogramas.items()):
+            por_nombre.setdefault(nombre, []).append((etiquetas, valores))
+        for nombre, series in por_nombre.items():
+            lineas.append(f'# TYPE {nombre} histogram')
+            for etiquetas, valores in series:
+                acumulado = 0
+                for limite, conteo in zip(BUCKETS + ('+Inf',), valores[:-1]):
+                    acumulado += conteo
+                    lineas.append(f'{nombre}_bucket{_etiquetas(etiquetas + (("le", str(limite)),))} {acumulado}')
+                lineas.append(f'{nombre}_sum{_etiquetas(etiquetas)} {valores[-1]:.6f}')
+                lineas.append(f'{nombre}_count{_etiquetas(etiquetas)} {acumulado}')
+
+        vistos = set()
+        for colector in self._colectores:
+            for nombre, tipo, ayuda, etiquetas, valor in colector():
+                if nombre not in vistos:
+                    vistos.add(nombre)
+                    lineas.append(f'# HELP {nombre} {ayuda}')
+                    lineas.append(f'# TYPE {nombre} {tipo}')
+                lineas.append(f'{nombre}{_etiquetas(etiquetas)} {valor}')
+        return '\n'.join(lineas) + '\n'
+
+
+def _sumar(destino, origen):
+    for clave, valor in list(origen.contadores.items()):
+        destino.contadores[clave] = destino.contadores.get(clave, 0) + valor
+    for clave, valores in list(origen.histogramas.items()):
+        actual = destino.histogramas.get(clave)
+        if actual is None:
+            destino.histogramas[clave] = list(valores)
+        else:
+            destino.histogramas[clave] = [a + b for a, b in zip(actual, valores)]
+
+
+def _aplanar(datos, prefijo=''):
+    for clave, valor in datos.items():
+        if isinstance(valor, dict):
+            yield from _aplanar(valor, f'{prefijo}{clave}_')
+        elif isinstance(valor, (int, float)) and not isinstance(valor, bool):
+            yield f'{prefijo}{clave}', valor
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _etiquetas(etiquetas):
+    if not etiquetas:
+        return ''
+    partes = (f'{k}="{_escapar(v)}"' for k, v in etiquetas)
+    return '{' + ','.join(partes) + '}'
+
+
+registro = Registro()
+
+# Fases de la petición en curso en este hilo (dict fase -> segundos); solo el perfilador las pide
+fases_peticion = threading.local()
+
+
+class medir:
+    """Context manager que mide una fase (db, hash, render, sesion) de la petición"""
+    __slots__ = ('fase', 'inicio')
+
+    def __init__(self, fase):
+        self.fase = fase
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        duracion = time.perf_counter() - self.inicio
+        registro.observar('duracion_fase_segundos', (('fase', self.fase),), duracion)
+        fases = getattr(fases_peticion, 'fases', None)
+        if fases is not None:
+            fases[self.fase] = fases.get(self.fase, 0.0) + duracion
+        return False
+
+
+def observar_peticion(endpoint, metodo, estado, segundos):
+    registro.contar('peticiones_http_total', (('endpoint', endpoint), ('metodo', metodo), ('estado', str(estado))))
+    registro.observar('duracion_peticion_segundos', (('endpoint', endpoint),), segundos)
+
+
+class InterfazSesionMedida(SessionInterface):
+    """Envuelve la interfaz de sesión de la app y mide su costo en la fase 'sesion'"""
+
+    def __init__(self, interna):
+        self.interna = interna
+
+    def __getattr__(self, nombre):
+        return getattr(self.interna, nombre)
+
+    def open_session(self, app, request):
+        with medir('sesion'):
+            return self.interna.open_session(app, request)
+
+    def save_session(self, app, session, response):
+        with medir('sesion'):
+            return self.interna.save_session(app, session, response)
+
+
+def instrumentar(app):
+    """Registra los hooks de medición y la ruta /metrics en la app Flask"""
+    app.session_interface = InterfazSesionMedida(app.session_interface)
+
+    @app.before_request
+    def _inicio_peticion():
+        g._inicio_peticion = time.perf_counter()
+
+    @app.after_request
+    def _fin_peticion(response):
+        inicio = g.pop('_inicio_peticion', None)
+        if inicio is not None:
+            endpoint = request.url_rule.rule if request.url_rule else 'sin_ruta'
+            observar_peticion(endpoint, request.method, response.status_code, time.perf_counter() - inicio)
+        return response
+
+    @app.route('/metrics')
+    def metrics():
+        return Response(registro.exportar(), mimetype=TIPO_PROMETHEUS)
@@ -0,0 +1,299 @@
+"""Migraciones del esquema de la base de datos
+
+La versión aplicada se guarda en `PRAGMA user_version`. Si el esquema está al día
+la comprobación es una sola lectura de ese PRAGMA; si no, cada migración pendiente
+se ejecuta una vez, en orden, dentro de una transacción BEGIN EXCLUSIVE (con WAL
+los lectores siguen trabajando mientras se crean tablas o índices).
+
+    python migraciones.py            # aplica las pendientes (en DB_PATH y en cada fragmento)
+    python migraciones.py --estado   # muestra la versión actual y las pendientes
+"""
+import argparse
+import os
+import sqlite3
+import sys
+
+# (versión, descripción, sentencias). Solo se agregan al final: nunca editar una ya publicada.
+# Las primeras usan IF NOT EXISTS para adoptar bases creadas antes de las migraciones.
+MIGRACIONES = (
+    (1, 'tablas usuarios y tareas', (
+        '''CREATE TABLE IF NOT EXISTS usuarios (
+               id INTEGER PRIMARY KEY AUTOINCREMENT,
+               usuario TEXT UNIQUE NOT NULL,
+               contraseña TEXT NOT NULL,
+               fecha_registro TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+           )''',
+        '''CREATE TABLE IF NOT EXISTS tareas (
+               id INTEGER PRIMARY KEY AUTOINCREMENT,
+               usuario_id INTEGER,
+               titulo TEXT NOT NULL,
+               descripcion TEXT,
+               completada BOOLEAN DEFAULT 0,
+               fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+               FOREIGN KEY (usuario_id) REFERENCES usuarios (id)
+           )''',
+    )),
+    (2, 'índices de tareas por usuario', (
+        'CREATE INDEX IF NOT EXISTS idx_tareas_usuario_completada_id ON tareas (usuario_id, completada, id)',
+        'CREATE INDEX IF NOT EXISTS idx_tareas_usuario_id ON tareas (usuario_id, id)',
+    )),
+    (3, 'sesiones del lado del servidor', (
+        '''CREATE TABLE IF NOT EXISTS sesiones (
+               id TEXT PRIMARY KEY,
+               usuario_id INTEGER,
+               datos TEXT NOT NULL,
+               expira REAL NOT NULL
+           ) WITHOUT ROWID''',
+        'CREATE INDEX IF NOT EXISTS idx_sesiones_expira ON sesiones (expira)',
+        'CREATE INDEX IF NOT EXISTS idx_sesiones_usuario ON sesiones (usuario_id, expira)',
+    )),
+    (4, 'búsqueda de texto completo en tareas (FTS5)', (
+        # Contenido externo: el texto vive solo en `tareas`; usuario_id se indexa para filtrar
+        """CREATE VIRTUAL TABLE tareas_fts USING fts5(
+               titulo, descripcion, usuario_id,
+               content='tareas', content_rowid='id',
+               tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+           )""",
+        # El título pesa más que la descripción; usuario_id no cuenta para el ranking
+        "INSERT INTO tareas_fts (tareas_fts, rank) VALUES ('rank', 'bm25(10.0, 1.0, 0.0)')",
+        '''CREATE TRIGGER tareas_fts_insertar AFTER INSERT ON tareas BEGIN
+               INSERT INTO tareas_fts (rowid, titulo, descripcion, usuario_id)
+               VALUES (new.id, new.titulo, new.descripcion, new.usuario_id);
+           END''',
+        '''CREATE TRIGGER tareas_fts_borrar AFTER DELETE ON tareas BEGIN
+               INSERT INTO tareas_fts (tareas_fts, rowid, titulo, descripcion, usuario_id)
+               VALUES ('delete', old.id, old.titulo, old.descripcion, old.usuario_id);
+           END''',
+        '''CREATE TRIGGER tareas_fts_actualizar AFTER UPDATE OF titulo, descripcion, usuario_id ON tareas BEGIN
+               INSERT INTO tareas_fts (tareas_fts, rowid, titulo, descripcion, usuario_id)
+               VALUES ('delete', old.id, old.titulo, old.descripcion, old.usuario_id);
+               INSERT INTO tareas_fts (rowid, titulo, descripcion, usuario_id)
+               VALUES (new.id, new.titulo, new.descripcion, new.usuario_id);
+           END''',
+        "INSERT INTO tareas_fts (tareas_fts) VALUES ('rebuild')",
+    )),
+    (5, 'contadores de tareas por usuario (resumen_tareas)', (
+        # semana: '%Y-%W' (UTC) a la que corresponde creadas_semana (jueves de la semana ISO desde la migración 11)
+        '''CREATE TABLE resumen_tareas (
+               usuario_id INTEGER PRIMARY KEY,
+               total INTEGER NOT NULL DEFAULT 0,
+               completadas INTEGER NOT NULL DEFAULT 0,
+               semana TEXT,
+               creadas_semana INTEGER NOT NULL DEFAULT 0
+           )''',
+        '''CREATE TRIGGER resumen_tareas_insertar AFTER INSERT ON tareas BEGIN
+               INSERT INTO resumen_tareas (usuario_id, total, completadas, semana, creadas_semana)
+               VALUES (new.usuario_id, 1, new.completada != 0, strftime('%Y-%W', new.fecha_creacion), 1)
+               ON CONFLICT (usuario_id) DO UPDATE SET
+                   total = total + 1,
+                   completadas = completadas + excluded.completadas,
+                   creadas_semana = CASE
+                       WHEN semana = excluded.semana THEN creadas_semana + 1
+                       WHEN semana > excluded.semana THEN creadas_semana
+                       ELSE 1 END,
+                   semana = max(coalesce(semana, ''), excluded.semana);
+           END''',
+        '''CREATE TRIGGER resumen_tareas_borrar AFTER DELETE ON tareas BEGIN
+               UPDATE resumen_tareas SET
+                   total = total - 1,
+                   completadas = completadas - (old.completada != 0),
+                   creadas_semana = creadas_semana - (semana IS strftime('%Y-%W', old.fecha_creacion))
+               WHERE usuario_id = old.usuario_id;
+           END''',
+        '''CREATE TRIGGER resumen_tareas_completar AFTER UPDATE OF completada ON tareas
+           WHEN (old.completada != 0) != (new.completada != 0) BEGIN
+               UPDATE resumen_tareas SET completadas = completadas + (new.completada != 0) - (old.completada != 0)
+               WHERE usuario_id = new.usuario_id;
+           END''',
+        '''INSERT INTO resumen_tareas (usuario_id, total, completadas, semana, creadas_semana)
+           SELECT usuario_id, count(*), sum(completada != 0), strftime('%Y-%W', 'now'),
+                  sum(strftime('%Y-%W', fecha_creacion) = strftime('%Y-%W', 'now'))
+           FROM tareas WHERE usuario_id IS NOT NULL GROUP BY usuario_id''',
+    )),
+    (6, 'versión por usuario de sus tareas (ETag / Last-Modified)', (
+        'ALTER TABLE resumen_tareas ADD COLUMN version INTEGER NOT NULL DEFAULT 0',
+        'ALTER TABLE resumen_tareas ADD COLUMN modificado INTEGER',  # epoch en segundos
+        # Los triggers de la migración 5 se reemplazan para subir también la versión
+        'DROP TRIGGER resumen_tareas_insertar',
+        '''CREATE TRIGGER resumen_tareas_insertar AFTER INSERT ON tareas BEGIN
+               INSERT INTO resumen_tareas (usuario_id, total, completadas, semana, creadas_semana, version, modificado)
+               VALUES (new.usuario_id, 1, new.completada != 0, strftime('%Y-%W', new.fecha_creacion), 1, 1,
+                       CAST(strftime('%s', 'now') AS INTEGER))
+               ON CONFLICT (usuario_id) DO UPDATE SET
+                   total = total + 1,
+                   completadas = completadas + excluded.completadas,
+                   creadas_semana = CASE
+                       WHEN semana = excluded.semana THEN creadas_semana + 1
+                       WHEN semana > excluded.semana THEN creadas_semana
+                       ELSE 1 END,
+                   semana = max(coalesce(semana, ''), excluded.semana),
+                   version = version + 1,
+                   modificado = excluded.modificado;
+           END''',
+        'DROP TRIGGER resumen_tareas_borrar',
+        '''CREATE TRIGGER resumen_tareas_borrar AFTER DELETE ON tareas BEGIN
+               UPDATE resumen_tareas SET
+                   total = total - 1,
+                   completadas = completadas - (old.completada != 0),
+                   creadas_semana = creadas_semana - (semana IS strftime('%Y-%W', old.fecha_creacion)),
+                   version = version + 1,
+                   modificado = CAST(strftime('%s', 'now') AS INTEGER)
+               WHERE usuario_id = old.usuario_id;
+           END''',
+        '''CREATE TRIGGER resumen_tareas_modificar AFTER UPDATE ON tareas BEGIN
+               UPDATE resumen_tareas SET version = version + 1, modificado = CAST(strftime('%s', 'now') AS INTEGER)
+               WHERE usuario_id = new.usuario_id;
+           END''',
+        "UPDATE resumen_tareas SET version = 1, modificado = CAST(strftime('%s', 'now') AS INTEGER)",
+    )),
+    (7, 'eventos de cambios en las tareas (SSE)', (
+        # AUTOINCREMENT: un id nunca se reutiliza después de podar, así Last-Event-ID no se confunde
+        '''CREATE TABLE eventos (
+               id INTEGER PRIMARY KEY AUTOINCREMENT,
+               usuario_id INTEGER NOT NULL,
+               tipo TEXT NOT NULL,
+               datos TEXT NOT NULL
+           )''',
+        'CREATE INDEX idx_eventos_usuario ON eventos (usuario_id, id)',
+    )),
+    (8, 'configuración compartida por todos los servidores', (
+        '''CREATE TABLE configuracion (
+               clave TEXT PRIMARY KEY,
+               valor TEXT NOT NULL
+           ) WITHOUT ROWID''',
+    )),
+    (9, 'secuencia de ids de tareas para el almacenamiento fragmentado', (
+        # valor: último id entregado (ver base_datos.nuevos_ids); lo inicializa fragmentos.py
+        '''CREATE TABLE secuencias (
+               nombre TEXT PRIMARY KEY,
+               valor INTEGER NOT NULL
+           ) WITHOUT ROWID''',
+    )),
+    (10, 'informe de los trabajos de mantenimiento', (
+        # Lo escribe el worker elegido (mantenimiento.py) y lo lee /estado en cualquier worker
+        '''CREATE TABLE mantenimiento (
+               trabajo TEXT PRIMARY KEY,
+               pid INTEGER NOT NULL,
+               inicio REAL NOT NULL,
+               ms REAL NOT NULL,
+               resultado TEXT NOT NULL,
+               ejecuciones INTEGER NOT NULL DEFAULT 0,
+               pospuestos INTEGER NOT NULL DEFAULT 0,
+               errores INTEGER NOT NULL DEFAULT 0
+           ) WITHOUT ROWID''',
+    )),
+    (11, 'semana ISO para creadas_semana (no se corta el 1 de enero)', (
+        # Con '%Y-%W' la semana 00 empieza el 1 de enero y la anterior termina el 31 de diciembre:
+        # el contador se reiniciaba a mitad de semana. La clave pasa a ser el jueves de la semana
+        # ISO (lunes a domingo), 'AAAA-MM-DD', que también se ordena como texto
+        'DROP TRIGGER resumen_tareas_insertar',
+        '''CREATE TRIGGER resumen_tareas_insertar AFTER INSERT ON tareas BEGIN
+               INSERT INTO resumen_tareas (usuario_id, total, completadas, semana, creadas_semana, version, modificado)
+               VALUES (new.usuario_id, 1, new.completada != 0, date(new.fecha_creacion, 'weekday 0', '-3 days'), 1, 1,
+                       CAST(strftime('%s', 'now') AS INTEGER))
+               ON CONFLICT (usuario_id) DO UPDATE SET
+                   total = total + 1,
+                   completadas = completadas + excluded.completadas,
+                   creadas_semana = CASE
+                       WHEN semana = excluded.semana THEN creadas_semana + 1
+                       WHEN semana > excluded.semana THEN creadas_semana
+                       ELSE 1 END,
+                   semana = max(coalesce(semana, ''), excluded.semana),
+                   version = version + 1,
+                   modificado = excluded.modificado;
+           END''',
+        'DROP TRIGGER resumen_tareas_borrar',
+        '''CREATE TRIGGER resumen_tareas_borrar AFTER DELETE ON tareas BEGIN
+               UPDATE resumen_tareas SET
+                   total = total - 1,
+                   completadas = completadas - (old.completada != 0),
+                   creadas_semana = creadas_semana - (semana IS date(old.fecha_creacion, 'weekday 0', '-3 days')),
+                   version = version + 1,
+                   modificado = CAST(strftime('%s', 'now') AS INTEGER)
+               WHERE usuario_id = old.usuario_id;
+           END''',
+        "UPDATE resumen_tareas SET semana = date('now', 'weekday 0', '-3 days'), creadas_semana = 0",
+        '''UPDATE resumen_tareas SET creadas_semana = semana_actual.creadas
+           FROM (SELECT usuario_id, count(*) AS creadas FROM tareas
+                 WHERE date(fecha_creacion, 'weekday 0', '-3 days') = date('now', 'weekday 0', '-3 days')
+                 GROUP BY usuario_id) AS semana_actual
+           WHERE resumen_tareas.usuario_id = semana_actual.usuario_id''',
+    )),
+)
+
+VERSION_ESQUEMA = MIGRACIONES[-1][0]
+
+
+def version_actual(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def pendientes(conn):
+    version = version_actual(conn)
+    return [m for m in MIGRACIONES if m[0] > version]
+
+
+def aplicar(conn):
+    """Aplica las migraciones pendientes en una conexión en modo autocommit; devuelve las aplicadas"""
+    if version_actual(conn) >= VERSION_ESQUEMA:
+        return []
+    aplicadas = []
+    for version, descripcion, sentencias in MIGRACIONES:
+        conn.execute('BEGIN EXCLUSIVE')
+        try:
+            # Otro proceso pudo haberla aplicado mientras esperábamos el lock
+            if version_actual(conn) >= version:
+                conn.rollback()
+                continue
+            for sentencia in sentencias:
+                conn.execute(sentencia)
+            conn.execute(f'PRAGMA user_version = {int(version)}')
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+        aplicadas.append((version, descripcion))
+    return aplicadas
+
+
+def migrar():
+    """Aplica las migraciones pendientes sobre DB_PATH y cada fragmento (todos tienen el mismo esquema)"""
+    from base_datos import todos_los_pools
+    from fragmentos import verificar
+    aplicadas = []
+    for pool in todos_los_pools():
+        with pool.conexion() as conn:
+            aplicadas.extend(aplicar(conn))
+    verificar()
+    return aplicadas
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Migraciones del esquema SQLite')
+    parser.add_argument('--estado', action='store_true', help='solo mostrar la versión y las pendientes')
+    args = parser.parse_args(argv)
+
+    from base_datos import todos_los_pools
+    for ruta in [p.ruta for p in todos_los_pools()]:
+        if os.path.dirname(ruta):
+            os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        conn = sqlite3.connect(ruta, isolation_level=None)
+        try:
+            # En una base nueva deja activo el vacuum incremental (ver mantenimiento.py)
+            conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+            if args.estado:
+                print(f'{ruta}: versión {version_actual(conn)} de {VERSION_ESQUEMA}')
+                for version, descripcion, _ in pendientes(conn):
+                    print(f'  pendiente {version}: {descripcion}')
+                continue
+            aplicadas = aplicar(conn)
+        finally:
+            conn.close()
+        for version, descripcion in aplicadas:
+            print(f'✅ {version}: {descripcion}')
+        print(f'{ruta}: esquema en la versión {VERSION_ESQUEMA}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
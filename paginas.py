@@ -0,0 +1,49 @@
+import gzip
+import hashlib
+import os
+from flask import Response, request
+
+CARPETA_PLANTILLAS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+CACHE_CONTROL = 'public, max-age=3600'
+
+
+class PaginaEstatica:
+    """Página HTML sin datos del usuario, precalculada como bytes (normal y gzip) con su ETag"""
+
+    def __init__(self, contenido):
+        self.cuerpo = contenido.encode('utf-8')
+        self.cuerpo_gzip = gzip.compress(self.cuerpo, compresslevel=9, mtime=0)
+        digest = hashlib.sha256(self.cuerpo).hexdigest()[:32]
+        # Cada codificación tiene su propio ETag fuerte
+        self.etag = f'"{digest}"'
+        self.etag_gzip = f'"{digest}-gz"'
+
+    def seleccionar(self, if_none_match, acepta_gzip):
+        """Devuelve (estado, cabeceras, cuerpo) sin depender del framework (WSGI o ASGI)"""
+        cabeceras = {'Cache-Control': CACHE_CONTROL, 'Vary': 'Accept-Encoding'}
+        if if_none_match and (self.etag in if_none_match or self.etag_gzip in if_none_match
+                              or if_none_match.strip() == '*'):
+            cabeceras['ETag'] = self.etag_gzip if self.etag_gzip in if_none_match else self.etag
+            return 304, cabeceras, b''
+
+        if acepta_gzip:
+            cabeceras['ETag'] = self.etag_gzip
+            cabeceras['Content-Encoding'] = 'gzip'
+            return 200, cabeceras, self.cuerpo_gzip
+        cabeceras['ETag'] = self.etag
+        return 200, cabeceras, self.cuerpo
+
+    def respuesta(self):
+        estado, cabeceras, cuerpo = self.seleccionar(request.headers.get('If-None-Match'),
+                                                     request.accept_encodings['gzip'] > 0)
+        return Response(cuerpo, status=estado, headers=cabeceras, mimetype='text/html')
+
+
+def cargar_pagina(nombre):
+    with open(os.path.join(CARPETA_PLANTILLAS, nombre), encoding='utf-8') as archivo:
+        return PaginaEstatica(archivo.read())
+
+
+# Formularios precalculados al arrancar
+pagina_registro = cargar_pagina('registro.html')
+pagina_login = cargar_pagina('login.html')
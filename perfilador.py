@@ -0,0 +1,277 @@
+"""Perfilador por muestreo de peticiones (pilas colapsadas para flamegraphs)
+
+Se activa con PERFIL_ACTIVO=1 (una fracción PERFIL_FRACCION de las peticiones) o,
+con PERFIL_CLAVE definida, para una petición puntual con la cabecera firmada
+`X-Perfil`. Mientras una petición perfilada está en curso, un hilo toma la pila
+de su hilo cada PERFIL_INTERVALO_MS y al terminar las escribe en formato
+colapsado (`raíz;módulo:función;... muestras`) en PERFIL_DIR/pilas-<pid>.txt,
+listo para flamegraph.pl o speedscope. Las peticiones más lentas que
+PERFIL_LENTA_MS se anotan en PERFIL_DIR/lentas.jsonl con el tiempo de cada fase
+(db, hash, render, sesion).
+
+Desactivado no envuelve la app: el único costo es una lectura de un threading.local
+en cada fase medida.
+
+    python perfilador.py --token --minutos 10        # valor para la cabecera X-Perfil
+    python perfilador.py --unir perfiles/pilas-*.txt > todo.txt
+"""
+import argparse
+import hashlib
+import hmac
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+from werkzeug.wsgi import ClosingIterator
+
+from metricas import fases_peticion
+
+# Configuración del perfilador (se puede cambiar con variables de entorno)
+PERFIL_ACTIVO = os.environ.get('PERFIL_ACTIVO', '0') == '1'
+PERFIL_FRACCION = float(os.environ.get('PERFIL_FRACCION', '0.01'))  # peticiones muestreadas con PERFIL_ACTIVO
+PERFIL_INTERVALO_MS = float(os.environ.get('PERFIL_INTERVALO_MS', '5'))  # milisegundos entre muestras
+PERFIL_LENTA_MS = float(os.environ.get('PERFIL_LENTA_MS', '250'))  # umbral del log de peticiones lentas
+PERFIL_DIR = os.environ.get('PERFIL_DIR', 'perfiles')
+PERFIL_CLAVE = os.environ.get('PERFIL_CLAVE', '')  # secreto para firmar X-Perfil (vacío = sin cabecera)
+PROFUNDIDAD_MAX = 128
+
+_ID = re.compile(r'/\d+(?=/|$)')
+
+
+def _firma(expira):
+    return hmac.new(PERFIL_CLAVE.encode('utf-8'), str(expira).encode('ascii'), hashlib.sha256).hexdigest()
+
+
+def generar_token(segundos=600):
+    """Valor de X-Perfil válido por `segundos`"""
+    if not PERFIL_CLAVE:
+        raise ValueError('Definir PERFIL_CLAVE para firmar la cabecera X-Perfil')
+    expira = int(time.time()) + int(segundos)
+    return f'{expira}.{_firma(expira)}'
+
+
+def token_valido(valor):
+    if not (PERFIL_CLAVE and valor):
+        return False
+    expira, _, firma = valor.partition('.')
+    if not expira.isdigit() or int(expira) < time.time():
+        return False
+    return hmac.compare_digest(firma, _firma(int(expira)))
+
+
+class Muestreador:
+    """Un hilo por proceso que toma las pilas de los hilos con una petición perfilada"""
+
+    def __init__(self, intervalo_ms=PERFIL_INTERVALO_MS):
+        self.intervalo = intervalo_ms / 1000
+        self._lock = threading.Lock()
+        self._hilos = {}
+        self._hay = threading.Event()
+        self._hilo = None
+        self._pid = None
+        self._nombres = {}
+        self.muestras = 0
+
+    def agregar(self, ident):
+        pilas = Counter()
+        with self._lock:
+            # El hilo se crea con la primera petición perfilada y se recrea después de un fork
+            if self._hilo is None or self._pid != os.getpid():
+                self._hilos = {}
+                self._hay = threading.Event()
+                self._pid = os.getpid()
+                self._hilo = threading.Thread(target=self._muestrear, name='perfilador', daemon=True)
+                self._hilo.start()
+            self._hilos[ident] = pilas
+            self._hay.set()
+        return pilas
+
+    def quitar(self, ident):
+        """Deja de muestrear el hilo; devuelve sus pilas, que el muestreador ya no vuelve a tocar"""
+        with self._lock:
+            pilas = self._hilos.pop(ident, None)
+            if not self._hilos:
+                self._hay.clear()
+            return Counter(pilas) if pilas is not None else None
+
+    def _nombre(self, codigo):
+        nombre = self._nombres.get(codigo)
+        if nombre is None:
+            modulo = os.path.splitext(os.path.basename(codigo.co_filename))[0]
+            nombre = self._nombres[codigo] = f'{modulo}:{codigo.co_name}'
+        return nombre
+
+    def _pila(self, marco):
+        nombres = []
+        while marco is not None and len(nombres) < PROFUNDIDAD_MAX:
+            nombres.append(self._nombre(marco.f_code))
+            marco = marco.f_back
+        return ';'.join(reversed(nombres))
+
+    def _muestrear(self):
+        while True:
+            self._hay.wait()
+            time.sleep(self.intervalo)
+            self._tomar_muestra()
+
+    def _tomar_muestra(self):
+        with self._lock:
+            hilos = list(self._hilos.items())
+        marcos = sys._current_frames()
+        tomadas = [(ident, pilas, self._pila(marcos[ident])) for ident, pilas in hilos if ident in marcos]
+        del marcos
+        with self._lock:
+            for ident, pilas, pila in tomadas:
+                # La petición pudo terminar mientras se leían las pilas: sus datos ya no cambian
+                if self._hilos.get(ident) is pilas:
+                    pilas[pila] += 1
+                    self.muestras += 1
+
+
+class Perfilador:
+    def __init__(self, activo=PERFIL_ACTIVO, fraccion=PERFIL_FRACCION, lenta_ms=PERFIL_LENTA_MS, directorio=PERFIL_DIR):
+        self.activo = activo
+        self.fraccion = fraccion
+        self.lenta = lenta_ms / 1000
+        self.directorio = directorio
+        self.muestreador = Muestreador()
+        self._lock = threading.Lock()
+        self._perfiladas = 0
+        self._lentas = 0
+        self._tokens_invalidos = 0
+
+    def habilitado(self):
+        return self.activo or bool(PERFIL_CLAVE)
+
+    def envolver(self, wsgi_app):
+        """Middleware WSGI: cubre también la carga y el guardado de la sesión"""
+        def app(environ, start_response):
+            return self._atender(wsgi_app, environ, start_response)
+        return app
+
+    def _atender(self, wsgi_app, environ, start_response):
+        cabecera = environ.get('HTTP_X_PERFIL')
+        perfilar = token_valido(cabecera) if cabecera else (self.activo and random.random() < self.fraccion)
+        if cabecera and not perfilar:
+            with self._lock:
+                self._tokens_invalidos += 1
+        if not (perfilar or self.activo):
+            return wsgi_app(environ, start_response)
+
+        ident = threading.get_ident()
+        pilas = self.muestreador.agregar(ident) if perfilar else None
+        fases_peticion.fases = fases = {}
+        inicio = time.perf_counter()
+        respuesta = {}
+
+        def start_response_medido(estado, cabeceras, exc_info=None):
+            respuesta['estado'] = int(estado.split(' ', 1)[0])
+            respuesta['tipo'] = next((v for k, v in cabeceras if k.lower() == 'content-type'), '')
+            return start_response(estado, cabeceras, exc_info)
+
+        def terminar():
+            finales = self.muestreador.quitar(ident) if pilas is not None else None
+            fases_peticion.fases = None
+            self._anotar(environ, respuesta, time.perf_counter() - inicio, fases, finales)
+
+        try:
+            resultado = wsgi_app(environ, start_response_medido)
+        except BaseException:
+            terminar()
+            raise
+        # El cuerpo puede generarse después (streaming): se cierra el perfil al terminar de enviarlo
+        return ClosingIterator(resultado, terminar)
+
+    def _anotar(self, environ, respuesta, duracion, fases, pilas):
+        ruta = _ID.sub('/<id>', environ.get('PATH_INFO', ''))
+        metodo = environ.get('REQUEST_METHOD', '')
+        # Una conexión SSE dura lo que el cliente quiera: no es una petición lenta
+        lenta = duracion >= self.lenta and not respuesta.get('tipo', '').startswith('text/event-stream')
+        if pilas is None and not lenta:
+            return
+        os.makedirs(self.directorio, exist_ok=True)
+        if pilas:
+            raiz = f'{metodo} {ruta}'.replace(';', ':')
+            with open(os.path.join(self.directorio, f'pilas-{os.getpid()}.txt'), 'a', encoding='utf-8') as archivo:
+                archivo.write(''.join(f'{raiz};{pila} {n}\n' for pila, n in pilas.items()))
+        if lenta or pilas is not None:
+            registro = {
+                'fecha': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'pid': os.getpid(),
+                'metodo': metodo,
+                'ruta': ruta,
+                'estado': respuesta.get('estado'),
+                'ms': round(duracion * 1000, 3),
+                'fases_ms': {fase: round(s * 1000, 3) for fase, s in fases.items()},
+                'otros_ms': round((duracion - sum(fases.values())) * 1000, 3),
+                'muestras': sum(pilas.values()) if pilas is not None else None,
+            }
+            with open(os.path.join(self.directorio, 'lentas.jsonl'), 'a', encoding='utf-8') as archivo:
+                archivo.write(json.dumps(registro, ensure_ascii=False) + '\n')
+        with self._lock:
+            self._perfiladas += pilas is not None
+            self._lentas += lenta
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                'activo': self.activo,
+                'fraccion': self.fraccion,
+                'perfiladas': self._perfiladas,
+                'lentas': self._lentas,
+                'tokens_invalidos': self._tokens_invalidos,
+                'muestras': self.muestreador.muestras,
+            }
+
+
+perfilador = Perfilador()
+
+
+def instrumentar(app):
+    """Envuelve app.wsgi_app si el perfilador está habilitado (si no, no cambia nada)"""
+    if perfilador.habilitado():
+        app.wsgi_app = perfilador.envolver(app.wsgi_app)
+
+
+def estadisticas():
+    return perfilador.estadisticas()
+
+
+def unir(rutas):
+    """Suma las pilas de varios archivos (p. ej. de todos los workers) en un solo perfil colapsado"""
+    total = Counter()
+    for ruta in rutas:
+        with open(ruta, encoding='utf-8') as archivo:
+            for linea in archivo:
+                pila, _, muestras = linea.rstrip('\n').rpartition(' ')
+                if pila and muestras.isdigit():
+                    total[pila] += int(muestras)
+    return total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Perfilador por muestreo de peticiones')
+    parser.add_argument('--token', action='store_true', help='generar un valor para la cabecera X-Perfil')
+    parser.add_argument('--minutos', type=float, default=10, help='validez del token')
+    parser.add_argument('--unir', nargs='+', metavar='ARCHIVO', help='sumar archivos de pilas colapsadas')
+    args = parser.parse_args(argv)
+    if args.token:
+        try:
+            print(generar_token(args.minutos * 60))
+        except ValueError as e:
+            parser.error(str(e))
+    elif args.unir:
+        for pila, muestras in sorted(unir(args.unir).items()):
+            print(f'{pila} {muestras}')
+    else:
+        parser.error('indicar --token o --unir')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,263 @@
+"""Lanzador de producción con varios procesos (prefork)
+
+    python produccion.py --workers 4 --port 5000
+
+El proceso maestro inicializa la base de datos una sola vez, abre el socket y crea
+los workers con fork(). Cada worker hace un calentamiento antes de aceptar tráfico
+y se recicla después de --max-peticiones. Señales del maestro:
+    SIGHUP           reinicio escalonado: se reemplaza un worker por vez (releyendo la política de hashing)
+    SIGTERM / SIGINT apagado ordenado (los workers terminan lo que están atendiendo)
+"""
+import argparse
+import os
+import random
+import select
+import signal
+import socket
+import sys
+import threading
+import time
+
+from werkzeug.wsgi import ClosingIterator
+
+WORKERS = int(os.environ.get('WORKERS', str(os.cpu_count() or 1)))
+HOST = os.environ.get('HOST', '0.0.0.0')
+PORT = int(os.environ.get('PORT', '5000'))
+MAX_PETICIONES = int(os.environ.get('MAX_PETICIONES', '10000'))  # 0 = nunca reciclar
+MAX_PETICIONES_JITTER = int(os.environ.get('MAX_PETICIONES_JITTER', '1000'))
+ESPERA_LISTO = float(os.environ.get('ESPERA_LISTO', '60'))  # segundos máximos de calentamiento
+GRACIA = float(os.environ.get('GRACIA', '30'))  # segundos para terminar peticiones en curso
+
+
+def crear_socket(host, port, reuseport=False, backlog=2048):
+    sock = socket.socket(socket.AF_INET6 if ':' in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuseport:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+class ContadorPeticiones:
+    """Envuelve la app WSGI para contar peticiones y pedir el reciclaje del worker"""
+
+    def __init__(self, app, limite, al_limite):
+        self.app = app
+        self.limite = limite
+        self.al_limite = al_limite
+        self.atendidas = 0
+        self.en_curso = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, environ, start_response):
+        with self._lock:
+            self.atendidas += 1
+            self.en_curso += 1
+            alcanzado = self.limite and self.atendidas == self.limite
+
+        def terminar():
+            with self._lock:
+                self.en_curso -= 1
+            if alcanzado:
+                self.al_limite()
+
+        try:
+            resultado = self.app(environ, start_response)
+        except BaseException:
+            terminar()
+            raise
+        # La petición sigue en curso hasta que se envía el cuerpo (exportaciones, SSE): se descuenta al cerrarlo
+        return ClosingIterator(resultado, terminar)
+
+
+def calentar(app):
+    """Deja listas las conexiones, plantillas, el índice de usuarios y el pool de hashing antes de aceptar tráfico"""
+    from base_datos import conexion
+    from hashing import servicio_hash
+    from indice_usuarios import indice
+    with conexion() as conn:
+        conn.execute('SELECT 1 FROM usuarios LIMIT 1').fetchall()
+    if indice:
+        indice.preparar()
+    servicio_hash.verificar('pbkdf2:sha256:1$calentamiento$0', 'calentamiento')
+    with app.test_client() as cliente:
+        cliente.get('/')
+        cliente.get('/login')
+
+
+def ejecutar_worker(app, sock, aviso_listo, args):
+    from werkzeug.serving import make_server
+    from hashing import servicio_hash
+    from mantenimiento import iniciar as iniciar_mantenimiento
+
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if sock is None:
+        # Con SO_REUSEPORT el kernel reparte las conexiones entre los sockets de cada worker
+        sock = crear_socket(args.host, args.port, reuseport=True)
+
+    limite = args.max_peticiones + random.randint(0, args.jitter) if args.max_peticiones else 0
+    servidor_http = None
+
+    def detener(*_):
+        # shutdown() espera al bucle de serve_forever: se llama desde otro hilo
+        threading.Thread(target=servidor_http.shutdown, daemon=True).start()
+
+    contador = ContadorPeticiones(app, limite, detener)
+    calentar(app)
+    # Todos los workers compiten por el lock del mantenimiento; solo uno lo ejecuta
+    iniciar_mantenimiento()
+    servidor_http = make_server(args.host, args.port, contador, threaded=True, fd=sock.fileno())
+    signal.signal(signal.SIGTERM, detener)
+
+    os.write(aviso_listo, b'1')
+    os.close(aviso_listo)
+    servidor_http.serve_forever()
+
+    # Terminar las peticiones en curso antes de salir
+    fin = time.monotonic() + GRACIA
+    while contador.en_curso and time.monotonic() < fin:
+        time.sleep(0.05)
+    servicio_hash.cerrar()
+    os._exit(0)
+
+
+class Maestro:
+    def __init__(self, app, args):
+        self.app = app
+        self.args = args
+        # Con --reuseport el maestro no escucha: cada worker abre su propio socket
+        self.sock = None if args.reuseport else crear_socket(args.host, args.port)
+        self.workers = {}  # pid -> momento de inicio
+        self.reiniciar = False
+        self.detener = False
+
+    def _lanzar(self):
+        lectura, escritura = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(lectura)
+            try:
+                ejecutar_worker(self.app, self.sock, escritura, self.args)
+            finally:
+                os._exit(1)
+        os.close(escritura)
+        self.workers[pid] = time.monotonic()
+        return pid, lectura
+
+    def _esperar_listo(self, pid, lectura):
+        try:
+            listos, _, _ = select.select([lectura], [], [], ESPERA_LISTO)
+            ok = bool(listos) and os.read(lectura, 1) == b'1'
+        finally:
+            os.close(lectura)
+        if not ok:
+            print(f'⚠️  El worker {pid} no terminó el calentamiento', file=sys.stderr)
+        return ok
+
+    def _recolectar(self):
+        while self.workers:
+            try:
+                pid, estado = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            self.workers.pop(pid, None)
+
+    def _reinicio_escalonado(self):
+        print('🔄 Reinicio escalonado de workers', file=sys.stderr)
+        # Los workers heredan la política de hashing del maestro: se relee por si se guardó otra
+        from base_datos import cerrar
+        from hashing import preparar_politica
+        metodo, origen = preparar_politica()
+        cerrar()
+        print(f'🔐 Hash de contraseñas: {metodo} ({origen})', file=sys.stderr)
+        for viejo in list(self.workers):
+            pid, lectura = self._lanzar()
+            self._esperar_listo(pid, lectura)
+            self._terminar(viejo)
+
+    def _terminar(self, pid):
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            self.workers.pop(pid, None)
+            return
+        fin = time.monotonic() + GRACIA + 5
+        while time.monotonic() < fin:
+            try:
+                terminado, _ = os.waitpid(pid, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if terminado:
+                break
+            time.sleep(0.05)
+        else:
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+        self.workers.pop(pid, None)
+
+    def ejecutar(self):
+        signal.signal(signal.SIGHUP, lambda *_: setattr(self, 'reiniciar', True))
+        signal.signal(signal.SIGTERM, lambda *_: setattr(self, 'detener', True))
+        signal.signal(signal.SIGINT, lambda *_: setattr(self, 'detener', True))
+
+        for _ in range(self.args.workers):
+            self._esperar_listo(*self._lanzar())
+        print(f'🌐 {self.args.workers} workers atendiendo en http://{self.args.host}:{self.args.port}',
+              file=sys.stderr)
+
+        while not self.detener:
+            time.sleep(0.2)
+            self._recolectar()
+            if self.reiniciar:
+                self.reiniciar = False
+                self._reinicio_escalonado()
+            # Reponer los workers que se reciclaron o murieron
+            while len(self.workers) < self.args.workers and not self.detener:
+                self._esperar_listo(*self._lanzar())
+
+        print('🛑 Deteniendo workers...', file=sys.stderr)
+        for pid in list(self.workers):
+            self._terminar(pid)
+        if self.sock:
+            self.sock.close()
+
+
+def parsear_argumentos(argv=None):
+    parser = argparse.ArgumentParser(description='Servidor de producción con varios procesos')
+    parser.add_argument('--workers', type=int, default=WORKERS)
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--max-peticiones', type=int, default=MAX_PETICIONES,
+                        help='peticiones antes de reciclar un worker (0 = nunca)')
+    parser.add_argument('--jitter', type=int, default=MAX_PETICIONES_JITTER,
+                        help='variación aleatoria de --max-peticiones para no reciclar todos a la vez')
+    parser.add_argument('--reuseport', action='store_true',
+                        help='cada worker abre su propio socket con SO_REUSEPORT')
+    return parser.parse_args(argv)
+
+
+def main(app=None, argv=None):
+    args = parsear_argumentos(argv)
+    if app is None:
+        from servidor import app
+    # Las migraciones corren una vez en el maestro; los workers solo comprueban la versión
+    from migraciones import migrar
+    migrar()
+    # La política de hashing (guardada o calibrada en esta máquina) la heredan los workers
+    from hashing import preparar_politica, repartir_procesos
+    metodo, origen = preparar_politica()
+    procesos = repartir_procesos(args.workers)
+    print(f'🔐 Hash de contraseñas: {metodo} ({origen}), {procesos} procesos por worker', flush=True)
+    # Una conexión SQLite no debe cruzar un fork: el maestro cierra las suyas antes de crear workers
+    from base_datos import cerrar
+    cerrar()
+    Maestro(app, args).ejecutar()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""Contadores de tareas por usuario para el panel de /tareas
+
+La tabla `resumen_tareas` (migración 5) la mantienen los triggers de `tareas`,
+así que leer el panel es una búsqueda por clave primaria. Si los contadores se
+desvían (tareas cargadas con los triggers desactivados, restauraciones parciales),
+se recalculan desde cero:
+
+    python resumen.py --reconciliar              # todos los usuarios
+    python resumen.py --reconciliar --usuario 7  # uno solo
+"""
+import argparse
+import sys
+
+from base_datos import pool_de, pools_tareas
+
+# Clave de la semana (migración 11): el jueves de la semana ISO, de lunes a domingo en UTC
+_SEMANA = "date({}, 'weekday 0', '-3 days')"
+_SEMANA_ACTUAL = _SEMANA.format("'now'")
+
+_RECALCULO = f'''
+    SELECT usuario_id, count(*) AS total, sum(completada != 0) AS completadas,
+           {_SEMANA_ACTUAL} AS semana,
+           sum({_SEMANA.format('fecha_creacion')} = {_SEMANA_ACTUAL}) AS creadas_semana
+    FROM tareas WHERE {{filtro}} GROUP BY usuario_id
+'''
+
+
+def leer_resumen(conn, usuario_id):
+    """{'total', 'pendientes', 'completadas', 'creadas_semana'} del usuario"""
+    fila = conn.execute(
+        f'SELECT total, completadas, CASE WHEN semana = {_SEMANA_ACTUAL} THEN creadas_semana ELSE 0 END '
+        'FROM resumen_tareas WHERE usuario_id = ?', (usuario_id,)).fetchone()
+    total, completadas, creadas_semana = fila if fila else (0, 0, 0)
+    return {
+        'total': total,
+        'pendientes': total - completadas,
+        'completadas': completadas,
+        'creadas_semana': creadas_semana,
+    }
+
+
+def leer_version(conn, usuario_id):
+    """(versión, epoch de la última modificación) de las tareas del usuario; (0, None) si nunca tuvo"""
+    fila = conn.execute('SELECT version, modificado FROM resumen_tareas WHERE usuario_id = ?',
+                        (usuario_id,)).fetchone()
+    return tuple(fila) if fila else (0, None)
+
+
+def reconciliar(usuario_id=None):
+    """Recalcula los contadores desde `tareas`; devuelve cuántos usuarios tenían valores distintos"""
+    if usuario_id is None:
+        filtro, parametros, pools = 'usuario_id IS NOT NULL', (), pools_tareas()
+    else:
+        filtro, parametros, pools = 'usuario_id = ?', (usuario_id,), [pool_de(usuario_id)]
+    return sum(_reconciliar(p, filtro, parametros) for p in pools)
+
+
+def _reconciliar(pool, filtro, parametros):
+    with pool.conexion() as conn:
+        conn.execute('BEGIN IMMEDIATE')
+        anteriores = {fila[0]: tuple(fila[1:]) for fila in conn.execute(
+            f"SELECT usuario_id, total, completadas, "
+            f"CASE WHEN semana = {_SEMANA_ACTUAL} THEN creadas_semana ELSE 0 END "
+            f"FROM resumen_tareas WHERE {filtro}", parametros)}
+        nuevos = {fila[0]: tuple(fila[1:3]) + (fila[4],) for fila in conn.execute(
+            _RECALCULO.format(filtro=filtro), parametros)}
+        # Se actualiza en el lugar (sin DELETE) para no perder la versión de cada usuario
+        conn.execute(f'UPDATE resumen_tareas SET total = 0, completadas = 0, creadas_semana = 0 WHERE {filtro}',
+                     parametros)
+        conn.execute('INSERT INTO resumen_tareas (usuario_id, total, completadas, semana, creadas_semana) '
+                     + _RECALCULO.format(filtro=filtro)
+                     + 'ON CONFLICT (usuario_id) DO UPDATE SET total = excluded.total, '
+                       'completadas = excluded.completadas, semana = excluded.semana, '
+                       'creadas_semana = excluded.creadas_semana', parametros)
+        conn.commit()
+    # Un usuario sin tareas y sin fila equivale a una fila en cero
+    cero = (0, 0, 0)
+    return sum(1 for uid in anteriores.keys() | nuevos.keys()
+               if anteriores.get(uid, cero) != nuevos.get(uid, cero))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Contadores de tareas por usuario')
+    parser.add_argument('--reconciliar', action='store_true', help='recalcular los contadores desde tareas')
+    parser.add_argument('--usuario', type=int, help='solo este usuario')
+    args = parser.parse_args(argv)
+    if not args.reconciliar:
+        parser.error('indicar --reconciliar')
+    corregidos = reconciliar(args.usuario)
+    print(f'✅ Contadores recalculados ({corregidos} usuarios con diferencias)')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
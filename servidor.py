@@ -1,245 +1,184 @@
-from flask import Flask, request, jsonify, render_template_string, session, redirect, url_for
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask import Flask, request, jsonify, session, redirect, url_for
+import hmac
 import sqlite3
 import os
+import sys
+import json
+import time
 from datetime import datetime
+from base_datos import conexion, transaccion, PoolAgotado, estadisticas as estadisticas_db
+from hashing import servicio_hash, ServicioSaturado, preparar_politica
+from cola_escritura import EscrituraSaturada, estadisticas as estadisticas_escritura
+from eventos import estadisticas as estadisticas_eventos
+from limitador import admitir, DemasiadosIntentos, estadisticas as estadisticas_limitador
+from api_tareas import api_tareas, condicionales
+from paginas import pagina_registro, pagina_login
+from sesiones import crear_interfaz_sesion, regenerar_id, almacen as almacen_sesiones
+from metricas import instrumentar, medir, registro as registro_metricas
+from perfilador import instrumentar as instrumentar_perfilador, estadisticas as estadisticas_perfilador
+from migraciones import migrar
+from resumen import leer_resumen
+from mantenimiento import iniciar as iniciar_mantenimiento, estadisticas as estadisticas_mantenimiento
+from indice_usuarios import indice as indice_usuarios, estadisticas as estadisticas_indice
+from usuarios import leer_credenciales, registrar, autenticar, DatosInvalidos, UsuarioExistente
 
 app = Flask(__name__)
 app.secret_key = 'tu_clave_secreta_aqui'  # En producción, usar una clave segura
+app.register_blueprint(api_tareas)
+app.session_interface = crear_interfaz_sesion()
 
-# Crear la base de datos y tablas
-def init_db():
-    conn = sqlite3.connect('usuarios.db')
-    cursor = conn.cursor()
-    
-    # Crear tabla de usuarios
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS usuarios (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            usuario TEXT UNIQUE NOT NULL,
-            contraseña TEXT NOT NULL,
-            fecha_registro TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # Crear tabla de tareas
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS tareas (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            usuario_id INTEGER,
-            titulo TEXT NOT NULL,
-            descripcion TEXT,
-            completada BOOLEAN DEFAULT 0,
-            fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (usuario_id) REFERENCES usuarios (id)
-        )
-    ''')
-    
-    conn.commit()
-    conn.close()
+# Métricas por ruta y por fase (db, hash, render, sesion) en /metrics
+instrumentar(app)
+registro_metricas.agregar_estadisticas('db_pool', estadisticas_db)
+registro_metricas.agregar_estadisticas('hash', servicio_hash.estadisticas)
+registro_metricas.agregar_estadisticas('sesiones', almacen_sesiones.estadisticas)
+registro_metricas.agregar_estadisticas('escritura', estadisticas_escritura)
+registro_metricas.agregar_estadisticas('limitador', estadisticas_limitador)
+registro_metricas.agregar_estadisticas('condicional', condicionales.estadisticas)
+registro_metricas.agregar_estadisticas('eventos', estadisticas_eventos)
+registro_metricas.agregar_estadisticas('indice_usuarios', estadisticas_indice)
+registro_metricas.agregar_estadisticas('mantenimiento', estadisticas_mantenimiento)
+
+# Perfilador por muestreo (PERFIL_ACTIVO / cabecera X-Perfil); desactivado no envuelve la app
+instrumentar_perfilador(app)
+registro_metricas.agregar_estadisticas('perfilador', estadisticas_perfilador)
 
-# Inicializar la base de datos
-init_db()
+# Plantilla de /tareas compilada al arrancar, no en cada petición
+plantilla_tareas = app.jinja_env.get_template('tareas.html')
+
+# El esquema lo crean las migraciones (migraciones.py) la primera vez que se usa la base;
+# importar este módulo no toca la base de datos
+def init_db():
+    return migrar()
 
 @app.route('/registro', methods=['GET', 'POST'])
 def registro():
     if request.method == 'GET':
         """Muestra un formulario HTML simple para registro"""
-        html_form = '''
-        <!DOCTYPE html>
-        <html lang="es">
-        <head>
-            <meta charset="UTF-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-            <title>Registro de Usuario</title>
-            <style>
-                body {
-                    font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-                    margin: 0;
-                    padding: 20px;
-                    background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-                    min-height: 100vh;
-                    display: flex;
-                    align-items: center;
-                    justify-content: center;
-                }
-                .container {
-                    background: white;
-                    padding: 40px;
-                    border-radius: 15px;
-                    box-shadow: 0 10px 30px rgba(0,0,0,0.2);
-                    width: 100%;
-                    max-width: 400px;
-                }
-                h1 {
-                    text-align: center;
-                    color: #333;
-                    margin-bottom: 30px;
-                }
-                .form-group {
-                    margin-bottom: 20px;
-                }
-                label {
-                    display: block;
-                    margin-bottom: 5px;
-                    color: #555;
-                    font-weight: 500;
-                }
-                input[type="text"], input[type="password"] {
-                    width: 100%;
-                    padding: 12px;
-                    border: 2px solid #ddd;
-                    border-radius: 8px;
-                    font-size: 16px;
-                    box-sizing: border-box;
-                    transition: border-color 0.3s ease;
-                }
-                input[type="text"]:focus, input[type="password"]:focus {
-                    outline: none;
-                    border-color: #4facfe;
-                }
-                button {
-                    width: 100%;
-                    padding: 12px;
-                    background: linear-gradient(135deg, #4facfe 0%, #00f2fe 100%);
-                    color: white;
-                    border: none;
-                    border-radius: 8px;
-                    font-size: 16px;
-                    cursor: pointer;
-                    transition: transform 0.3s ease;
-                }
-                button:hover {
-                    transform: translateY(-2px);
-                }
-                .links {
-                    text-align: center;
-                    margin-top: 20px;
-                }
-                .links a {
-                    color: #4facfe;
-                    text-decoration: none;
-                    margin: 0 10px;
-                }
-                .links a:hover {
-                    text-decoration: underline;
-                }
-                #resultado {
-                    margin-top: 20px;
-                    padding: 10px;
-                    border-radius: 5px;
-                    display: none;
-                }
-                .success {
-                    background: #d4edda;
-                    color: #155724;
-                    border: 1px solid #c3e6cb;
-                }
-                .error {
-                    background: #f8d7da;
-                    color: #721c24;
-                    border: 1px solid #f5c6cb;
-                }
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <h1>👤 Registro de Usuario</h1>
-                <form id="registroForm">
-                    <div class="form-group">
-                        <label for="usuario">Usuario:</label>
-                        <input type="text" id="usuario" name="usuario" required>
-                    </div>
-                    <div class="form-group">
-                        <label for="contraseña">Contraseña:</label>
-                        <input type="password" id="contraseña" name="contraseña" required>
-                    </div>
-                    <button type="submit">📝 Registrar Usuario</button>
-                </form>
-                
-                <div id="resultado"></div>
-                
-                <div class="links">
-                    <a href="/login">🔐 Iniciar Sesión</a>
-                </div>
-            </div>
-
-            <script>
-                document.getElementById('registroForm').addEventListener('submit', async function(e) {
-                    e.preventDefault();
-                    
-                    const usuario = document.getElementById('usuario').value;
-                    const contraseña = document.getElementById('contraseña').value;
-                    const resultado = document.getElementById('resultado');
-                    
-                    try {
-                        const response = await fetch('/registro', {
-                            method: 'POST',
-                            headers: {
-                                'Content-Type': 'application/json',
-                            },
-                            body: JSON.stringify({
-                                usuario: usuario,
-                                contraseña: contraseña
-                            })
-                        });
-                        
-                        const data = await response.json();
-                        
-                        resultado.style.display = 'block';
-                        if (response.ok) {
-                            resultado.className = 'success';
-                            resultado.textContent = data.mensaje;
-                            document.getElementById('registroForm').reset();
-                        } else {
-                            resultado.className = 'error';
-                            resultado.textContent = data.error;
-                        }
-                    } catch (error) {
-                        resultado.style.display = 'block';
-                        resultado.className = 'error';
-                        resultado.textContent = 'Error de conexión: ' + error.message;
-                    }
-                });
-            </script>
-        </body>
-        </html>
-        '''
-        return html_form
+        return pagina_registro.respuesta()
     
     # Método POST - Lógica original
     try:
-        data = request.get_json()
-        
-        if not data or 'usuario' not in data or 'contraseña' not in data:
-            return jsonify({'error': 'Datos incompletos. Se requiere usuario y contraseña'}), 400
+        usuario, contraseña = leer_credenciales(request.get_json(), validar_vacios=True)
+        admitir(request.remote_addr)
+        registrar(usuario, contraseña)
+        return jsonify({'mensaje': 'Usuario registrado exitosamente'}), 201
+    
+    except DatosInvalidos as e:
+        return jsonify({'error': str(e)}), 400
+    except UsuarioExistente:
+        return jsonify({'error': 'El usuario ya existe'}), 409
+    except DemasiadosIntentos as e:
+        return demasiados_intentos(e)
+    except (ServicioSaturado, EscrituraSaturada) as e:
+        return servicio_saturado(e)
+    except Exception as e:
+        return jsonify({'error': f'Error interno del servidor: {str(e)}'}), 500
+
+# Tamaño máximo de un lote de registro y de las consultas IN (...)
+LOTE_MAX = int(os.environ.get('LOTE_MAX', '10000'))
+TROZO_SQL = 500
+# Clave de administración para /registro/lote (vacía = endpoint deshabilitado)
+LOTE_CLAVE = os.environ.get('LOTE_CLAVE', '')
+
+def _clave_lote_valida():
+    esquema, _, clave = request.headers.get('Authorization', '').partition(' ')
+    return esquema.lower() == 'bearer' and hmac.compare_digest(clave.encode('utf-8'), LOTE_CLAVE.encode('utf-8'))
+
+def _leer_lote():
+    """Devuelve las filas del cuerpo: un arreglo JSON o NDJSON (una fila por línea)"""
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        filas = []
+        for linea in request.stream:
+            linea = linea.strip()
+            if not linea:
+                continue
+            try:
+                filas.append(json.loads(linea))
+            except ValueError:
+                filas.append(None)
+            if len(filas) > LOTE_MAX:
+                break
+        return filas
+    data = request.get_json(silent=True)
+    return data if isinstance(data, list) else None
+
+def _usuarios_existentes(conn, nombres):
+    existentes = set()
+    for i in range(0, len(nombres), TROZO_SQL):
+        trozo = nombres[i:i + TROZO_SQL]
+        marcas = ','.join('?' * len(trozo))
+        existentes.update(fila[0] for fila in conn.execute(
+            f'SELECT usuario FROM usuarios WHERE usuario IN ({marcas})', trozo))
+    return existentes
+
+@app.route('/registro/lote', methods=['POST'])
+def registro_lote():
+    inicio = time.perf_counter()
+    try:
+        # Un lote puede pedir miles de hashes: solo con la clave de administración y con límite por IP
+        admitir(request.remote_addr)
+        if not LOTE_CLAVE:
+            return jsonify({'error': 'Registro masivo deshabilitado (definir LOTE_CLAVE)'}), 403
+        if not _clave_lote_valida():
+            return jsonify({'error': 'Se requiere la clave de administración'}), 401
+        filas = _leer_lote()
+        if filas is None:
+            return jsonify({'error': 'Se esperaba un arreglo JSON o un cuerpo NDJSON'}), 400
+        if len(filas) > LOTE_MAX:
+            return jsonify({'error': f'El lote supera el máximo de {LOTE_MAX} usuarios'}), 413
         
-        usuario = data['usuario']
-        contraseña = data['contraseña']
+        # Validar cada fila y descartar nombres repetidos dentro del mismo lote
+        resultados = []
+        candidatos = {}
+        for indice, fila in enumerate(filas):
+            usuario = fila.get('usuario') if isinstance(fila, dict) else None
+            contraseña = fila.get('contraseña') if isinstance(fila, dict) else None
+            resultado = {'fila': indice, 'usuario': usuario}
+            if not isinstance(usuario, str) or not isinstance(contraseña, str) \
+                    or not usuario.strip() or not contraseña.strip():
+                resultado['estado'] = 'invalido'
+            elif usuario in candidatos:
+                resultado['estado'] = 'duplicado'
+            else:
+                candidatos[usuario] = (resultado, contraseña)
+            resultados.append(resultado)
         
-        # Validar que los campos no estén vacíos
-        if not usuario.strip() or not contraseña.strip():
-            return jsonify({'error': 'Usuario y contraseña no pueden estar vacíos'}), 400
+        # Los usuarios que ya existen no se hashean (el índice descarta los nombres que seguro no están)
+        posibles = [u for u in candidatos if indice_usuarios is None or indice_usuarios.puede_existir(u)]
+        with conexion() as conn:
+            for usuario in _usuarios_existentes(conn, posibles):
+                candidatos.pop(usuario)[0]['estado'] = 'duplicado'
         
-        # Hash de la contraseña
-        contraseña_hash = generate_password_hash(contraseña)
+        nombres = list(candidatos)
+        hashes = servicio_hash.generar_lote(candidatos[u][1] for u in nombres)
         
-        # Guardar en la base de datos
-        conn = sqlite3.connect('usuarios.db')
-        cursor = conn.cursor()
+        # Una sola transacción; se vuelve a verificar por si otro registro llegó mientras se hasheaba
+        with transaccion() as conn:
+            existentes = _usuarios_existentes(conn, nombres)
+            nuevos = [(u, h) for u, h in zip(nombres, hashes) if u not in existentes]
+            conn.executemany('INSERT INTO usuarios (usuario, contraseña) VALUES (?, ?)', nuevos)
+        if indice_usuarios:
+            indice_usuarios.agregar(u for u, _ in nuevos)
+        for usuario in nombres:
+            candidatos[usuario][0]['estado'] = 'duplicado' if usuario in existentes else 'creado'
         
-        try:
-            cursor.execute('INSERT INTO usuarios (usuario, contraseña) VALUES (?, ?)', 
-                         (usuario, contraseña_hash))
-            conn.commit()
-            conn.close()
-            
-            return jsonify({'mensaje': 'Usuario registrado exitosamente'}), 201
-            
-        except sqlite3.IntegrityError:
-            conn.close()
-            return jsonify({'error': 'El usuario ya existe'}), 409
-            
+        segundos = time.perf_counter() - inicio
+        conteo = {estado: sum(1 for r in resultados if r['estado'] == estado)
+                  for estado in ('creado', 'duplicado', 'invalido')}
+        return jsonify({
+            'creados': conteo['creado'],
+            'duplicados': conteo['duplicado'],
+            'invalidos': conteo['invalido'],
+            'segundos': round(segundos, 3),
+            'usuarios_por_segundo': round(conteo['creado'] / segundos, 1) if segundos else None,
+            'resultados': resultados
+        }), 200
+    
+    except DemasiadosIntentos as e:
+        return demasiados_intentos(e)
+    except ServicioSaturado as e:
+        return servicio_saturado(e)
     except Exception as e:
         return jsonify({'error': f'Error interno del servidor: {str(e)}'}), 500
 
@@ -247,202 +186,38 @@ def registro():
 def login():
     if request.method == 'GET':
         """Muestra un formulario HTML simple para login"""
-        html_form = '''
-        <!DOCTYPE html>
-        <html lang="es">
-        <head>
-            <meta charset="UTF-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-            <title>Iniciar Sesión</title>
-            <style>
-                body {
-                    font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-                    margin: 0;
-                    padding: 20px;
-                    background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-                    min-height: 100vh;
-                    display: flex;
-                    align-items: center;
-                    justify-content: center;
-                }
-                .container {
-                    background: white;
-                    padding: 40px;
-                    border-radius: 15px;
-                    box-shadow: 0 10px 30px rgba(0,0,0,0.2);
-                    width: 100%;
-                    max-width: 400px;
-                }
-                h1 {
-                    text-align: center;
-                    color: #333;
-                    margin-bottom: 30px;
-                }
-                .form-group {
-                    margin-bottom: 20px;
-                }
-                label {
-                    display: block;
-                    margin-bottom: 5px;
-                    color: #555;
-                    font-weight: 500;
-                }
-                input[type="text"], input[type="password"] {
-                    width: 100%;
-                    padding: 12px;
-                    border: 2px solid #ddd;
-                    border-radius: 8px;
-                    font-size: 16px;
-                    box-sizing: border-box;
-                    transition: border-color 0.3s ease;
-                }
-                input[type="text"]:focus, input[type="password"]:focus {
-                    outline: none;
-                    border-color: #4facfe;
-                }
-                button {
-                    width: 100%;
-                    padding: 12px;
-                    background: linear-gradient(135deg, #4facfe 0%, #00f2fe 100%);
-                    color: white;
-                    border: none;
-                    border-radius: 8px;
-                    font-size: 16px;
-                    cursor: pointer;
-                    transition: transform 0.3s ease;
-                }
-                button:hover {
-                    transform: translateY(-2px);
-                }
-                .links {
-                    text-align: center;
-                    margin-top: 20px;
-                }
-                .links a {
-                    color: #4facfe;
-                    text-decoration: none;
-                    margin: 0 10px;
-                }
-                .links a:hover {
-                    text-decoration: underline;
-                }
-                #resultado {
-                    margin-top: 20px;
-                    padding: 10px;
-                    border-radius: 5px;
-                    display: none;
-                }
-                .success {
-                    background: #d4edda;
-                    color: #155724;
-                    border: 1px solid #c3e6cb;
-                }
-                .error {
-                    background: #f8d7da;
-                    color: #721c24;
-                    border: 1px solid #f5c6cb;
-                }
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <h1>🔐 Iniciar Sesión</h1>
-                <form id="loginForm">
-                    <div class="form-group">
-                        <label for="usuario">Usuario:</label>
-                        <input type="text" id="usuario" name="usuario" required>
-                    </div>
-                    <div class="form-group">
-                        <label for="contraseña">Contraseña:</label>
-                        <input type="password" id="contraseña" name="contraseña" required>
-                    </div>
-                    <button type="submit">🚀 Iniciar Sesión</button>
-                </form>
-                
-                <div id="resultado"></div>
-                
-                <div class="links">
-                    <a href="/registro">👤 Registrarse</a>
-                </div>
-            </div>
-
-            <script>
-                document.getElementById('loginForm').addEventListener('submit', async function(e) {
-                    e.preventDefault();
-                    
-                    const usuario = document.getElementById('usuario').value;
-                    const contraseña = document.getElementById('contraseña').value;
-                    const resultado = document.getElementById('resultado');
-                    
-                    try {
-                        const response = await fetch('/login', {
-                            method: 'POST',
-                            headers: {
-                                'Content-Type': 'application/json',
-                            },
-                            body: JSON.stringify({
-                                usuario: usuario,
-                                contraseña: contraseña
-                            })
-                        });
-                        
-                        const data = await response.json();
-                        
-                        resultado.style.display = 'block';
-                        if (response.ok) {
-                            resultado.className = 'success';
-                            resultado.textContent = data.mensaje + ' - Redirigiendo a tareas...';
-                            setTimeout(() => {
-                                window.location.href = '/tareas';
-                            }, 2000);
-                        } else {
-                            resultado.className = 'error';
-                            resultado.textContent = data.error;
-                        }
-                    } catch (error) {
-                        resultado.style.display = 'block';
-                        resultado.className = 'error';
-                        resultado.textContent = 'Error de conexión: ' + error.message;
-                    }
-                });
-            </script>
-        </body>
-        </html>
-        '''
-        return html_form
+        return pagina_login.respuesta()
     
     # Método POST - Lógica original
     try:
-        data = request.get_json()
-        
-        if not data or 'usuario' not in data or 'contraseña' not in data:
-            return jsonify({'error': 'Datos incompletos. Se requiere usuario y contraseña'}), 400
-        
-        usuario = data['usuario']
-        contraseña = data['contraseña']
+        usuario, contraseña = leer_credenciales(request.get_json())
+        admitir(request.remote_addr, usuario)
         
         # Verificar credenciales
-        conn = sqlite3.connect('usuarios.db')
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT id, usuario, contraseña FROM usuarios WHERE usuario = ?', (usuario,))
-        user_data = cursor.fetchone()
-        conn.close()
+        user_data = autenticar(usuario, contraseña)
         
-        if user_data and check_password_hash(user_data[2], contraseña):
+        if user_data:
             # Crear sesión
+            regenerar_id(session)
             session['usuario_id'] = user_data[0]
             session['usuario'] = user_data[1]
             
             return jsonify({'mensaje': 'Inicio de sesión exitoso', 'usuario': usuario}), 200
         else:
             return jsonify({'error': 'Credenciales incorrectas'}), 401
-            
+    
+    except DatosInvalidos as e:
+        return jsonify({'error': str(e)}), 400
+    except DemasiadosIntentos as e:
+        return demasiados_intentos(e)
+    except ServicioSaturado as e:
+        return servicio_saturado(e)
     except Exception as e:
         return jsonify({'error': f'Error interno del servidor: {str(e)}'}), 500
 
 @app.route('/logout')
 def logout():
+    # Con sesiones en el servidor esto revoca la sesión, no solo borra la cookie
     session.clear()
     return jsonify({'mensaje': 'Sesión cerrada exitosamente'}), 200
 
@@ -452,178 +227,93 @@ def tareas():
     if 'usuario_id' not in session:
         return jsonify({'error': 'Debe iniciar sesión para acceder a las tareas'}), 401
     
-    # HTML de bienvenida
-    html_template = '''
-    <!DOCTYPE html>
-    <html lang="es">
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>Sistema de Tareas</title>
-        <style>
-            body {
-                font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-                margin: 0;
-                padding: 20px;
-                background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-                min-height: 100vh;
-                color: #333;
-            }
-            .container {
-                max-width: 800px;
-                margin: 0 auto;
-                background: white;
-                border-radius: 15px;
-                box-shadow: 0 10px 30px rgba(0,0,0,0.2);
-                overflow: hidden;
-            }
-            .header {
-                background: linear-gradient(135deg, #4facfe 0%, #00f2fe 100%);
-                color: white;
-                padding: 30px;
-                text-align: center;
-            }
-            .header h1 {
-                margin: 0;
-                font-size: 2.5em;
-                font-weight: 300;
-            }
-            .welcome-message {
-                padding: 30px;
-                text-align: center;
-                font-size: 1.2em;
-                line-height: 1.6;
-            }
-            .user-info {
-                background: #f8f9fa;
-                padding: 20px;
-                margin: 20px;
-                border-radius: 10px;
-                border-left: 5px solid #4facfe;
-            }
-            .features {
-                padding: 30px;
-                display: grid;
-                grid-template-columns: repeat(auto-fit, minmax(250px, 1fr));
-                gap: 20px;
-            }
-            .feature-card {
-                background: #f8f9fa;
-                padding: 20px;
-                border-radius: 10px;
-                text-align: center;
-                transition: transform 0.3s ease;
-            }
-            .feature-card:hover {
-                transform: translateY(-5px);
-                box-shadow: 0 5px 15px rgba(0,0,0,0.1);
-            }
-            .feature-card h3 {
-                color: #4facfe;
-                margin-bottom: 10px;
-            }
-            .logout-btn {
-                display: inline-block;
-                background: #dc3545;
-                color: white;
-                padding: 10px 20px;
-                text-decoration: none;
-                border-radius: 5px;
-                margin-top: 20px;
-                transition: background 0.3s ease;
-            }
-            .logout-btn:hover {
-                background: #c82333;
-            }
-            .api-info {
-                background: #e9ecef;
-                padding: 20px;
-                margin: 20px;
-                border-radius: 10px;
-                font-family: 'Courier New', monospace;
-                font-size: 0.9em;
-            }
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <div class="header">
-                <h1>🎯 Sistema de Tareas</h1>
-            </div>
-            
-            <div class="welcome-message">
-                <h2>¡Hola, {{ usuario }}!</h2>
-                <p>Has iniciado sesión exitosamente en el sistema de gestión de tareas.</p>
-            </div>
-            
-            <div class="user-info">
-                <h3>📋 Información de Usuario</h3>
-                <p><strong>ID de Usuario:</strong> {{ usuario_id }}</p>
-                <p><strong>Nombre de Usuario:</strong> {{ usuario }}</p>
-                <p><strong>Fecha de Acceso:</strong> {{ fecha_actual }}</p>
-            </div>
-            
-            <div class="features">
-                <div class="feature-card">
-                    <h3>👤 Gestión de Usuarios</h3>
-                    <p>Registro e inicio de sesión seguro con contraseñas hasheadas</p>
-                </div>
-                <div class="feature-card">
-                    <h3>🔐 Autenticación</h3>
-                    <p>Sistema de sesiones para mantener la seguridad</p>
-                </div>
-                <div class="feature-card">
-                    <h3>💾 Base de Datos</h3>
-                    <p>Persistencia de datos en SQLite</p>
-                </div>
-                <div class="feature-card">
-                    <h3>🛡️ Seguridad</h3>
-                    <p>Contraseñas protegidas con hash bcrypt</p>
-                </div>
-            </div>
-            
-            <div class="api-info">
-                <h3>🔗 Endpoints Disponibles:</h3>
-                <ul>
-                    <li><strong>GET/POST /registro</strong> - Registrar nuevo usuario</li>
-                    <li><strong>GET/POST /login</strong> - Iniciar sesión</li>
-                    <li><strong>GET /tareas</strong> - Ver página de bienvenida (requiere autenticación)</li>
-                    <li><strong>GET /logout</strong> - Cerrar sesión</li>
-                </ul>
-            </div>
-            
-            <div style="text-align: center; padding: 20px;">
-                <a href="/logout" class="logout-btn">🚪 Cerrar Sesión</a>
-            </div>
-        </div>
-    </body>
-    </html>
-    '''
+    # Contadores del panel: una búsqueda por clave primaria en resumen_tareas
+    with conexion(session['usuario_id']) as conn:
+        resumen = leer_resumen(conn, session['usuario_id'])
     
-    return render_template_string(html_template, 
-                                usuario=session['usuario'],
-                                usuario_id=session['usuario_id'],
-                                fecha_actual=datetime.now().strftime('%d/%m/%Y %H:%M:%S'))
+    # HTML de bienvenida (plantilla compilada una sola vez al arrancar)
+    with medir('render'):
+        return plantilla_tareas.render(usuario=session['usuario'],
+                                       usuario_id=session['usuario_id'],
+                                       resumen=resumen,
+                                       fecha_actual=datetime.now().strftime('%d/%m/%Y %H:%M:%S'))
+
+@app.route('/estado')
+def estado():
+    # Estadísticas internas para monitoreo
+    return jsonify({'db': estadisticas_db(), 'hash': servicio_hash.estadisticas(),
+                    'sesiones': almacen_sesiones.estadisticas(), 'escritura': estadisticas_escritura(),
+                    'limitador': estadisticas_limitador(), 'condicional': condicionales.estadisticas(),
+                    'eventos': estadisticas_eventos(), 'perfilador': estadisticas_perfilador(),
+                    'indice_usuarios': estadisticas_indice(), 'mantenimiento': estadisticas_mantenimiento()})
+
+@app.errorhandler(PoolAgotado)
+def pool_agotado(e):
+    return jsonify({'error': 'Servidor ocupado, intente nuevamente'}), 503, {'Retry-After': '1'}
+
+@app.errorhandler(ServicioSaturado)
+@app.errorhandler(EscrituraSaturada)
+def servicio_saturado(e):
+    # Rechazo rápido cuando la cola de hashing o la de escritura están llenas
+    return jsonify({'error': 'Servidor ocupado, intente nuevamente'}), 503, {'Retry-After': str(e.retry_after)}
+
+@app.errorhandler(DemasiadosIntentos)
+def demasiados_intentos(e):
+    # Límite por IP o por usuario (limitador.py), antes de tocar la base o el hashing
+    return jsonify({'error': 'Demasiados intentos, espere antes de reintentar'}), 429, {'Retry-After': str(e.retry_after)}
+
+# Información general de la API (también la usa el modo ASGI)
+INFO_API = {
+    'mensaje': 'API REST de Gestión de Tareas',
+    'endpoints': {
+        'registro': 'GET/POST /registro - Registrar nuevo usuario',
+        'registro_lote': 'POST /registro/lote - Registrar muchos usuarios (JSON o NDJSON, requiere LOTE_CLAVE)',
+        'login': 'GET/POST /login - Iniciar sesión',
+        'tareas': 'GET /tareas - Ver página de bienvenida (requiere autenticación)',
+        'api_tareas': 'GET/POST /api/tareas, GET/PUT/PATCH/DELETE /api/tareas/<id>, POST /api/tareas/<id>/completar - CRUD de tareas (requiere autenticación)',
+        'buscar_tareas': 'GET /api/tareas/buscar?q= - Búsqueda de texto completo en las tareas (requiere autenticación)',
+        'exportar_tareas': 'GET /api/tareas/exportar?formato=ndjson|csv - Exportación en streaming (requiere autenticación)',
+        'importar_tareas': 'POST /api/tareas/importar - Importación en streaming desde NDJSON o CSV (requiere autenticación)',
+        'resumen_tareas': 'GET /api/tareas/resumen - Contadores de tareas del usuario (requiere autenticación)',
+        'lote_tareas': 'POST /api/tareas/lote/actualizar, POST /api/tareas/lote/eliminar - Cambios por lote con ids o filtro (requiere autenticación)',
+        'eventos_tareas': 'GET /api/tareas/eventos - Cambios en las tareas como Server-Sent Events (requiere autenticación)',
+        'logout': 'GET /logout - Cerrar sesión',
+        'estado': 'GET /estado - Estadísticas internas (pool de conexiones, hashing y sesiones)',
+        'metrics': 'GET /metrics - Métricas en formato Prometheus'
+    }
+}
 
 @app.route('/')
 def index():
-    return jsonify({
-        'mensaje': 'API REST de Gestión de Tareas',
-        'endpoints': {
-            'registro': 'GET/POST /registro - Registrar nuevo usuario',
-            'login': 'GET/POST /login - Iniciar sesión',
-            'tareas': 'GET /tareas - Ver página de bienvenida (requiere autenticación)',
-            'logout': 'GET /logout - Cerrar sesión'
-        }
-    })
+    return jsonify(INFO_API)
 
 if __name__ == '__main__':
     print("🚀 Iniciando servidor API REST...")
     print("📋 Endpoints disponibles:")
     print("   GET/POST /registro - Registrar usuario")
+    print("   POST /registro/lote - Registro masivo")
     print("   GET/POST /login - Iniciar sesión")
     print("   GET /tareas - Página de bienvenida")
+    print("   GET/POST /api/tareas - Listar y crear tareas")
+    print("   GET/PUT/PATCH/DELETE /api/tareas/<id> - Consultar, editar y borrar una tarea")
+    print("   GET /api/tareas/buscar - Búsqueda de texto completo")
+    print("   GET /api/tareas/exportar - Exportar tareas (NDJSON o CSV)")
+    print("   POST /api/tareas/importar - Importar tareas (NDJSON o CSV)")
+    print("   GET /api/tareas/resumen - Contadores de tareas")
+    print("   POST /api/tareas/lote/actualizar, /api/tareas/lote/eliminar - Cambios por lote")
+    print("   GET /api/tareas/eventos - Cambios en las tareas (Server-Sent Events)")
     print("   GET /logout - Cerrar sesión")
+    print("   GET /estado - Estadísticas internas")
+    print("   GET /metrics - Métricas Prometheus")
     print("   GET / - Información de la API")
-    print("\n🌐 Servidor ejecutándose en: http://localhost:5000")
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    if '--debug' in sys.argv[1:] or os.environ.get('DEBUG') == '1':
+        # Servidor de desarrollo de Werkzeug (un proceso, recarga automática y depurador)
+        init_db()
+        metodo, origen = preparar_politica()
+        print(f"🔐 Hash de contraseñas: {metodo} ({origen})")
+        iniciar_mantenimiento()
+        print("\n🌐 Servidor de desarrollo ejecutándose en: http://localhost:5000")
+        app.run(debug=True, host='0.0.0.0', port=5000)
+    else:
+        from produccion import main
+        main(app, sys.argv[1:])
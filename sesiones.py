@@ -0,0 +1,220 @@
+"""Sesiones del lado del servidor: tabla `sesiones` con una caché LRU/TTL por proceso
+
+Cada worker tiene su propia caché. Un /logout borra la fila y la entrada de la
+caché del worker que lo atendió; en los demás workers esa sesión sigue sirviendo
+para lecturas (GET/HEAD/OPTIONS) hasta SESION_CACHE_TTL segundos. Las peticiones
+que pueden escribir (POST, PUT, PATCH, DELETE) no usan la caché: siempre
+comprueban en SQLite que la sesión exista y no haya vencido.
+"""
+import json
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from flask.sessions import SessionInterface, SessionMixin, SecureCookieSessionInterface
+from werkzeug.datastructures import CallbackDict
+
+from base_datos import conexion
+
+# Configuración de las sesiones (se puede cambiar con variables de entorno)
+SESION_BACKEND = os.environ.get('SESION_BACKEND', 'servidor')  # 'servidor' o 'cookie' (firmada por Flask)
+SESION_TTL = int(os.environ.get('SESION_TTL', str(24 * 3600)))  # segundos de vida de una sesión
+SESION_CACHE_MAX = int(os.environ.get('SESION_CACHE_MAX', '10000'))  # sesiones en memoria por proceso
+SESION_CACHE_TTL = float(os.environ.get('SESION_CACHE_TTL', '5'))  # segundos antes de revalidar contra SQLite
+SESION_MAX_POR_USUARIO = int(os.environ.get('SESION_MAX_POR_USUARIO', '10'))  # 0 = sin límite
+SESION_BARRIDO = float(os.environ.get('SESION_BARRIDO', '60'))  # segundos entre barridos de vencidas
+# Métodos que usan la sesión en caché; los demás la revalidan siempre en SQLite
+METODOS_SEGUROS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class AlmacenSesiones:
+    """Sesiones en la tabla `sesiones` con una caché LRU/TTL en memoria delante"""
+
+    def __init__(self, ttl=SESION_TTL, cache_max=SESION_CACHE_MAX, cache_ttl=SESION_CACHE_TTL,
+                 max_por_usuario=SESION_MAX_POR_USUARIO, barrido=SESION_BARRIDO):
+        self.ttl = ttl
+        self.cache_max = cache_max
+        self.cache_ttl = cache_ttl
+        self.max_por_usuario = max_por_usuario
+        self.barrido = barrido
+        self._lock = threading.Lock()
+        # sid -> (datos, expira, revalidar_en)
+        self._cache = OrderedDict()
+        self._proximo_barrido = time.monotonic() + barrido
+        # True cuando el barrido lo hace el programador de mantenimiento y no las peticiones
+        self.barrido_externo = False
+        self._aciertos = 0
+        self._fallos = 0
+        self._revocadas = 0
+        self._barridas = 0
+
+    @staticmethod
+    def nuevo_id():
+        return secrets.token_urlsafe(16)
+
+    def _en_cache(self, sid, datos, expira):
+        self._cache[sid] = (datos, expira, time.monotonic() + self.cache_ttl)
+        self._cache.move_to_end(sid)
+        while len(self._cache) > self.cache_max:
+            self._cache.popitem(last=False)
+
+    def cargar(self, sid, revalidar=False):
+        """Devuelve los datos de la sesión o None si no existe o venció
+
+        Con revalidar se lee SQLite aunque la sesión esté en la caché (otro worker pudo revocarla).
+        """
+        ahora = time.time()
+        with self._lock:
+            entrada = self._cache.get(sid)
+            if not revalidar and entrada and entrada[1] > ahora and entrada[2] > time.monotonic():
+                self._cache.move_to_end(sid)
+                self._aciertos += 1
+                return dict(entrada[0])
+            self._fallos += 1
+
+        with conexion() as conn:
+            fila = conn.execute('SELECT datos, expira FROM sesiones WHERE id = ? AND expira > ?',
+                                (sid, ahora)).fetchone()
+        with self._lock:
+            if fila is None:
+                self._cache.pop(sid, None)
+                return None
+            datos = json.loads(fila[0])
+            self._en_cache(sid, datos, fila[1])
+        return dict(datos)
+
+    def guardar(self, sid, datos):
+        expira = time.time() + self.ttl
+        usuario_id = datos.get('usuario_id')
+        with conexion() as conn:
+            conn.execute('INSERT INTO sesiones (id, usuario_id, datos, expira) VALUES (?, ?, ?, ?) '
+                         'ON CONFLICT(id) DO UPDATE SET usuario_id = excluded.usuario_id, '
+                         'datos = excluded.datos, expira = excluded.expira',
+                         (sid, usuario_id, json.dumps(datos), expira))
+            excedentes = []
+            if usuario_id is not None and self.max_por_usuario > 0:
+                # Solo las sesiones más recientes de cada usuario siguen vivas
+                excedentes = [fila[0] for fila in conn.execute(
+                    'SELECT id FROM sesiones WHERE usuario_id = ? ORDER BY expira DESC LIMIT -1 OFFSET ?',
+                    (usuario_id, self.max_por_usuario))]
+                conn.executemany('DELETE FROM sesiones WHERE id = ?', ((s,) for s in excedentes))
+        with self._lock:
+            self._en_cache(sid, dict(datos), expira)
+            for excedente in excedentes:
+                self._cache.pop(excedente, None)
+            self._revocadas += len(excedentes)
+
+    def revocar(self, sid):
+        with conexion() as conn:
+            conn.execute('DELETE FROM sesiones WHERE id = ?', (sid,))
+        with self._lock:
+            self._cache.pop(sid, None)
+            self._revocadas += 1
+
+    def barrer_si_corresponde(self):
+        if self.barrido_externo or time.monotonic() < self._proximo_barrido:
+            return 0
+        return self.barrer()
+
+    def barrer(self):
+        """Borra en una sola sentencia todas las sesiones vencidas"""
+        self._proximo_barrido = time.monotonic() + self.barrido
+        ahora = time.time()
+        with conexion() as conn:
+            borradas = conn.execute('DELETE FROM sesiones WHERE expira <= ?', (ahora,)).rowcount
+        with self._lock:
+            for sid in [sid for sid, entrada in self._cache.items() if entrada[1] <= ahora]:
+                del self._cache[sid]
+            self._barridas += borradas
+        return borradas
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                'en_cache': len(self._cache),
+                'cache_max': self.cache_max,
+                'aciertos': self._aciertos,
+                'fallos': self._fallos,
+                'revocadas': self._revocadas,
+                'barridas': self._barridas,
+            }
+
+
+class SesionServidor(CallbackDict, SessionMixin):
+    def __init__(self, datos=None, sid=None):
+        def al_modificar(self):
+            self.modified = True
+        super().__init__(datos, al_modificar)
+        self.sid = sid
+        self.usuario_original = (datos or {}).get('usuario_id')
+        self.regenerar = False
+        self.modified = False
+
+
+class InterfazSesionServidor(SessionInterface):
+    """La cookie solo lleva un ID opaco; los datos viven en el servidor y /logout los revoca"""
+
+    def __init__(self, almacen):
+        self.almacen = almacen
+
+    def cargar(self, sid, metodo='GET'):
+        self.almacen.barrer_si_corresponde()
+        datos = self.almacen.cargar(sid, revalidar=metodo not in METODOS_SEGUROS) if sid else None
+        if datos is None:
+            return SesionServidor()
+        return SesionServidor(datos, sid)
+
+    def persistir(self, sesion):
+        """Guarda o revoca la sesión; devuelve el sid para la cookie, '' para borrarla o None si no cambia"""
+        if not sesion:
+            if sesion.sid and sesion.modified:
+                self.almacen.revocar(sesion.sid)
+                return ''
+            return None
+        if not sesion.modified:
+            return None
+        if sesion.sid and (sesion.regenerar or sesion.get('usuario_id') != sesion.usuario_original):
+            # Un nuevo login recibe un ID nuevo (evita fijación de sesión)
+            self.almacen.revocar(sesion.sid)
+            sesion.sid = None
+        if not sesion.sid:
+            sesion.sid = self.almacen.nuevo_id()
+        self.almacen.guardar(sesion.sid, dict(sesion))
+        return sesion.sid
+
+    def open_session(self, app, request):
+        return self.cargar(request.cookies.get(self.get_cookie_name(app)), request.method)
+
+    def save_session(self, app, session, response):
+        sid = self.persistir(session)
+        if sid is None:
+            return
+        nombre = self.get_cookie_name(app)
+        opciones = {
+            'domain': self.get_cookie_domain(app),
+            'path': self.get_cookie_path(app),
+            'secure': self.get_cookie_secure(app),
+            'httponly': self.get_cookie_httponly(app),
+            'samesite': self.get_cookie_samesite(app),
+        }
+        if sid == '':
+            response.delete_cookie(nombre, **opciones)
+        else:
+            response.set_cookie(nombre, sid, expires=self.get_expiration_time(app, session), **opciones)
+        response.vary.add('Cookie')
+
+
+def regenerar_id(sesion):
+    """Pide un ID de sesión nuevo al guardar (se llama al iniciar sesión)"""
+    if isinstance(sesion, SesionServidor):
+        sesion.regenerar = True
+
+
+almacen = AlmacenSesiones()
+
+
+def crear_interfaz_sesion():
+    if SESION_BACKEND == 'cookie':
+        return SecureCookieSessionInterface()
+    return InterfazSesionServidor(almacen)
@@ -0,0 +1,35 @@
+"""Configuración común de las pruebas
+
+Los módulos leen su configuración de variables de entorno al importarse, así que
+la base temporal y los valores de prueba se definen antes de importar la app.
+"""
+import os
+import sys
+import tempfile
+
+_DIRECTORIO = tempfile.mkdtemp(prefix='pruebas_')
+os.environ['DB_PATH'] = os.path.join(_DIRECTORIO, 'usuarios.db')
+os.environ.setdefault('HASH_PROCESOS', '0')
+os.environ.setdefault('HASH_METODO', 'pbkdf2:sha256:1000')
+os.environ.setdefault('LIMITE_ACTIVO', '0')
+os.environ.setdefault('MANTENIMIENTO_ACTIVO', '0')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def app():
+    from hashing import preparar_politica
+    from migraciones import migrar
+    from servidor import app
+    migrar()
+    preparar_politica()
+    app.config['TESTING'] = True
+    return app
+
+
+@pytest.fixture
+def cliente(app):
+    return app.test_client()
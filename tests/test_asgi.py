@@ -0,0 +1,185 @@
+import asyncio
+import json
+import threading
+
+import pytest
+
+JSON = ('content-type', 'application/json')
+
+
+async def llamar(metodo, ruta, cuerpo=b'', cabeceras=()):
+    import asgi
+    scope = {'type': 'http', 'method': metodo, 'path': ruta, 'query_string': b'',
+             'headers': [(k.encode(), v.encode()) for k, v in cabeceras]}
+    mensajes = [{'type': 'http.request', 'body': cuerpo, 'more_body': False}]
+    enviados = []
+
+    async def receive():
+        if mensajes:
+            return mensajes.pop(0)
+        # Como un servidor real: la desconexión llega recién cuando el cliente se va
+        await asyncio.Event().wait()
+
+    async def send(mensaje):
+        enviados.append(mensaje)
+
+    await asgi.app(scope, receive, send)
+    cabeceras_respuesta = {k.decode(): v.decode() for k, v in enviados[0]['headers']}
+    return enviados[0]['status'], cabeceras_respuesta, b''.join(m.get('body', b'') for m in enviados[1:])
+
+
+@pytest.fixture
+def sesion_asgi(app):
+    """Cookie de una sesión iniciada por el modo ASGI"""
+    def iniciar(usuario):
+        async def flujo():
+            datos = json.dumps({'usuario': usuario, 'contraseña': 'clave'}).encode()
+            await llamar('POST', '/registro', datos, [JSON])
+            _, cabeceras, _ = await llamar('POST', '/login', datos, [JSON])
+            return cabeceras['set-cookie'].split(';', 1)[0]
+        return asyncio.run(flujo())
+    return iniciar
+
+
+def test_la_sesion_se_carga_fuera_del_event_loop(sesion_asgi, monkeypatch):
+    import asgi
+    cookie = sesion_asgi('asgi_sesion')
+    hilos = []
+    cargar = asgi.interfaz_sesion.cargar
+
+    def cargar_registrando(sid, metodo='GET'):
+        hilos.append(threading.current_thread().name)
+        return cargar(sid, metodo)
+
+    monkeypatch.setattr(asgi.interfaz_sesion, 'cargar', cargar_registrando)
+    estado, _, _ = asyncio.run(llamar('GET', '/tareas', cabeceras=[('cookie', cookie)]))
+    assert estado == 200
+    assert hilos and all(nombre.startswith('asgi') for nombre in hilos)
+
+
+class AppInfinita:
+    """App WSGI que genera trozos sin fin y anota cuántos generó y si la cerraron"""
+
+    def __init__(self):
+        self.generados = 0
+        self.cerrada = threading.Event()
+
+    def __call__(self, environ, start_response):
+        start_response('200 OK', [('Content-Type', 'application/x-ndjson')])
+        return self._cuerpo()
+
+    def _cuerpo(self):
+        try:
+            while True:
+                self.generados += 1
+                yield b'{}\n'
+        finally:
+            self.cerrada.set()
+
+
+def test_la_respuesta_se_acota_y_se_corta_al_desconectarse(app, monkeypatch):
+    import asgi
+    wsgi = AppInfinita()
+    monkeypatch.setattr(asgi.app_flask, 'wsgi_app', wsgi)
+
+    async def flujo():
+        desconexion = asyncio.Event()
+        enviados = []
+        mensajes = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+
+        async def receive():
+            if mensajes:
+                return mensajes.pop(0)
+            await desconexion.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(mensaje):
+            enviados.append(mensaje)
+            if mensaje['type'] == 'http.response.body':
+                # Un cliente que no lee: el envío queda esperando
+                await desconexion.wait()
+
+        scope = {'type': 'http', 'method': 'GET', 'path': '/api/tareas/exportar', 'query_string': b'',
+                 'headers': []}
+        tarea = asyncio.ensure_future(asgi.app(scope, receive, send))
+        await asyncio.sleep(0.3)
+        # Con el cliente sin leer, la app genera a lo sumo lo que entra en la cola
+        assert wsgi.generados <= asgi.ASGI_COLA_MAX + 2
+        desconexion.set()
+        await asyncio.wait_for(tarea, 5)
+        return enviados
+
+    asyncio.run(flujo())
+    assert wsgi.cerrada.wait(5)
+
+
+def test_el_cuerpo_llega_a_la_app_a_medida_que_se_recibe(app, monkeypatch):
+    import asgi
+    leidos = []
+
+    def wsgi(environ, start_response):
+        for linea in environ['wsgi.input']:
+            leidos.append(linea)
+            primera_leida.set()
+        start_response('200 OK', [('Content-Type', 'text/plain')])
+        return [str(len(leidos)).encode()]
+
+    primera_leida = threading.Event()
+    monkeypatch.setattr(asgi.app_flask, 'wsgi_app', wsgi)
+
+    async def flujo():
+        loop = asyncio.get_running_loop()
+        enviados = []
+        trozos = [b'uno\n', b'dos\n', b'tres\n']
+
+        async def receive():
+            if not trozos:
+                await asyncio.Event().wait()
+            if len(trozos) < 3:
+                # El resto del cuerpo solo se envía cuando la app ya leyó la primera línea
+                await loop.run_in_executor(None, primera_leida.wait, 5)
+            trozo = trozos.pop(0)
+            return {'type': 'http.request', 'body': trozo, 'more_body': bool(trozos)}
+
+        async def send(mensaje):
+            enviados.append(mensaje)
+
+        scope = {'type': 'http', 'method': 'POST', 'path': '/api/tareas/importar', 'query_string': b'',
+                 'headers': [(b'content-type', b'application/x-ndjson')]}
+        await asyncio.wait_for(asgi.app(scope, receive, send), 5)
+        return enviados
+
+    enviados = asyncio.run(flujo())
+    assert enviados[0]['status'] == 200
+    assert b''.join(m.get('body', b'') for m in enviados[1:]) == b'3'
+    assert leidos == [b'uno\n', b'dos\n', b'tres\n']
+
+
+def test_importar_y_exportar_en_trozos(sesion_asgi):
+    cookie = ('cookie', sesion_asgi('asgi_importar'))
+    lineas = [json.dumps({'titulo': f'Tarea {i}'}).encode() + b'\n' for i in range(50)]
+
+    async def flujo():
+        import asgi
+        enviados = []
+        trozos = [b''.join(lineas[i:i + 7]) for i in range(0, len(lineas), 7)]
+
+        async def receive():
+            if not trozos:
+                await asyncio.Event().wait()
+            return {'type': 'http.request', 'body': trozos.pop(0), 'more_body': bool(trozos)}
+
+        async def send(mensaje):
+            enviados.append(mensaje)
+
+        scope = {'type': 'http', 'method': 'POST', 'path': '/api/tareas/importar', 'query_string': b'',
+                 'headers': [(b'content-type', b'application/x-ndjson'), (cookie[0].encode(), cookie[1].encode())]}
+        await asgi.app(scope, receive, send)
+        importado = json.loads(b''.join(m.get('body', b'') for m in enviados[1:]))
+        estado, _, cuerpo = await llamar('GET', '/api/tareas/exportar', cabeceras=[cookie])
+        return importado, estado, cuerpo
+
+    importado, estado, cuerpo = asyncio.run(flujo())
+    assert (importado['aceptadas'], importado['rechazadas']) == (50, 0)
+    assert estado == 200
+    assert len(cuerpo.splitlines()) == 50
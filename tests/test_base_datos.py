@@ -0,0 +1,71 @@
+import os
+import sqlite3
+from collections import Counter
+
+import pytest
+
+import base_datos
+from base_datos import PoolConexiones, _ReservaIds, fragmento_de
+
+
+def test_fragmento_de_es_estable_y_parejo():
+    usuarios = range(1, 20001)
+    assert [fragmento_de(u, 4) for u in usuarios] == [fragmento_de(u, 4) for u in usuarios]
+    assert all(fragmento_de(u, 1) == 0 for u in usuarios)
+
+    cuentas = Counter(fragmento_de(u, 4) for u in usuarios)
+    assert set(cuentas) == {0, 1, 2, 3}
+    assert all(abs(c - 5000) < 500 for c in cuentas.values())
+
+
+@pytest.mark.parametrize('cantidad', [1, 2, 3, 7])
+def test_agregar_un_fragmento_solo_mueve_usuarios_al_nuevo(cantidad):
+    usuarios = range(1, 20001)
+    movidos = [u for u in usuarios if fragmento_de(u, cantidad) != fragmento_de(u, cantidad + 1)]
+    assert all(fragmento_de(u, cantidad + 1) == cantidad for u in movidos)
+    esperado = len(usuarios) / (cantidad + 1)
+    assert abs(len(movidos) - esperado) < esperado * 0.1
+
+
+def test_reserva_de_ids_unica_entre_padre_e_hijo(app):
+    reserva = _ReservaIds(bloque=10)
+    antes = reserva.tomar(3)  # el hijo hereda el resto de este bloque y no debe reutilizarlo
+
+    lectura, escritura = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.close(lectura)
+            os.write(escritura, ','.join(map(str, reserva.tomar(25))).encode())
+        finally:
+            os._exit(0)
+    os.close(escritura)
+    with os.fdopen(lectura) as salida:
+        del_hijo = [int(i) for i in salida.read().split(',')]
+    os.waitpid(pid, 0)
+    despues = reserva.tomar(25)
+
+    assert len(del_hijo) == 25
+    todos = antes + del_hijo + despues
+    assert len(set(todos)) == len(todos)
+
+
+def test_el_hijo_cierra_las_conexiones_heredadas(tmp_path):
+    pool = PoolConexiones(str(tmp_path / 'pool.db'), tamano=2)
+    with pool.conexion() as conn:
+        conn.execute('SELECT 1')
+    heredada = pool._libres[0]
+
+    pool._pid = -1  # como si este proceso fuera el hijo de un fork
+    with pool.conexion() as conn:
+        assert conn is not heredada
+    with pytest.raises(sqlite3.ProgrammingError):
+        heredada.execute('SELECT 1')
+    pool.cerrar()
+
+
+def test_cerrar_vacia_todos_los_pools(app):
+    with base_datos.pool.conexion() as conn:
+        conn.execute('SELECT 1')
+    base_datos.cerrar()
+    assert not base_datos.pool._libres
@@ -0,0 +1,22 @@
+from benchmark import comparar
+
+
+def _escenario(rps=100, p95_ms=10, peticiones=1000, errores=0):
+    return {'rps': rps, 'p95_ms': p95_ms, 'peticiones': peticiones, 'errores': errores}
+
+
+def test_sin_regresiones():
+    base = {'escenarios': {'login': _escenario()}}
+    assert comparar(base, {'escenarios': {'login': _escenario(rps=95)}}, 0.10) == []
+
+
+def test_mas_errores_es_regresion():
+    base = {'escenarios': {'login': _escenario()}}
+    regresiones = comparar(base, {'escenarios': {'login': _escenario(errores=5)}}, 0.10)
+    assert len(regresiones) == 1 and 'errores' in regresiones[0]
+
+
+def test_ninguna_peticion_es_regresion_aunque_la_base_tampoco_tenga():
+    base = {'escenarios': {'tareas': _escenario(rps=0, peticiones=0)}}
+    actual = {'escenarios': {'tareas': _escenario(rps=0, p95_ms=0, peticiones=0)}}
+    assert comparar(base, actual, 0.10) == ['tareas: ninguna petición completada']
@@ -0,0 +1,124 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from base_datos import PoolConexiones
+from cola_escritura import ColaEscritura, EscrituraSaturada
+
+
+@pytest.fixture
+def cola(tmp_path):
+    pool = PoolConexiones(str(tmp_path / 'cola.db'), migrar=False)
+    with pool.conexion() as conn:
+        conn.execute('CREATE TABLE t (v TEXT UNIQUE)')
+        # Una sentencia que aborta la transacción entera, no solo la suya
+        conn.execute("CREATE TRIGGER abortar BEFORE INSERT ON t WHEN NEW.v = 'abortar' "
+                     "BEGIN SELECT RAISE(ROLLBACK, 'transacción abortada'); END")
+        conn.execute("INSERT INTO t VALUES ('existente')")
+    # Una espera larga para que todas las sentencias caigan en el mismo lote
+    return ColaEscritura(pool, espera_ms=300), pool
+
+
+def _en_paralelo(cola, valores):
+    resultados = {}
+
+    def ejecutar(valor):
+        try:
+            resultados[valor] = cola.ejecutar('INSERT INTO t VALUES (?)', (valor,))
+        except sqlite3.Error as e:
+            resultados[valor] = e
+
+    hilos = [threading.Thread(target=ejecutar, args=(v,)) for v in valores]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    return resultados
+
+
+def test_error_de_restriccion_solo_afecta_a_su_sentencia(cola):
+    cola, pool = cola
+    resultados = _en_paralelo(cola, ['a', 'existente', 'b'])
+    assert isinstance(resultados['existente'], sqlite3.IntegrityError)
+    assert resultados['a'][1] == 1 and resultados['b'][1] == 1
+    assert cola.estadisticas()['lotes'] == 1
+
+
+def test_transaccion_abortada_se_repite_de_a_una(cola):
+    cola, pool = cola
+    resultados = _en_paralelo(cola, ['c', 'd', 'abortar', 'e'])
+    assert 'abortada' in str(resultados['abortar'])
+    for valor in ('c', 'd', 'e'):
+        assert resultados[valor][1] == 1
+    with pool.conexion() as conn:
+        guardados = {fila[0] for fila in conn.execute('SELECT v FROM t')}
+    assert guardados == {'existente', 'c', 'd', 'e'}
+    assert cola.estadisticas()['lotes_repetidos'] == 1
+
+
+def test_timeout_antes_de_que_el_escritor_la_tome_no_escribe(tmp_path):
+    pool = PoolConexiones(str(tmp_path / 'cola.db'), migrar=False)
+    with pool.conexion() as conn:
+        conn.execute('CREATE TABLE t (v TEXT UNIQUE)')
+    # El escritor junta el lote durante 300 ms; el llamador se rinde a los 50
+    cola = ColaEscritura(pool, espera_ms=300, timeout=0.05)
+    with pytest.raises(EscrituraSaturada):
+        cola.ejecutar('INSERT INTO t VALUES (?)', ('tarde',))
+    time.sleep(0.5)
+    with pool.conexion() as conn:
+        assert conn.execute('SELECT count(*) FROM t').fetchone()[0] == 0
+    assert cola.estadisticas()['canceladas'] == 1
+
+    # El reintento del cliente la escribe una sola vez
+    cola.timeout = 5
+    cola.ejecutar('INSERT INTO t VALUES (?)', ('tarde',))
+    with pool.conexion() as conn:
+        assert conn.execute('SELECT count(*) FROM t').fetchone()[0] == 1
+
+
+def test_timeout_con_la_escritura_en_curso_espera_el_commit(tmp_path):
+    pool = PoolConexiones(str(tmp_path / 'cola.db'), migrar=False)
+    with pool.conexion() as conn:
+        conn.execute('CREATE TABLE t (v TEXT UNIQUE)')
+    cola = ColaEscritura(pool, espera_ms=0, timeout=0.05)
+    bloqueo = sqlite3.connect(str(tmp_path / 'cola.db'), isolation_level=None, check_same_thread=False)
+    bloqueo.execute('BEGIN IMMEDIATE')  # el escritor queda esperando el lock después de tomarla
+    threading.Timer(0.3, bloqueo.rollback).start()
+
+    assert cola.ejecutar('INSERT INTO t VALUES (?)', ('lenta',))[1] == 1
+    with pool.conexion() as conn:
+        assert conn.execute('SELECT count(*) FROM t').fetchone()[0] == 1
+    assert cola.estadisticas()['canceladas'] == 0
+    bloqueo.close()
+
+
+def test_si_cambia_se_confirma_o_se_deshace_con_su_sentencia(cola):
+    cola, pool = cola
+    resultados = {}
+
+    def ejecutar(valor, evento):
+        try:
+            resultados[valor] = cola.ejecutar('INSERT INTO t VALUES (?)', (valor,),
+                                              si_cambia=('INSERT INTO t VALUES (?)', (evento,)))
+        except sqlite3.Error as e:
+            resultados[valor] = e
+
+    # La segunda sentencia de 'g' choca con UNIQUE: 'g' tampoco se guarda, el resto del lote sí
+    hilos = [threading.Thread(target=ejecutar, args=args) for args in (('f', 'f-evento'), ('g', 'existente'))]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    assert isinstance(resultados['g'], sqlite3.IntegrityError)
+    assert resultados['f'][1] == 1
+    with pool.conexion() as conn:
+        guardados = {fila[0] for fila in conn.execute('SELECT v FROM t')}
+    assert guardados == {'existente', 'f', 'f-evento'}
+    assert cola.estadisticas()['lotes'] == 1
+
+    # Sin filas cambiadas no se ejecuta
+    assert cola.ejecutar('DELETE FROM t WHERE v = ?', ('nada',), si_cambia=('INSERT INTO t VALUES (?)', ('x',)))[1] == 0
+    with pool.conexion() as conn:
+        assert conn.execute("SELECT count(*) FROM t WHERE v = 'x'").fetchone()[0] == 0
@@ -0,0 +1,73 @@
+import uuid
+
+from api_tareas import condicionales
+
+
+def _sesion(cliente):
+    datos = {'usuario': f'u{uuid.uuid4().hex[:12]}', 'contraseña': 'secreta'}
+    assert cliente.post('/registro', json=datos).status_code == 201
+    assert cliente.post('/login', json=datos).status_code == 200
+
+
+def test_if_none_match_vigente_responde_304(app, cliente):
+    _sesion(cliente)
+    cliente.post('/api/tareas', json={'titulo': 'pan'})
+    etag = cliente.get('/api/tareas').headers['ETag']
+    aciertos = condicionales.estadisticas()['aciertos']
+
+    respuesta = cliente.get('/api/tareas', headers={'If-None-Match': etag})
+    assert respuesta.status_code == 304
+    assert respuesta.data == b''
+    assert respuesta.headers['ETag'] == etag
+    assert condicionales.estadisticas()['aciertos'] == aciertos + 1
+
+    cliente.post('/api/tareas', json={'titulo': 'leche'})
+    respuesta = cliente.get('/api/tareas', headers={'If-None-Match': etag})
+    assert respuesta.status_code == 200
+    assert respuesta.headers['ETag'] != etag
+
+
+def test_if_match_vencido_responde_412_sin_modificar(app, cliente):
+    _sesion(cliente)
+    tarea = cliente.post('/api/tareas', json={'titulo': 'pan'}).get_json()
+    etag = cliente.get(f'/api/tareas/{tarea["id"]}').headers['ETag']
+    cliente.post('/api/tareas', json={'titulo': 'leche'})  # otro cambio sube la versión
+
+    respuesta = cliente.patch(f'/api/tareas/{tarea["id"]}', json={'titulo': 'pan integral'},
+                              headers={'If-Match': etag})
+    assert respuesta.status_code == 412
+    vigente = respuesta.headers['ETag']
+    assert vigente != etag
+    assert cliente.get(f'/api/tareas/{tarea["id"]}').get_json()['titulo'] == 'pan'
+    assert cliente.delete(f'/api/tareas/{tarea["id"]}', headers={'If-Match': etag}).status_code == 412
+    assert cliente.get('/api/tareas', headers={'If-Match': etag}).status_code == 412
+
+    respuesta = cliente.patch(f'/api/tareas/{tarea["id"]}', json={'titulo': 'pan integral'},
+                              headers={'If-Match': vigente})
+    assert respuesta.status_code == 200
+    assert respuesta.get_json()['titulo'] == 'pan integral'
+
+
+def test_if_match_sobre_tarea_inexistente_responde_404(app, cliente):
+    _sesion(cliente)
+    cliente.post('/api/tareas', json={'titulo': 'pan'})
+    etag = cliente.get('/api/tareas').headers['ETag']
+    assert cliente.delete('/api/tareas/999999999', headers={'If-Match': etag}).status_code == 404
+    assert cliente.post('/api/tareas/999999999/completar', headers={'If-Match': '*'}).status_code == 404
+
+
+def test_if_none_match_compara_etags_completos(app, cliente):
+    _sesion(cliente)
+    for i in range(10):
+        cliente.post('/api/tareas', json={'titulo': f't{i}'})
+    etag = cliente.get('/api/tareas').headers['ETag']  # W/"<usuario>-10"
+    valor = etag.removeprefix('W/')
+    prefijo = 'W/' + valor[:-2] + '"'  # W/"<usuario>-1": una versión vieja que es prefijo de la actual
+
+    assert cliente.get('/api/tareas', headers={'If-None-Match': prefijo}).status_code == 200
+    # Comparación débil: la forma fuerte del mismo ETag también coincide, y dentro de una lista
+    assert cliente.get('/api/tareas', headers={'If-None-Match': valor}).status_code == 304
+    assert cliente.get('/api/tareas', headers={'If-None-Match': f'{prefijo}, {etag}'}).status_code == 304
+    assert cliente.get('/api/tareas', headers={'If-None-Match': '*'}).status_code == 304
+    assert cliente.get('/api/tareas', headers={'If-Match': prefijo}).status_code == 412
+    assert cliente.get('/api/tareas', headers={'If-Match': valor}).status_code == 200
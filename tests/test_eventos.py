@@ -0,0 +1,68 @@
+import json
+import uuid
+
+import eventos
+import mantenimiento
+from base_datos import conexion
+
+
+def _sesion(cliente):
+    datos = {'usuario': f'u{uuid.uuid4().hex[:12]}', 'contraseña': 'secreta'}
+    assert cliente.post('/registro', json=datos).status_code == 201
+    assert cliente.post('/login', json=datos).status_code == 200
+    with cliente.session_transaction() as sesion:
+        return sesion['usuario_id']
+
+
+def _eventos(usuario_id):
+    with conexion(usuario_id) as conn:
+        return [(fila[0], json.loads(fila[1])) for fila in conn.execute(
+            'SELECT tipo, datos FROM eventos WHERE usuario_id = ? ORDER BY id', (usuario_id,))]
+
+
+def test_cada_cambio_guarda_su_evento_con_la_tarea(app, cliente):
+    usuario_id = _sesion(cliente)
+    tarea = cliente.post('/api/tareas', json={'titulo': 'pan', 'descripcion': 'ñandú'}).get_json()
+    actualizada = cliente.post(f'/api/tareas/{tarea["id"]}/completar').get_json()
+    assert cliente.delete(f'/api/tareas/{tarea["id"]}').status_code == 200
+    assert cliente.delete(f'/api/tareas/{tarea["id"]}').status_code == 404
+
+    assert _eventos(usuario_id) == [('creada', tarea), ('actualizada', actualizada),
+                                    ('eliminada', {'id': tarea['id']})]
+
+
+def test_una_escritura_rechazada_no_guarda_evento(app, cliente):
+    usuario_id = _sesion(cliente)
+    tarea = cliente.post('/api/tareas', json={'titulo': 'pan'}).get_json()
+    etag = cliente.get('/api/tareas').headers['ETag']
+    cliente.post('/api/tareas', json={'titulo': 'leche'})
+    assert cliente.patch(f'/api/tareas/{tarea["id"]}', json={'titulo': 'x'},
+                         headers={'If-Match': etag}).status_code == 412
+    assert [tipo for tipo, _ in _eventos(usuario_id)] == ['creada', 'creada']
+
+
+def test_las_operaciones_por_lote_guardan_un_evento_por_trozo(app, cliente, monkeypatch):
+    import api_tareas
+    monkeypatch.setattr(api_tareas, 'LOTE_TROZO', 2)
+    usuario_id = _sesion(cliente)
+    cuerpo = ''.join(json.dumps({'titulo': f't{i}'}) + '\n' for i in range(5))
+    assert cliente.post('/api/tareas/importar', data=cuerpo,
+                        content_type='application/x-ndjson').get_json()['aceptadas'] == 5
+    assert cliente.post('/api/tareas/lote/actualizar',
+                        json={'filtro': {}, 'valores': {'completada': True}}).get_json()['afectadas'] == 5
+
+    assert _eventos(usuario_id)[-3:] == [('actualizadas', {'cantidad': 2}), ('actualizadas', {'cantidad': 2}),
+                                         ('actualizadas', {'cantidad': 1})]
+    assert ('importadas', {'cantidad': 5}) in _eventos(usuario_id)
+
+
+def test_el_mantenimiento_poda_los_eventos_viejos(app, cliente):
+    assert mantenimiento.programador.trabajos['eventos'].funcion is mantenimiento.eventos
+    usuario_id = _sesion(cliente)
+    for i in range(3):
+        cliente.post('/api/tareas', json={'titulo': f't{i}'})
+    with conexion(usuario_id) as conn:
+        ultimo = conn.execute('SELECT max(id) FROM eventos').fetchone()[0]
+        assert eventos.podar(conn, retencion=2) > 0
+        restantes = [fila[0] for fila in conn.execute('SELECT id FROM eventos')]
+    assert restantes == [ultimo - 1, ultimo]
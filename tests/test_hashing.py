@@ -0,0 +1,69 @@
+import threading
+import time
+
+import pytest
+
+import hashing
+from hashing import ServicioHash
+
+METODO = 'pbkdf2:sha256:100000'
+
+
+@pytest.fixture
+def servicio(monkeypatch):
+    monkeypatch.setattr(hashing, '_metodo', METODO)
+    servicio = ServicioHash(procesos=1, cola_max=4, timeout=30)
+    yield servicio
+    servicio._executor.shutdown()
+
+
+def _medir_login(servicio, contraseña_hash):
+    inicio = time.perf_counter()
+    assert servicio.verificar(contraseña_hash, 'clave')
+    return time.perf_counter() - inicio
+
+
+def test_login_durante_un_lote_espera_a_lo_sumo_un_trozo(servicio):
+    contraseña_hash = servicio.generar('clave')
+    solo = min(_medir_login(servicio, contraseña_hash) for _ in range(3))
+
+    hashes = []
+    lote = threading.Thread(target=lambda: hashes.extend(servicio.generar_lote(['x'] * 40)))
+    lote.start()
+    while servicio.estadisticas()['pendientes'] == 0:
+        time.sleep(0.001)
+    durante = _medir_login(servicio, contraseña_hash)
+    en_curso = lote.is_alive()
+    lote.join()
+
+    # El login no espera los 40 hashes del lote: solo el trozo que ya estaba en el proceso
+    assert en_curso
+    assert durante < 4 * solo + 0.05
+    assert len(hashes) == 40
+    assert servicio.estadisticas()['pendientes'] == 0
+
+
+def test_lote_respeta_el_limite_de_admision(servicio):
+    servicio.cola_max = 0
+    tomados = []
+    maximo = []
+    original = servicio._admision
+
+    def _admision(cantidad=1, lote=False):
+        tomados.append(cantidad)
+        maximo.append(servicio._pendientes + cantidad)
+        return original(cantidad, lote)
+
+    servicio._admision = _admision
+    assert len(servicio.generar_lote(['x'] * 5)) == 5
+    assert tomados == [1] * 5
+    assert max(maximo) <= 1
+
+
+def test_lote_sin_lugar_responde_saturado(servicio):
+    servicio.cola_max = 0
+    servicio.timeout = 0.05
+    with servicio._admision():
+        with pytest.raises(hashing.ServicioSaturado):
+            servicio.generar_lote(['x'])
+    assert servicio.estadisticas()['rechazadas'] == 1
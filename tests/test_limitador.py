@@ -0,0 +1,54 @@
+import limitador
+from limitador import Limitador
+
+
+def _agotar(limite, clave, desborde='*'):
+    while not limite.consumir(clave, desborde):
+        pass
+
+
+def test_rotar_claves_no_desaloja_un_balde_agotado():
+    limite = Limitador(tasa=0.001, rafaga=3, claves_max=10)
+    _agotar(limite, 'admin')
+    for i in range(1000):
+        limite.consumir(f'inventado_{i}', '10.0.0.1')
+    assert limite.consumir('admin') > 0
+
+
+def test_se_desaloja_un_balde_ya_rellenado(monkeypatch):
+    ahora = [1000.0]
+    monkeypatch.setattr(limitador.time, 'monotonic', lambda: ahora[0])
+    limite = Limitador(tasa=1, rafaga=2, claves_max=2)
+    limite.consumir('a')
+    limite.consumir('b')
+    ahora[0] += 10
+    assert limite.consumir('c') == 0
+    assert limite.estadisticas()['desalojadas'] == 1
+    assert limite.estadisticas()['claves'] == 2
+
+
+def test_sin_lugar_las_claves_nuevas_se_cobran_en_el_balde_grueso():
+    limite = Limitador(tasa=0.001, rafaga=2, claves_max=2)
+    limite.desborde_max = 4
+    _agotar(limite, 'a')
+    _agotar(limite, 'b')
+    # Todas las claves nuevas de la misma IP comparten un balde
+    assert limite.consumir('x1', '10.0.0.1') == 0
+    assert limite.consumir('x2', '10.0.0.1') == 0
+    assert limite.consumir('x3', '10.0.0.1') > 0
+    # Otra IP tiene su propio balde grueso
+    assert limite.consumir('x4', '10.0.0.2') == 0
+    assert limite.estadisticas()['desbordadas'] == 4
+
+
+def test_sin_lugar_ni_para_el_balde_grueso_se_rechaza():
+    limite = Limitador(tasa=0.001, rafaga=1, claves_max=1)
+    _agotar(limite, 'a')
+    _agotar(limite, 'b', '10.0.0.1')
+    assert limite.consumir('c', '10.0.0.2') > 0
+
+
+def test_red_de_la_ip():
+    assert limitador._red('192.168.1.77') == '192.168.1.0/24'
+    assert limitador._red('2001:db8:1:2::5') == '2001:db8:1::/48'
+    assert limitador._red('no-es-una-ip') == '*'
@@ -0,0 +1,22 @@
+import mantenimiento
+
+
+def test_el_informe_se_lee_de_la_base_como_mucho_una_vez_por_plazo(app, monkeypatch):
+    lecturas = []
+    leer = mantenimiento._leer_informe
+
+    def leer_contando():
+        lecturas.append(1)
+        return leer()
+
+    monkeypatch.setattr(mantenimiento, '_leer_informe', leer_contando)
+    monkeypatch.setattr(mantenimiento, 'informe_reciente', mantenimiento._InformeReciente(ttl=60))
+    for _ in range(5):
+        mantenimiento.estadisticas()
+    assert len(lecturas) == 1
+
+    # Al terminar un trabajo en este proceso el resultado se ve en seguida
+    programador = mantenimiento.Programador(trabajos=[mantenimiento.Trabajo('checkpoint', 60, mantenimiento.checkpoint)])
+    programador.ejecutar('checkpoint')
+    assert 'checkpoint' in mantenimiento.estadisticas()['trabajos']
+    assert len(lecturas) == 2
@@ -0,0 +1,68 @@
+import os
+import shutil
+import sqlite3
+
+import migraciones
+
+BASE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'usuarios.db')
+
+
+def _conectar(ruta):
+    conn = sqlite3.connect(ruta, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def test_migraciones_sobre_la_base_original(tmp_path):
+    ruta = str(tmp_path / 'usuarios.db')
+    shutil.copy(BASE, ruta)
+    conn = _conectar(ruta)
+    usuarios = conn.execute('SELECT id, usuario, contraseña FROM usuarios ORDER BY id').fetchall()
+    assert migraciones.version_actual(conn) == 0
+
+    aplicadas = migraciones.aplicar(conn)
+    assert [version for version, _ in aplicadas] == list(range(1, migraciones.VERSION_ESQUEMA + 1))
+    assert migraciones.version_actual(conn) == migraciones.VERSION_ESQUEMA == 11
+
+    tablas = {fila[0] for fila in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    assert {'usuarios', 'tareas', 'sesiones', 'tareas_fts', 'resumen_tareas', 'eventos',
+            'configuracion', 'secuencias', 'mantenimiento'} <= tablas
+    assert conn.execute('PRAGMA integrity_check').fetchone()[0] == 'ok'
+    assert conn.execute('SELECT id, usuario, contraseña FROM usuarios ORDER BY id').fetchall() == usuarios
+
+    # Los triggers quedan activos: una tarea nueva entra al índice y sube la versión
+    conn.execute("INSERT INTO tareas (usuario_id, titulo) VALUES (1, 'comprar pan')")
+    assert conn.execute("SELECT count(*) FROM tareas_fts WHERE tareas_fts MATCH 'pan'").fetchone()[0] == 1
+    assert conn.execute('SELECT version FROM resumen_tareas WHERE usuario_id = 1').fetchone()[0] == 1
+
+    assert migraciones.aplicar(conn) == []
+    conn.close()
+
+
+def test_migraciones_retoman_desde_la_version_guardada(tmp_path):
+    ruta = str(tmp_path / 'usuarios.db')
+    shutil.copy(BASE, ruta)
+    conn = _conectar(ruta)
+    for version, _, sentencias in migraciones.MIGRACIONES[:4]:
+        for sentencia in sentencias:
+            conn.execute(sentencia)
+        conn.execute(f'PRAGMA user_version = {version}')
+
+    aplicadas = migraciones.aplicar(conn)
+    assert [version for version, _ in aplicadas] == list(range(5, migraciones.VERSION_ESQUEMA + 1))
+    conn.close()
+
+
+def test_creadas_semana_no_se_corta_en_año_nuevo(tmp_path):
+    conn = _conectar(str(tmp_path / 'usuarios.db'))
+    migraciones.aplicar(conn)
+    # Lunes 29/12/2025 a domingo 04/01/2026 es una sola semana ISO
+    for fecha in ('2025-12-28 23:00:00', '2025-12-29 10:00:00', '2025-12-31 12:00:00',
+                  '2026-01-01 09:00:00', '2026-01-04 22:00:00'):
+        conn.execute("INSERT INTO tareas (usuario_id, titulo, fecha_creacion) VALUES (1, 't', ?)", (fecha,))
+    semana, creadas = conn.execute('SELECT semana, creadas_semana FROM resumen_tareas WHERE usuario_id = 1').fetchone()
+    assert (semana, creadas) == ('2026-01-01', 4)
+
+    conn.execute("DELETE FROM tareas WHERE fecha_creacion = '2025-12-31 12:00:00'")
+    assert conn.execute('SELECT creadas_semana FROM resumen_tareas WHERE usuario_id = 1').fetchone()[0] == 3
+    conn.close()
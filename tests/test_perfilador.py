@@ -0,0 +1,27 @@
+import threading
+
+from perfilador import Muestreador
+
+
+def test_una_peticion_terminada_no_recibe_mas_muestras():
+    muestreador = Muestreador(intervalo_ms=60_000)  # las muestras se toman a mano
+    ident = threading.get_ident()
+    pilas = muestreador.agregar(ident)
+    muestreador._tomar_muestra()
+    assert sum(pilas.values()) == 1
+
+    # La petición termina mientras el muestreador lee las pilas de su hilo
+    pila_original = muestreador._pila
+    finales = {}
+
+    def pila_y_terminar(marco):
+        finales['pilas'] = muestreador.quitar(ident)
+        return pila_original(marco)
+
+    muestreador._pila = pila_y_terminar
+    muestreador._tomar_muestra()
+    assert finales['pilas'] is not pilas
+    assert sum(finales['pilas'].values()) == 1
+    assert sum(pilas.values()) == 1
+    assert muestreador.muestras == 1
+    assert muestreador.quitar(ident) is None
@@ -0,0 +1,120 @@
+import itertools
+import json
+import os
+import signal
+import socket
+import sqlite3
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+import hashing
+import migraciones
+from produccion import ContadorPeticiones
+
+
+def _app_en_trozos(environ, start_response):
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    return iter([b'uno', b'dos'])
+
+
+def test_la_peticion_sigue_en_curso_hasta_cerrar_el_cuerpo():
+    reciclar = []
+    contador = ContadorPeticiones(_app_en_trozos, 1, lambda: reciclar.append(True))
+    cuerpo = contador({}, lambda *args: None)
+    assert contador.en_curso == 1
+    assert list(cuerpo) == [b'uno', b'dos']
+    assert contador.en_curso == 1 and not reciclar
+    cuerpo.close()
+    assert contador.en_curso == 0
+    assert reciclar == [True]
+
+
+def test_un_error_de_la_app_no_deja_la_peticion_en_curso():
+    def falla(environ, start_response):
+        raise RuntimeError('falla')
+
+    contador = ContadorPeticiones(falla, 0, None)
+    try:
+        contador({}, lambda *args: None)
+    except RuntimeError:
+        pass
+    assert contador.en_curso == 0
+
+
+def test_los_procesos_de_hash_se_reparten_entre_workers(monkeypatch):
+    monkeypatch.delenv('HASH_PROCESOS', raising=False)
+    monkeypatch.setattr(hashing.os, 'cpu_count', lambda: 8)
+    monkeypatch.setattr(hashing.servicio_hash, 'procesos', 8)
+    assert hashing.repartir_procesos(4) == 2
+    monkeypatch.setattr(hashing.servicio_hash, 'procesos', 8)
+    assert hashing.repartir_procesos(16) == 1
+
+
+def test_hash_procesos_explicito_no_se_reparte(monkeypatch):
+    monkeypatch.setenv('HASH_PROCESOS', '3')
+    monkeypatch.setattr(hashing.servicio_hash, 'procesos', 3)
+    assert hashing.repartir_procesos(4) == 3
+
+
+def _registrar(puerto, usuario):
+    peticion = urllib.request.Request(
+        f'http://127.0.0.1:{puerto}/registro', method='POST',
+        data=json.dumps({'usuario': usuario, 'contraseña': 'secreta'}).encode(),
+        headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(peticion, timeout=10) as respuesta:
+        return respuesta.status
+
+
+def _metodo_guardado(ruta, usuario):
+    with sqlite3.connect(ruta) as conn:
+        fila = conn.execute('SELECT contraseña FROM usuarios WHERE usuario = ?', (usuario,)).fetchone()
+    return fila[0].split('$', 1)[0] if fila else None
+
+
+def test_sighup_hace_que_los_workers_nuevos_usen_la_politica_guardada(tmp_path):
+    ruta = str(tmp_path / 'usuarios.db')
+    with sqlite3.connect(ruta, isolation_level=None) as conn:
+        migraciones.aplicar(conn)
+        conn.execute("INSERT INTO configuracion (clave, valor) VALUES ('hash_metodo', 'pbkdf2:sha256:1000')")
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        puerto = s.getsockname()[1]
+    entorno = {k: v for k, v in os.environ.items() if k != 'HASH_METODO'}
+    entorno['DB_PATH'] = ruta
+    raiz = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    maestro = subprocess.Popen(
+        [sys.executable, 'produccion.py', '--workers', '1', '--host', '127.0.0.1', '--port', str(puerto),
+         '--max-peticiones', '0'], cwd=raiz, env=entorno, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        fin = time.monotonic() + 30
+        while True:
+            try:
+                assert _registrar(puerto, 'antes') == 201
+                break
+            except (urllib.error.URLError, ConnectionError):
+                assert time.monotonic() < fin, 'el servidor no arrancó'
+                time.sleep(0.2)
+        assert _metodo_guardado(ruta, 'antes') == 'pbkdf2:sha256:1000'
+
+        with sqlite3.connect(ruta) as conn:
+            conn.execute("UPDATE configuracion SET valor = 'pbkdf2:sha256:2000' WHERE clave = 'hash_metodo'")
+        maestro.send_signal(signal.SIGHUP)
+
+        # El worker viejo atiende hasta que el nuevo está listo; se registra hasta llegar al nuevo
+        fin = time.monotonic() + 30
+        for intento in itertools.count():
+            usuario = f'despues{intento}'
+            try:
+                _registrar(puerto, usuario)
+            except (urllib.error.URLError, ConnectionError):
+                pass
+            if _metodo_guardado(ruta, usuario) == 'pbkdf2:sha256:2000':
+                break
+            assert time.monotonic() < fin, 'ningún worker tomó la política nueva'
+            time.sleep(0.2)
+    finally:
+        maestro.terminate()
+        maestro.wait(timeout=60)
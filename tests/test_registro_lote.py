@@ -0,0 +1,38 @@
+import pytest
+
+import servidor
+
+
+@pytest.fixture
+def clave(monkeypatch):
+    monkeypatch.setattr(servidor, 'LOTE_CLAVE', 'secreto')
+    return {'Authorization': 'Bearer secreto'}
+
+
+def test_sin_clave_configurada_esta_deshabilitado(cliente, monkeypatch):
+    monkeypatch.setattr(servidor, 'LOTE_CLAVE', '')
+    respuesta = cliente.post('/registro/lote', json=[{'usuario': 'lote_a', 'contraseña': 'x'}])
+    assert respuesta.status_code == 403
+
+
+def test_clave_incorrecta(cliente, clave):
+    for cabeceras in ({}, {'Authorization': 'Bearer otra'}, {'Authorization': 'secreto'}):
+        respuesta = cliente.post('/registro/lote', json=[{'usuario': 'lote_a', 'contraseña': 'x'}],
+                                 headers=cabeceras)
+        assert respuesta.status_code == 401
+
+
+def test_lote_con_clave(cliente, clave):
+    filas = [{'usuario': 'lote_b', 'contraseña': 'x'}, {'usuario': 'lote_b', 'contraseña': 'y'},
+             {'usuario': '', 'contraseña': 'x'}]
+    respuesta = cliente.post('/registro/lote', json=filas, headers=clave)
+    assert respuesta.status_code == 200
+    datos = respuesta.get_json()
+    assert (datos['creados'], datos['duplicados'], datos['invalidos']) == (1, 1, 1)
+
+
+def test_lote_cuenta_para_el_limite_por_ip(cliente, clave, monkeypatch):
+    llamadas = []
+    monkeypatch.setattr(servidor, 'admitir', lambda ip, usuario=None: llamadas.append(ip))
+    cliente.post('/registro/lote', json=[], headers=clave)
+    assert llamadas == ['127.0.0.1']
@@ -0,0 +1,18 @@
+from sesiones import AlmacenSesiones, InterfazSesionServidor
+
+
+def test_una_sesion_revocada_en_otro_worker_no_sirve_para_escribir(app):
+    # Dos almacenes con su propia caché sobre la misma tabla: dos workers
+    este, otro = AlmacenSesiones(cache_ttl=60), AlmacenSesiones(cache_ttl=60)
+    interfaz = InterfazSesionServidor(este)
+    sid = este.nuevo_id()
+    este.guardar(sid, {'usuario_id': 1})
+    assert interfaz.cargar(sid, 'GET').get('usuario_id') == 1
+
+    otro.revocar(sid)  # /logout atendido por el otro worker
+
+    # Las lecturas pueden usar la caché hasta SESION_CACHE_TTL; las escrituras no
+    assert interfaz.cargar(sid, 'GET').get('usuario_id') == 1
+    for metodo in ('POST', 'PUT', 'PATCH', 'DELETE'):
+        assert not interfaz.cargar(sid, metodo)
+    assert not interfaz.cargar(sid, 'GET')  # la revalidación también limpió la caché
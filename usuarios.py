@@ -0,0 +1,81 @@
+import sqlite3
+from base_datos import conexion
+from cola_escritura import escribir, EscrituraSaturada
+from hashing import servicio_hash, necesita_rehash, ServicioSaturado
+from indice_usuarios import indice
+
+
+class DatosInvalidos(ValueError):
+    """El cuerpo de la petición no trae usuario y contraseña válidos"""
+
+
+class UsuarioExistente(Exception):
+    """El nombre de usuario ya está registrado"""
+
+
+def leer_credenciales(data, validar_vacios=False):
+    """Extrae (usuario, contraseña) del JSON recibido o lanza DatosInvalidos"""
+    if not data or 'usuario' not in data or 'contraseña' not in data:
+        raise DatosInvalidos('Datos incompletos. Se requiere usuario y contraseña')
+    usuario = data['usuario']
+    contraseña = data['contraseña']
+    if validar_vacios and (not usuario.strip() or not contraseña.strip()):
+        raise DatosInvalidos('Usuario y contraseña no pueden estar vacíos')
+    return usuario, contraseña
+
+
+def registrar(usuario, contraseña):
+    # Un nombre que según el índice puede estar ocupado se verifica antes de gastar un hash
+    if indice and indice.puede_existir(usuario):
+        if indice.buscar(usuario) is not None:
+            raise UsuarioExistente(usuario)
+        indice.anotar_falso_positivo()
+
+    # Hash de la contraseña (en el pool de procesos, fuera del hilo de la petición)
+    contraseña_hash = servicio_hash.generar(contraseña)
+
+    # Guardar en la base de datos (autocommit o commit agrupado, ver cola_escritura.py)
+    try:
+        escribir('INSERT INTO usuarios (usuario, contraseña) VALUES (?, ?)', (usuario, contraseña_hash))
+    except sqlite3.IntegrityError:
+        raise UsuarioExistente(usuario)
+    if indice:
+        indice.agregar([usuario])
+
+
+def _buscar(usuario):
+    """(id, usuario, hash) del nombre o None (desde la caché del índice si está activo)"""
+    if indice:
+        return indice.buscar(usuario)
+    with conexion() as conn:
+        return conn.execute('SELECT id, usuario, contraseña FROM usuarios WHERE usuario = ?', (usuario,)).fetchone()
+
+
+def autenticar(usuario, contraseña):
+    """Devuelve (id, usuario) si las credenciales son correctas, None si no"""
+    user_data = _buscar(usuario)
+    if not (user_data and servicio_hash.verificar(user_data[2], contraseña)):
+        return None
+    if necesita_rehash(user_data[2]):
+        _rehashear(user_data[0], user_data[1], user_data[2], contraseña)
+    return user_data[0], user_data[1]
+
+
+def _rehashear(usuario_id, usuario, anterior, contraseña):
+    """Vuelve a guardar la contraseña con la política actual (solo se conoce en un login correcto)"""
+    try:
+        nuevo = servicio_hash.generar(contraseña)
+        # Si la contraseña cambió mientras tanto no se pisa
+        _, cambiadas = escribir('UPDATE usuarios SET contraseña = ? WHERE id = ? AND contraseña = ?',
+                                (nuevo, usuario_id, anterior))
+    except (ServicioSaturado, EscrituraSaturada):
+        # El login ya es válido: con el servicio saturado se deja para el próximo
+        servicio_hash.anotar_rehash(False)
+        return
+    if indice:
+        # La fila en caché sigue a la contraseña guardada; si otro proceso la cambió, se vuelve a leer
+        if cambiadas:
+            indice.actualizar_hash(usuario_id, usuario, nuevo)
+        else:
+            indice.invalidar(usuario)
+    servicio_hash.anotar_rehash(True)